@@ -0,0 +1,199 @@
+import time
+import heapq
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from metrics import Metrics
+
+
+# Políticas de descarte quando a LLM não acompanha a chegada de fluxos
+DROP_OLDEST = "drop_oldest"          # fila cheia: sai o fluxo mais antigo entre os de menor prioridade
+SAMPLE_BENIGN = "sample_benign"      # acima de `high_water`, só uma amostra dos fluxos de prioridade 0 entra
+DEFAULT_VERDICT = "default_verdict"  # como drop_oldest, mas os descartados recebem o veredito de fallback
+POLICIES = (DROP_OLDEST, SAMPLE_BENIGN, DEFAULT_VERDICT)
+
+DEFAULT_SENSITIVE_PORTS = (21, 22, 23, 25, 445, 3306, 3389, 6667)
+
+
+class AdmissionQueue:
+    """Fila de trabalho limitada e ordenada por prioridade entre a geração de fluxos e o analisador.
+
+    offer() nunca bloqueia o produtor: com a fila cheia, é descartado o fluxo mais
+    antigo entre os de menor prioridade, ou o próprio fluxo oferecido se sua
+    prioridade for menor que a de todos os enfileirados. A prioridade vem de sinais baratos: origem já bloqueada (mark_bad()),
+    volume alto (`high_packet_count` pacotes, ou `high_source_flows` fluxos da origem
+    em "source_stats") e porta de destino em `sensitive_ports`.
+
+    Cada fluxo tem prazo de `max_wait` segundos na fila; get() descarta os vencidos.
+    Os fluxos descartados são entregues a `on_shed(fluxo, motivo)`, com motivo "full",
+    "sampled" ou "expired". A fila é usada apenas de dentro do laço asyncio.
+
+    O sinal de volume da origem só existe se o fluxo já chegar com "source_stats" em
+    offer(): o Controller anota os fluxos com os sketches antes de oferecê-los. Uma
+    mesma instância serve a várias execuções do pipeline: reopen() desfaz o close()
+    anterior (os contadores de stats() são acumulados).
+    """
+
+    def __init__(self, maxsize: int = 1024, max_wait: float = 5.0, policy: str = DROP_OLDEST,
+                 sample_rate: float = 0.1, high_water: float = 0.5, sensitive_ports: tuple = DEFAULT_SENSITIVE_PORTS,
+                 high_packet_count: int = 10, high_source_flows: int = 100, max_bad_sources: int = 4096,
+                 metrics: Optional[Metrics] = None, seed: Optional[int] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Política desconhecida: {policy!r}. Válidas: {POLICIES}")
+        self.maxsize = maxsize
+        self.max_wait = max_wait
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.high_water = high_water
+        self.sensitive_ports = frozenset(sensitive_ports)
+        self.high_packet_count = high_packet_count
+        self.high_source_flows = high_source_flows
+        self.max_bad_sources = max_bad_sources
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.on_shed: Optional[Callable[[dict, str], None]] = None
+
+        # heap de (-prioridade, seq, chegada, fluxo) para o analisador e de (prioridade, seq, entrada)
+        # para achar a vítima do descarte; o seq de uma entrada retirada de um heap fica em
+        # _removed até a cópia no outro heap ser alcançada
+        self._heap: list = []
+        self._victims: list = []
+        self._removed: set = set()
+        self._seq = 0
+        self._size = 0
+        self._closed = False
+        self._not_empty = asyncio.Event()
+        self._bad_sources: OrderedDict = OrderedDict()
+        self._rng = random.Random(seed)
+
+        self.offered = 0
+        self.admitted = 0
+        self.shed = {"full": 0, "sampled": 0, "expired": 0}
+        self.by_priority: dict = {}
+
+    def reopen(self) -> None:
+        """Prepara a fila para um novo pipeline, no laço asyncio em execução."""
+        self._closed = False
+        self._not_empty = asyncio.Event()
+        if self._size:
+            self._not_empty.set()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def mark_bad(self, src_ip: str) -> None:
+        """Registra uma origem com veredito "drop": seus próximos fluxos passam à frente."""
+        self._bad_sources[src_ip] = None
+        self._bad_sources.move_to_end(src_ip)
+        if len(self._bad_sources) > self.max_bad_sources:
+            self._bad_sources.popitem(last=False)
+
+    def priority(self, flow_data: dict) -> int:
+        """0 = nenhum sinal; cada sinal soma: origem bloqueada 4, volume alto 2, porta sensível 1."""
+        priority = 0
+        if flow_data.get("src_ip") in self._bad_sources:
+            priority += 4
+        source_flows = (flow_data.get("source_stats") or {}).get("flows", 0)
+        if flow_data.get("packet_count", 0) >= self.high_packet_count or source_flows >= self.high_source_flows:
+            priority += 2
+        if flow_data.get("dst_port") in self.sensitive_ports:
+            priority += 1
+        return priority
+
+    def _shed(self, flow_data: dict, reason: str) -> None:
+        self.shed[reason] += 1
+        self.metrics.inc("admission_shed_total", reason=reason)
+        if self.on_shed is not None:
+            self.on_shed(flow_data, reason)
+
+    def _push(self, flow_data: dict, priority: int) -> None:
+        self._seq += 1
+        entry = (-priority, self._seq, time.monotonic(), flow_data)
+        heapq.heappush(self._heap, entry)
+        heapq.heappush(self._victims, (priority, self._seq, entry))
+        self._size += 1
+        self._not_empty.set()
+
+    def _lowest(self) -> tuple:
+        """(prioridade, seq, entrada) do próximo fluxo a ser descartado."""
+        while self._victims[0][1] in self._removed:
+            self._removed.discard(heapq.heappop(self._victims)[1])
+        return self._victims[0]
+
+    def _compact(self) -> None:
+        # entradas já retiradas por um heap continuam no outro até serem alcançadas
+        if len(self._heap) + len(self._victims) <= 4 * self._size + 64:
+            return
+        self._heap = [entry for entry in self._heap if entry[1] not in self._removed]
+        heapq.heapify(self._heap)
+        self._victims = [(-entry[0], entry[1], entry) for entry in self._heap]
+        heapq.heapify(self._victims)
+        self._removed.clear()
+
+    def offer(self, flow_data: dict) -> bool:
+        """Enfileira `flow_data` ou o descarta pela política; retorna se ele foi admitido."""
+        self.offered += 1
+        priority = self.priority(flow_data)
+        if (self.policy == SAMPLE_BENIGN and priority == 0 and self._size >= self.maxsize * self.high_water
+                and self._rng.random() >= self.sample_rate):
+            self._shed(flow_data, "sampled")
+            return False
+        if self._size >= self.maxsize:
+            lowest_priority, seq, entry = self._lowest()
+            if priority < lowest_priority:
+                self._shed(flow_data, "full")
+                return False
+            heapq.heappop(self._victims)
+            self._removed.add(seq)
+            self._size -= 1
+            self._shed(entry[3], "full")
+        self._push(flow_data, priority)
+        self._compact()
+        self.admitted += 1
+        self.by_priority[priority] = self.by_priority.get(priority, 0) + 1
+        return True
+
+    def close(self) -> None:
+        """Indica o fim dos fluxos: get() retorna None quando a fila esvaziar."""
+        self._closed = True
+        self._not_empty.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Retorna o fluxo de maior prioridade dentro do prazo, ou None após close().
+
+        Com `timeout`, levanta asyncio.TimeoutError se nenhum fluxo chegar a tempo.
+        """
+        while True:
+            while self._size == 0:
+                if self._closed:
+                    return None
+                self._not_empty.clear()
+                if timeout is None:
+                    await self._not_empty.wait()
+                else:
+                    await asyncio.wait_for(self._not_empty.wait(), timeout)
+            _, seq, enqueued_at, flow_data = heapq.heappop(self._heap)
+            if seq in self._removed:
+                self._removed.discard(seq)
+                continue
+            self._removed.add(seq)
+            self._size -= 1
+            waited = time.monotonic() - enqueued_at
+            if waited > self.max_wait:
+                self._shed(flow_data, "expired")
+                continue
+            self.metrics.observe("queue_wait", waited)
+            return flow_data
+
+    def stats(self) -> dict:
+        shed = sum(self.shed.values())
+        return {
+            "policy": self.policy,
+            "offered": self.offered,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "shed_rate": shed / self.offered if self.offered else 0.0,
+            "admitted_by_priority": dict(sorted(self.by_priority.items())),
+            "queued": self._size,
+        }
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Replay e benchmark do Controller contra um servidor LLM local (stub).
+
+Reproduz os fluxos de test_flows.json (ou um corpus gerado) pelo pipeline assíncrono
+do Controller, a uma taxa fixa de chegada (open-loop) ou o mais rápido possível, e
+grava um relatório JSON com vazão, latências por estágio (p50/p95/p99) e
+precisão/recall contra os rótulos.
+
+Exemplos:
+  python3 src/benchmark.py --flows 200 --concurrency 8 --latency-ms 300
+  python3 src/benchmark.py --corpus generated --flows 1000 --rate 50 --batch-size 8 --output bench.json
+  python3 src/benchmark.py --corpus pcap --pcap captura.pcapng --flows 5000 --prefilter
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from itertools import cycle, islice
+from typing import Iterator, Optional
+
+import numpy as np
+
+from controller import Controller
+from mock_llm_server import MockLLMServer
+from prefilter import TEST_FLOWS_PATH, StatisticalPrefilter
+from verdict_cache import VerdictCache
+from rule_manager import AclRuleManager
+from case_memory import CaseMemory
+from sketches import SourceSketches
+from admission import POLICIES, AdmissionQueue
+from routing import ModelRouter
+from results_sink import FORMATS, ResultsReader, ResultsSink
+from pcap_reader import pcap_flows
+from providers import ResilientProvider, create_provider, stream_connections
+from metrics import Metrics
+from traffic_generator import TrafficGenerator, expected_response, parse_mix, records_to_flows
+
+
+class BenchmarkController(Controller):
+    """Controller que mede a duração dos estágios de análise."""
+
+    def __init__(self, *args, **kwargs):
+        self.timings = {"detect": [], "llm_call": [], "apply": []}
+        self.priorities: dict = {}  # flow_id -> prioridade na chegada (com admission)
+        super().__init__(*args, **kwargs)
+
+    def _timed(self, stage: str, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings[stage].append(time.perf_counter() - start)
+
+    def detect_anomalies(self, flows: list) -> list:
+        return self._timed("detect", super().detect_anomalies, flows)
+
+    def call_llm(self, messages: list) -> Optional[str]:
+        return self._timed("llm_call", super().call_llm, messages)
+
+    def apply_llm_verdict(self, llm_response: dict) -> str:
+        return self._timed("apply", super().apply_llm_verdict, llm_response)
+
+    def admit(self, flow_data: dict) -> bool:
+        # prioridade na chegada, com o source_stats que a fila de admissão vê
+        self._annotate_sources([flow_data])
+        self.priorities[flow_data["flow_id"]] = self.admission.priority(flow_data)
+        return super().admit(flow_data)
+
+
+def load_corpus(corpus: str, n_flows: int, seed: int, mix: Optional[dict] = None,
+                pcap_paths: Optional[list] = None) -> tuple:
+    """Retorna (fluxos, rótulos por flow_id), onde o rótulo é True para "drop".
+
+    Os fluxos de capturas (corpus "pcap") não têm rótulo.
+    """
+    flows = []
+    labels = {}
+    if corpus == "test_flows":
+        with open(TEST_FLOWS_PATH, encoding="utf8") as file:
+            cases = json.load(file)
+        for flow_id, case in zip(range(1, n_flows + 1), cycle(cases)):
+            flow_data = {k: v for k, v in case["flow_data"].items() if not k.startswith("__")}
+            flow_data["flow_id"] = flow_id
+            flows.append(flow_data)
+            labels[flow_id] = case["expected_llm_response"].get("action") == "drop"
+    elif corpus == "pcap":
+        flows = list(islice(pcap_flows(pcap_paths), n_flows))
+    else:
+        records = TrafficGenerator(seed=seed, mix=mix).generate(n_flows)
+        flows = list(records_to_flows(records))
+        for record in records:
+            labels[int(record["flow_id"])] = expected_response(record)["action"] == "drop"
+    return flows, labels
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(samples), "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+            "mean_ms": float(values.mean())}
+
+
+def detection_metrics(labels: dict, verdicts: dict) -> dict:
+    tp = fp = fn = tn = 0
+    for flow_id, expected_drop in labels.items():
+        predicted_drop = verdicts.get(flow_id, {}).get("action") == "drop"
+        if predicted_drop and expected_drop:
+            tp += 1
+        elif predicted_drop:
+            fp += 1
+        elif expected_drop:
+            fn += 1
+        else:
+            tn += 1
+    return {"tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "precision": tp / (tp + fp) if tp + fp else None,
+            "recall": tp / (tp + fn) if tp + fn else None}
+
+
+def run_benchmark(args) -> dict:
+    flows, labels = load_corpus(args.corpus, args.flows, args.seed, parse_mix(args.mix) if args.mix else None,
+                                args.pcap)
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+
+    arrivals = {}
+    completions = {}
+    verdicts = {}
+    start = [0.0]
+    admission = None
+
+    def source() -> Iterator[dict]:
+        start[0] = time.perf_counter()
+        for i, flow_data in enumerate(flows):
+            # latência medida a partir da chegada agendada: inclui o tempo bloqueado pela fila
+            arrivals[flow_data["flow_id"]] = start[0] + i * interval if interval else time.perf_counter()
+            yield flow_data
+
+    def on_verdict(flow_data: dict, verdict: dict) -> None:
+        completions[flow_data["flow_id"]] = time.perf_counter()
+        verdicts[flow_data["flow_id"]] = verdict
+
+    with MockLLMServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed,
+                       token_ms=args.token_ms, failure_rate=args.failure_rate,
+                       failure_models={args.model},
+                       model_latency_ms={args.escalation_model: args.escalation_latency_ms} if args.escalation_model else None,
+                       model_error_rates={args.model: args.model_error_rate}) as server:
+        base_url = server.openai_base_url if args.provider == "openai" else server.ollama_host
+        metrics = Metrics()
+        models = [args.model] + ([args.fallback_model] if args.fallback_model else [])
+        connections = stream_connections(args.concurrency, args.stream)
+        llm = ResilientProvider([create_provider(args.provider, model=model, api_key="stub", base_url=base_url,
+                                                 timeout=args.timeout, max_connections=connections)
+                                 for model in models],
+                                retries=args.retries, metrics=metrics)
+        if args.escalation_model:
+            large = ResilientProvider([create_provider(args.provider, model=args.escalation_model, api_key="stub",
+                                                       base_url=base_url, timeout=args.timeout,
+                                                       max_connections=connections)],
+                                      retries=args.retries, metrics=metrics)
+            llm = ModelRouter(llm, large, confidence_threshold=args.confidence_threshold, small_cost=args.small_cost,
+                              large_cost=args.large_cost, metrics=metrics)
+        if args.admission:
+            admission = AdmissionQueue(maxsize=args.queue_size, max_wait=args.max_wait, policy=args.admission,
+                                       metrics=metrics, seed=args.seed)
+        results_sink = None
+        if args.results:
+            results_dir = args.results_dir or tempfile.mkdtemp(prefix="results-")
+            results_sink = ResultsSink(results_dir, format=args.results, metrics=metrics)
+        # nullcontext: com --verbose o sys.stdout não pode ser fechado ao sair do bloco
+        output = open(os.devnull, "w") if args.quiet else contextlib.nullcontext(sys.stdout)
+        with output as stdout, contextlib.redirect_stdout(stdout):
+            ctrl = BenchmarkController(
+                llm=llm, metrics=metrics,
+                verdict_cache=VerdictCache() if args.cache else None,
+                prefilter=StatisticalPrefilter() if args.prefilter else None,
+                rule_manager=AclRuleManager() if args.rule_manager else None,
+                case_memory=CaseMemory() if args.case_memory else None,
+                stream=args.stream,
+                sketches=SourceSketches() if args.sketches else None,
+                admission=admission,
+                results_sink=results_sink,
+                console_sample=0.0 if args.quiet else 1.0,
+            )
+            ctrl.run_async_controller(concurrency=args.concurrency, flow_interval=interval,
+                                      batch_size=args.batch_size, batch_window_ms=args.batch_window_ms,
+                                      flow_source=source(), on_verdict=on_verdict)
+        elapsed = time.perf_counter() - start[0]
+        llm_requests = server.requests
+        llm_failures = server.failures
+
+    # fluxos descartados pela admissão não entram nas latências
+    analyzed = [flow_id for flow_id in completions if "shed" not in verdicts[flow_id]]
+    end_to_end = [completions[flow_id] - arrivals[flow_id] for flow_id in analyzed]
+    by_priority = {}
+    for flow_id in analyzed:
+        if flow_id in ctrl.priorities:
+            by_priority.setdefault(ctrl.priorities[flow_id], []).append(completions[flow_id] - arrivals[flow_id])
+    return {
+        "config": vars(args),
+        "flows": len(completions),
+        "duration_s": elapsed,
+        "flows_per_s": len(completions) / elapsed if elapsed else None,
+        "llm_requests": llm_requests,
+        "llm_failures": llm_failures,
+        "providers": llm.stats(),
+        "latency": {
+            "end_to_end": percentiles(end_to_end),
+            "end_to_end_by_priority": {level: percentiles(samples) for level, samples in sorted(by_priority.items())},
+            "detect": percentiles(ctrl.timings["detect"]),
+            "llm_call": percentiles(ctrl.timings["llm_call"]),
+            "apply": percentiles(ctrl.timings["apply"]),
+        },
+        "detection": detection_metrics(labels, verdicts),
+        "rules": ctrl.rule_manager.stats() if ctrl.rule_manager is not None else None,
+        "admission": admission.stats() if admission is not None else None,
+        "case_memory": ctrl.case_memory.stats() if ctrl.case_memory is not None else None,
+        "sketches": ctrl.sketches.stats() if ctrl.sketches is not None else None,
+        "results": dict(results_sink.stats(), directory=results_sink.directory,
+                        summary=ResultsReader(results_sink.directory).summary()) if results_sink is not None else None,
+        "metrics": ctrl.metrics.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark/replay do Controller com LLM local (stub)")
+    parser.add_argument('--corpus', choices=['test_flows', 'generated', 'pcap'], default='test_flows', help='Origem dos fluxos')
+    parser.add_argument('--pcap', nargs='+', default=None, help='Capturas pcap/pcapng do corpus "pcap" (sem rótulos)')
+    parser.add_argument('--flows', type=int, default=200, help='Número de fluxos a reproduzir')
+    parser.add_argument('--mix', type=str, default=None, help='Mistura de cenários do corpus gerado (ver traffic_generator.py)')
+    parser.add_argument('--rate', type=float, default=0.0, help='Taxa de chegada (fluxos/s); 0 = o mais rápido possível')
+    parser.add_argument('--provider', choices=['openai', 'ollama'], default='openai', help='API usada contra o stub')
+    parser.add_argument('--model', type=str, default='stub', help='Nome do modelo enviado ao stub')
+    parser.add_argument('--concurrency', type=int, default=4, help='Chamadas simultâneas à LLM')
+    parser.add_argument('--batch-size', type=int, default=1, help='Fluxos por prompt')
+    parser.add_argument('--batch-window-ms', type=float, default=50.0, help='Janela de formação de lote (ms)')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Latência média do stub (ms)')
+    parser.add_argument('--jitter-ms', type=float, default=50.0, help='Variação da latência do stub (± ms)')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='Tempo de geração de cada pedaço da resposta do stub (ms)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fração dos pedidos ao modelo principal que falham (HTTP 503)')
+    parser.add_argument('--fallback-model', type=str, default=None, help='Segundo modelo do stub, usado no failover')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Timeout de cada chamada (s)')
+    parser.add_argument('--retries', type=int, default=2, help='Novas tentativas por backend')
+    parser.add_argument('--model-error-rate', type=float, default=0.0, help='Fração de vereditos errados do modelo principal')
+    parser.add_argument('--escalation-model', type=str, default=None, help='Modelo grande do stub: ativa o ModelRouter')
+    parser.add_argument('--escalation-latency-ms', type=float, default=800.0, help='Latência média do modelo grande (ms)')
+    parser.add_argument('--confidence-threshold', type=float, default=0.8, help='Confiança mínima para não escalonar')
+    parser.add_argument('--small-cost', type=float, default=0.0001, help='Custo por 1k tokens do modelo pequeno')
+    parser.add_argument('--large-cost', type=float, default=0.002, help='Custo por 1k tokens do modelo grande')
+    parser.add_argument('--stream', action='store_true', help='Decide cada fluxo pela resposta em streaming')
+    parser.add_argument('--cache', action='store_true', help='Ativa o VerdictCache')
+    parser.add_argument('--prefilter', action='store_true', help='Ativa o StatisticalPrefilter')
+    parser.add_argument('--rule-manager', action='store_true', help='Ativa o AclRuleManager')
+    parser.add_argument('--case-memory', action='store_true', help='Ativa a CaseMemory (em memória)')
+    parser.add_argument('--sketches', action='store_true', help='Anota os fluxos com source_stats (SourceSketches)')
+    parser.add_argument('--admission', choices=POLICIES, default=None, help='Ativa a AdmissionQueue com a política de descarte')
+    parser.add_argument('--queue-size', type=int, default=256, help='Capacidade da AdmissionQueue')
+    parser.add_argument('--max-wait', type=float, default=2.0, help='Prazo de cada fluxo na AdmissionQueue (s)')
+    parser.add_argument('--results', choices=FORMATS, default=None, help='Grava um registro por fluxo (ResultsSink) nesse formato')
+    parser.add_argument('--results-dir', type=str, default=None, help='Diretório dos registros (padrão: temporário)')
+    parser.add_argument('--seed', type=int, default=0, help='Semente para corpus gerado e jitter')
+    parser.add_argument('--output', type=str, default=None, help='Arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help='Mostra a saída do Controller')
+    args = parser.parse_args()
+    if args.corpus == "pcap" and not args.pcap:
+        parser.error("--corpus pcap exige --pcap")
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            file.write(text + "\n")
+        print(f"Relatório gravado em {args.output}: {report['flows_per_s']:.1f} fluxos/s, "
+              f"p99 = {report['latency']['end_to_end']['p99_ms']:.0f} ms")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
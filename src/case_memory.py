@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""Memória de casos de tráfego (traffic_case_memory_schema.json) com busca por similaridade.
+
+Cada veredito da LLM vira um caso no formato do esquema, gravado em `cases.jsonl`, e
+uma linha em `cases.npy` (arquivo mapeado em memória) com o vetor de características
+normalizado e os campos do fluxo. As buscas top-k usam um índice em células: fluxos
+com o mesmo protocolo, porta de destino e faixas de pacotes/bytes por pacote caem na
+mesma célula, e só os casos mais recentes de cada célula são comparados.
+
+Exemplos:
+  python3 src/case_memory.py --cases 1000000
+  python3 src/case_memory.py --cases 200000 --path /tmp/cases --lookups 5000
+"""
+
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from heuristics import SCAN_FANOUT
+from flow_aggregator import ip_to_str, str_to_ip
+
+
+# Valores de anomaly_status do esquema
+STATUSES = ("normal", "anomalo", "indeterminado")
+
+# Colunas do vetor de características, todas em [0, 1]. A porta de origem (efêmera) fica
+# de fora: dois fluxos iguais de clientes diferentes não devem parecer distintos por ela.
+FEATURES = ("log_packets", "log_bytes", "log_bytes_per_packet", "log_dst_port", "well_known_port",
+            "tcp", "udp")
+
+CASE_DTYPE = np.dtype([
+    ("vector", np.float32, (len(FEATURES),)),
+    ("timestamp", np.float64),
+    ("src_ip", np.uint32),
+    ("dst_ip", np.uint32),
+    ("src_port", np.uint16),
+    ("dst_port", np.uint16),
+    ("protocol", np.uint8),
+    ("packet_count", np.uint32),
+    ("byte_count", np.uint64),
+    ("status", np.uint8),  # índice em STATUSES
+    ("record_offset", np.uint64),  # posição do caso em cases.jsonl
+    ("record_length", np.uint32),
+])
+
+
+def case_features(flows: list) -> np.ndarray:
+    """Vetores de características normalizados (float32, um por fluxo)."""
+    columns = np.array([[f.get("packet_count", 0), f.get("byte_count", 0), f.get("dst_port", 0),
+                         f.get("protocol", 0)] for f in flows], dtype=np.float64).reshape(-1, 4)
+    packets, bytes_, dst_port, protocol = columns.T
+    vectors = np.empty((len(flows), len(FEATURES)), dtype=np.float32)
+    vectors[:, 0] = np.log2(packets + 1) / 32
+    vectors[:, 1] = np.log2(bytes_ + 1) / 64
+    vectors[:, 2] = np.log2(bytes_ / np.maximum(packets, 1) + 1) / 16
+    vectors[:, 3] = np.log2(dst_port + 1) / 16
+    vectors[:, 4] = dst_port < 1024
+    vectors[:, 5] = protocol == 6
+    vectors[:, 6] = protocol == 17
+    return vectors
+
+
+def _cell_keys(protocol: int, dst_port: int, packet_count: int, byte_count: int) -> tuple:
+    """Chaves (fina, grossa) da célula do índice; a grossa ignora a porta de destino."""
+    coarse = (protocol, int(packet_count).bit_length(), (int(byte_count) // max(int(packet_count), 1)).bit_length())
+    return (dst_port,) + coarse, coarse
+
+
+def status_for_verdict(verdict: dict) -> str:
+    action = verdict.get("action")
+    if action == "drop":
+        return "anomalo"
+    if action == "none":
+        return "normal"
+    return "indeterminado"
+
+
+def case_record(flow_data: dict, verdict: dict, reason: Optional[str], timestamp: float) -> dict:
+    """Monta um caso no formato de traffic_case_memory_schema.json.
+
+    O digest do switch não traz cabeçalho Ethernet nem metadados P4; quando o fluxo não
+    os informa, são usados os valores do pipeline simulado.
+    """
+    status = status_for_verdict(verdict)
+    return {
+        "case_id": uuid.uuid4().hex,
+        "timestamp": datetime.fromtimestamp(timestamp, timezone.utc).isoformat(),
+        "ethernet_header": flow_data.get("ethernet_header") or {
+            "dstAddr": "00:00:00:00:00:00", "srcAddr": "00:00:00:00:00:00", "etherType": "0x0800"},
+        "ipv4_header": {
+            "srcAddr": flow_data.get("src_ip"),
+            "dstAddr": flow_data.get("dst_ip"),
+            "protocol": flow_data.get("protocol"),
+            "ttl": flow_data.get("ttl", 64),
+        },
+        "p4_metadata": flow_data.get("p4_metadata") or {
+            "ingress_port": 0, "egress_port": 0, "action_name": "_drop" if status == "anomalo" else "_nop"},
+        "anomaly_status": status,
+        "anomaly_reason": reason or "",
+        "flow": {field: flow_data.get(field)
+                 for field in ("flow_id", "src_port", "dst_port", "packet_count", "byte_count")},
+    }
+
+
+class CaseMemory:
+    """Memória persistente de casos com busca dos k casos mais parecidos.
+
+    record() só enfileira o caso: uma thread grava os pendentes em lote a cada
+    `flush_interval` segundos (ou ao acumular `batch_size`), atualizando o índice.
+    Os casos ficam em `path` (diretório); com path=None, apenas em memória.
+
+    similar() compara o fluxo com até `max_per_cell` casos da sua célula (ou da célula
+    grossa, se a fina tiver menos de `k` casos). match() devolve um veredito sem chamar a
+    LLM quando ao menos `min_matches` vizinhos estão a uma distância <= `match_distance`
+    e todos têm o mesmo status; um "drop" só é repetido se todos esses casos forem do
+    mesmo IP de origem do fluxo, e um "none" não é repetido quando o "source_stats" do
+    fluxo indica varredura (`scan_fanout` destinos ou portas distintos) ou inundação
+    (`flood_flows` fluxos recentes): o vetor não vê esse contexto, a LLM sim.
+    match_distance=None desliga esse atalho.
+    """
+
+    def __init__(self, path: Optional[str] = None, k: int = 3, match_distance: Optional[float] = 0.02,
+                 min_matches: int = 2, max_per_cell: int = 256, capacity: int = 1 << 16,
+                 batch_size: int = 256, flush_interval: float = 0.5, scan_fanout: int = SCAN_FANOUT,
+                 flood_flows: int = 100):
+        self.path = path
+        self.k = k
+        self.match_distance = match_distance
+        self.min_matches = min_matches
+        self.max_per_cell = max_per_cell
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.scan_fanout = scan_fanout
+        self.flood_flows = flood_flows
+
+        self._fine: dict = {}    # célula fina -> deque de linhas
+        self._coarse: dict = {}  # célula grossa -> deque de linhas
+        self._count = 0
+        self._log_size = 0
+        self._lock = threading.Lock()        # índice e troca do array de casos
+        self._write_lock = threading.Lock()  # um lote gravado por vez
+        self._pending: list = []
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+
+        if path is None:
+            self._rows = np.zeros(capacity, dtype=CASE_DTYPE)
+            self._records: Optional[list] = []
+            self._log = None
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._records = None
+            log_path = os.path.join(path, "cases.jsonl")
+            self._log = open(log_path, "a+b")  # leitura (pread) dos casos em case()
+            self._log_size = os.path.getsize(log_path)
+            rows_path = os.path.join(path, "cases.npy")
+            if os.path.exists(rows_path):
+                self._rows = np.load(rows_path, mmap_mode="r+")
+                if self._rows.dtype != CASE_DTYPE:
+                    raise ValueError(f"{rows_path}: formato de casos incompatível (gravado por outra versão).")
+                self._count = int(np.count_nonzero(self._rows["timestamp"]))
+                self._index_rows(0, self._count)
+                print(f"[Memória de casos] {self._count} casos carregados de {path}.")
+            else:
+                self._rows = open_memmap(rows_path, mode="w+", dtype=CASE_DTYPE, shape=(capacity,))
+
+        self._writer = threading.Thread(target=self._run_writer, daemon=True)
+        self._writer.start()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _index_rows(self, start: int, stop: int) -> None:
+        rows = self._rows[start:stop]
+        keys = zip(rows["protocol"].tolist(), rows["dst_port"].tolist(),
+                   rows["packet_count"].tolist(), rows["byte_count"].tolist())
+        for row, (protocol, dst_port, packet_count, byte_count) in enumerate(keys, start):
+            fine, coarse = _cell_keys(protocol, dst_port, packet_count, byte_count)
+            for index, key in ((self._fine, fine), (self._coarse, coarse)):
+                cell = index.get(key)
+                if cell is None:
+                    cell = index[key] = deque(maxlen=self.max_per_cell)
+                cell.append(row)
+
+    def record(self, flow_data: dict, verdict: dict, reason: Optional[str] = None) -> None:
+        """Enfileira o veredito de `flow_data` para gravação em lote."""
+        with self._pending_lock:
+            self._pending.append((flow_data, verdict, reason, time.time()))
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def extend(self, flows: list, verdicts: list, reasons: Optional[list] = None) -> None:
+        """Grava vários casos imediatamente (carga inicial, importação)."""
+        now = time.time()
+        reasons = reasons if reasons is not None else [None] * len(flows)
+        self._write([(f, v, r, now) for f, v, r in zip(flows, verdicts, reasons)])
+
+    def flush(self) -> None:
+        """Grava os casos pendentes."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            self._write(pending)
+
+    def _run_writer(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Memória de casos] Erro ao gravar casos: {e}")
+
+    def _write(self, items: list) -> None:
+        flows = [item[0] for item in items]
+        records = [json.dumps(case_record(*item), ensure_ascii=False).encode() + b"\n" for item in items]
+        rows = np.zeros(len(items), dtype=CASE_DTYPE)
+        rows["vector"] = case_features(flows)
+        rows["timestamp"] = [item[3] for item in items]
+        rows["src_ip"] = [str_to_ip(f.get("src_ip", "0.0.0.0")) for f in flows]
+        rows["dst_ip"] = [str_to_ip(f.get("dst_ip", "0.0.0.0")) for f in flows]
+        for field in ("src_port", "dst_port", "protocol", "packet_count", "byte_count"):
+            rows[field] = [f.get(field, 0) for f in flows]
+        rows["status"] = [STATUSES.index(status_for_verdict(item[1])) for item in items]
+        rows["record_length"] = [len(record) for record in records]
+
+        with self._write_lock:
+            rows["record_offset"] = self._log_size + np.concatenate(([0], np.cumsum(rows["record_length"][:-1])))
+            self._log_size += int(rows["record_length"].sum())
+            if self._log is not None:
+                self._log.write(b"".join(records))
+                self._log.flush()
+
+            start = self._count
+            stop = start + len(items)
+            if stop > len(self._rows):
+                self._grow(stop)
+            self._rows[start:stop] = rows
+            if self._records is not None:
+                self._records.extend(records)
+            with self._lock:
+                self._index_rows(start, stop)
+                self._count = stop
+
+    def _grow(self, needed: int) -> None:
+        """Dobra a capacidade do array de casos até caber `needed` linhas."""
+        capacity = len(self._rows)
+        while capacity < needed:
+            capacity *= 2
+        if self.path is None:
+            rows = np.zeros(capacity, dtype=CASE_DTYPE)
+        else:
+            rows_path = os.path.join(self.path, "cases.npy")
+            rows = open_memmap(rows_path + ".tmp", mode="w+", dtype=CASE_DTYPE, shape=(capacity,))
+        rows[:self._count] = self._rows[:self._count]
+        if self.path is not None:
+            rows.flush()
+            os.replace(rows_path + ".tmp", rows_path)
+        with self._lock:
+            self._rows = rows
+
+    def similar(self, flow_data: dict, k: Optional[int] = None) -> list:
+        """Retorna até `k` pares (distância, linha) dos casos mais parecidos, do mais próximo."""
+        k = k or self.k
+        fine, coarse = _cell_keys(flow_data.get("protocol", 0), flow_data.get("dst_port", 0),
+                                  flow_data.get("packet_count", 0), flow_data.get("byte_count", 0))
+        with self._lock:
+            self.lookups += 1
+            rows = self._rows
+            candidates = self._fine.get(fine, ())
+            if len(candidates) < k:
+                candidates = self._coarse.get(coarse, ())
+            candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        if len(candidates) == 0:
+            return []
+
+        distances = np.sqrt(((rows["vector"][candidates] - case_features([flow_data])[0]) ** 2).sum(axis=1))
+        nearest = np.argsort(distances, kind="stable")[:k] if len(distances) > k else np.argsort(distances, kind="stable")
+        return [(float(distances[i]), int(candidates[i])) for i in nearest]
+
+    def match(self, flow_data: dict) -> Optional[dict]:
+        """Veredito dos casos quase idênticos a `flow_data`, ou None se não houver consenso."""
+        if self.match_distance is None:
+            return None
+        close = [row for distance, row in self.similar(flow_data) if distance <= self.match_distance]
+        statuses = {int(self._rows["status"][row]) for row in close}
+        if len(close) < self.min_matches or len(statuses) != 1 or STATUSES[statuses.pop()] == "indeterminado":
+            self.misses += 1
+            return None
+        if self._rows["status"][close[0]] == STATUSES.index("anomalo"):
+            # o vetor não inclui os IPs: um bloqueio só vale para a mesma origem
+            src_ip = flow_data.get("src_ip")
+            sources = {int(self._rows["src_ip"][row]) for row in close}
+            if src_ip is None or sources != {str_to_ip(src_ip)}:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {"action": "drop", "src_ip": src_ip}
+        if self._suspicious_source(flow_data):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"action": "none"}
+
+    def _suspicious_source(self, flow_data: dict) -> bool:
+        """Indica se o "source_stats" do fluxo passa dos limiares de varredura ou inundação."""
+        stats = flow_data.get("source_stats") or {}
+        fanout = max(stats.get("distinct_dst_ips", 0), stats.get("distinct_dst_ports", 0))
+        return fanout >= self.scan_fanout or stats.get("flows", 0) >= self.flood_flows
+
+    def case(self, row: int) -> dict:
+        """Caso completo (formato do esquema) da linha `row`."""
+        if self._records is not None:
+            return json.loads(self._records[row])
+        entry = self._rows[row]
+        data = os.pread(self._log.fileno(), int(entry["record_length"]), int(entry["record_offset"]))
+        return json.loads(data)
+
+    def examples(self, flows: list, max_examples: Optional[int] = None) -> list:
+        """Casos parecidos com `flows` (sem repetição), no formato usado nos prompts few-shot."""
+        max_examples = max_examples or self.k
+        seen = set()
+        examples = []
+        for flow_data in flows:
+            for _, row in self.similar(flow_data):
+                if row in seen:
+                    continue
+                seen.add(row)
+                entry = self._rows[row]
+                examples.append({
+                    "flow": {
+                        "src_ip": ip_to_str(int(entry["src_ip"])),
+                        "dst_ip": ip_to_str(int(entry["dst_ip"])),
+                        "src_port": int(entry["src_port"]),
+                        "dst_port": int(entry["dst_port"]),
+                        "protocol": int(entry["protocol"]),
+                        "packet_count": int(entry["packet_count"]),
+                        "byte_count": int(entry["byte_count"]),
+                    },
+                    "anomaly_status": STATUSES[int(entry["status"])],
+                    "anomaly_reason": self.case(row).get("anomaly_reason", ""),
+                })
+                if len(examples) >= max_examples:
+                    return examples
+        return examples
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "cases": self._count,
+            "cells": len(self._fine),
+            "lookups": self.lookups,
+            "match_hits": self.hits,
+            "match_misses": self.misses,
+            "match_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        """Para a thread de gravação e grava os casos pendentes."""
+        self._stop.set()
+        self._wake.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        if self._log is not None:
+            self._rows.flush()
+            self._log.close()
+
+
+def main():
+    from traffic_generator import TrafficGenerator, expected_response, records_to_flows
+
+    parser = argparse.ArgumentParser(description="Carga e latência de busca da memória de casos")
+    parser.add_argument('--cases', type=int, default=1_000_000, help='Casos sintéticos gravados')
+    parser.add_argument('--lookups', type=int, default=10_000, help='Buscas medidas')
+    parser.add_argument('--path', type=str, default=None, help='Diretório da memória (omitido = só em memória)')
+    parser.add_argument('--seed', type=int, default=0, help='Semente do gerador de tráfego')
+    args = parser.parse_args()
+
+    memory = CaseMemory(path=args.path, capacity=max(args.cases, 1))
+    generator = TrafficGenerator(seed=args.seed, chunk_size=100_000)
+    start = time.perf_counter()
+    for chunk in generator.chunks(args.cases):
+        verdicts = [expected_response(record) for record in chunk]
+        memory.extend(list(records_to_flows(chunk)),
+                      [{"action": v["action"]} for v in verdicts], [v["description"] for v in verdicts])
+    print(f"{len(memory)} casos gravados em {time.perf_counter() - start:.1f}s")
+
+    queries = list(generator.flows(args.lookups))
+    samples = np.empty(len(queries))
+    for i, flow_data in enumerate(queries):
+        t0 = time.perf_counter()
+        memory.similar(flow_data)
+        samples[i] = time.perf_counter() - t0
+    p50, p99 = np.percentile(samples * 1e6, [50, 99])
+    matched = sum(memory.match(flow_data) is not None for flow_data in queries)
+    print(f"similar(): p50 = {p50:.1f} µs, p99 = {p99:.1f} µs; match() decidiu {matched}/{len(queries)} fluxos")
+    memory.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,128 +1,261 @@
-import requests
 import os
 import time
+import asyncio
 import random
 import json
-from typing import Any, Optional
-import ollama
+import zlib
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
 
-try:
-    from openai import OpenAI  # type: ignore
-except Exception:
-    OpenAI = None  # type: ignore
+from verdict_cache import VerdictCache
+from case_memory import CaseMemory
+from sketches import SourceSketches
+from admission import DEFAULT_VERDICT, AdmissionQueue
+from routing import ModelRouter
+from results_sink import ResultsSink
+from pcap_reader import pcap_flows
+from prefilter import BENIGN, StatisticalPrefilter
+from rule_manager import AclRuleManager, drop_target, simulate_p4_batch_write
+from metrics import Metrics, MetricsServer, SnapshotWriter
+from stream_parser import IncrementalJsonParser
+from providers import ProviderError, ResilientProvider, create_provider, heuristic_verdict, stream_connections
+
+
+PROMPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.json")
+
+
+@lru_cache(maxsize=None)
+def load_prompts(path: str = PROMPTS_PATH) -> dict:
+    """Conteúdo de prompts.json, lido uma única vez por processo."""
+    with open(path, encoding="utf8") as file:
+        return json.load(file)
 
 
 class Controller:
     """Controlador simulado que usa uma LLM para detectar anomalias em fluxos de rede.
 
-    O Controller recebe um provider, que é o nome de um cliente suportado. 
-    Na implementação atual, "openai" e "ollama" são clientes válidos.
+    O Controller recebe um provider, que é o nome de um backend registrado em
+    providers.py ("openai", "ollama" ou "stub").
 
     Em caso de cliente com uso de chave de API, essa deve ser passada em api_key
 
     Para especificar o modelo, passe seu identificador em model.
     Se não for especificado, será usado um modelo default.
-    """
-
-    def __init__(self, provider: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.provider = provider
-        self.model = model
 
-        # Tenta inicializar automaticamente o cliente OpenAI se solicitado
-        if provider == 'openai':
-            try:
-                if api_key is None:
-                    raise Exception("Chave de API não inserida.")
-                
-                if OpenAI is None:
-                    raise Exception("Erro ao importar biblioteca.")
-                
-                self.client = OpenAI(api_key=api_key)
-                print("Cliente OpenAI inicializado.")
-                return
-            
-            except Exception as e:
-                print(f"Erro ao inicializar OpenAI client: {e}")
-                exit(0)
+    base_url aponta o cliente para outro servidor compatível (ex.: o servidor
+    local de mock_llm_server.py).
+
+    Para novas tentativas, circuit breaker e failover entre modelos, passe em llm um
+    ResilientProvider já montado (provider, api_key, model e base_url são ignorados).
+    Um ModelRouter em llm analisa tudo com um modelo pequeno e confirma num modelo
+    maior os vereditos "drop" e os de baixa confiança.
+    Se nenhum backend responder, o veredito vem de fallback_policy(fluxo) (padrão:
+    providers.heuristic_verdict). Um backend inacessível na criação levanta ProviderError.
+
+    Opcionalmente, um VerdictCache em verdict_cache responde fluxos repetidos
+    sem chamar a LLM, e um StatisticalPrefilter em prefilter responde fluxos
+    claramente benignos, escalonando para a LLM apenas os demais. Com um
+    AclRuleManager em rule_manager, as regras de descarte são deduplicadas,
+    agregadas e escritas em lotes. Uma CaseMemory em case_memory guarda cada
+    veredito da LLM, injeta casos parecidos no prompt (few-shot) e responde sem
+    chamar a LLM fluxos quase idênticos a casos já decididos. Com SourceSketches em
+    sketches, cada fluxo recebe em "source_stats" o comportamento recente da sua
+    origem (fluxos, bytes, IPs e portas de destino distintos, posição entre os
+    maiores emissores) antes de ser analisado.
+
+    Com stream=True, as análises de um fluxo recebem a resposta em streaming: o
+    veredito é devolvido assim que anomaly_detected/action/target_ip chegam, e o
+    restante (descrição) é lido em segundo plano para o log e a memória de casos.
+
+    No pipeline assíncrono, uma AdmissionQueue em admission substitui a fila de
+    fluxos: a fila é limitada, ordenada por prioridade e com prazo por fluxo, e sob
+    sobrecarga descarta trabalho em vez de atrasar o produtor. Os fluxos descartados
+    recebem shed_verdict().
+
+    Com um ResultsSink em results_sink, cada fluxo concluído gera um registro
+    estruturado (fluxo, resposta bruta da LLM, veredito, origem do veredito, durações
+    por estágio e regra aplicada), gravado em segundo plano. As mensagens por fluxo no
+    console são opcionais: console_sample é a fração dos fluxos (sorteada pelo flow_id)
+    cujas mensagens aparecem; 0 desliga, 1 mostra todas.
+
+    Com warmup=True, a verificação dos backends e o aquecimento do modelo (carga na
+    memória, conexões abertas) rodam em segundo plano; wait_ready() espera por eles e
+    os laços de execução só começam a gerar fluxos depois disso.
+
+    As durações de cada estágio, os contadores de vereditos/erros e a profundidade
+    das filas são registrados em metrics (um Metrics; Metrics(enabled=False) desliga).
+    """
 
-        # Tenta inicializar automaticamente o cliente Ollama se solicitado
-        if provider == "ollama":
-            try:
-                ollama.list()
-                print("Ollama está disponível.")
-                return
-            
-            except Exception as e:
-                print(f"Erro ao se conectar com a Ollama: {e}")
-                exit(0)
+    def __init__(self, provider: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None,
+                 verdict_cache: Optional[VerdictCache] = None, prefilter: Optional[StatisticalPrefilter] = None,
+                 base_url: Optional[str] = None, rule_manager: Optional[AclRuleManager] = None,
+                 metrics: Optional[Metrics] = None, case_memory: Optional[CaseMemory] = None,
+                 stream: bool = False, llm: Optional[ResilientProvider | ModelRouter] = None,
+                 fallback_policy: Optional[Callable[[dict], dict]] = None,
+                 sketches: Optional[SourceSketches] = None, admission: Optional[AdmissionQueue] = None,
+                 warmup: bool = False, results_sink: Optional[ResultsSink] = None, console_sample: float = 0.0):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.verdict_cache = verdict_cache
+        self.prefilter = prefilter
+        self.rule_manager = rule_manager
+        self.case_memory = case_memory
+        self.sketches = sketches
+        self.admission = admission
+        self.stream = stream
+        self.results_sink = results_sink
+        self.console_sample = console_sample
+        # registro em montagem de cada fluxo em análise (id(fluxo) -> campos), só com results_sink
+        self._traces: dict = {}
+        self._traces_lock = threading.Lock()
+        # termina de ler as respostas em streaming depois que o veredito já foi decidido
+        self._stream_finisher = ThreadPoolExecutor(max_workers=4) if stream else None
+
+        self.fallback_policy = fallback_policy if fallback_policy is not None else heuristic_verdict
+
+        # a conversa fixa (prompts de análise e de formatação) é montada uma vez
+        self.prompts = load_prompts()
+        messages = [{"role": m["role"], "content": m["content"]} for m in self.prompts["prompts"]]
+        self._analysis_messages = messages[:2]
+        self._format_messages = messages[2:4]
+
+        if llm is None:
+            llm = ResilientProvider([create_provider(provider, model=model, api_key=api_key, base_url=base_url)],
+                                    metrics=self.metrics)
+        self.llm = llm
+        self.provider = llm.primary.name
+        self.model = llm.primary.model
+        self.ready = threading.Event()
+        self.startup_error: Optional[ProviderError] = None
+        self._created_at = time.perf_counter()
+        if warmup:
+            threading.Thread(target=self._warm_up, name="controller-warmup", daemon=True).start()
+        else:
+            if not llm.check():
+                raise ProviderError("Nenhum backend de LLM está acessível.")
+            self.ready.set()
+        print(f"Provider LLM inicializado: {', '.join(backend.label for backend in llm.backends)}.")
+
+    def _warm_up(self) -> None:
+        try:
+            if not self.llm.check():
+                raise ProviderError("Nenhum backend de LLM está acessível.")
+            self.llm.warmup()
+            print(f"[Controlador] Pronto em {time.perf_counter() - self._created_at:.2f}s (modelo aquecido).")
+        except ProviderError as e:
+            self.startup_error = e
+        except Exception as e:
+            self.startup_error = ProviderError(f"Falha no aquecimento: {e}")
+        finally:
+            self.ready.set()
 
-        print("Cliente desconhecido. Verifique os clientes válidos.")
-        exit(0)
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Espera a verificação/aquecimento dos backends; False se `timeout` vencer antes.
 
+        Levanta ProviderError se nenhum backend estiver acessível.
+        """
+        if not self.ready.wait(timeout):
+            return False
+        if self.startup_error is not None:
+            raise self.startup_error
+        return True
+
+    def _sampled(self, flow_data: Optional[dict] = None) -> bool:
+        """Indica se as mensagens de `flow_data` (ou de um lote, sem fluxo) vão ao console."""
+        if self.console_sample <= 0:
+            return False
+        if self.console_sample >= 1:
+            return True
+        if flow_data is None:
+            return random.random() < self.console_sample
+        return zlib.crc32(str(flow_data.get("flow_id")).encode()) < self.console_sample * 2 ** 32
+
+    def _trace(self, flow_data: dict, timings: Optional[dict] = None, **fields) -> None:
+        """Anota campos (source, raw_response) e durações no registro de resultado de `flow_data`."""
+        if self.results_sink is None:
+            return
+        with self._traces_lock:
+            trace = self._traces.setdefault(id(flow_data), {"timings": {}})
+            trace.update(fields)
+            if timings:
+                trace["timings"].update(timings)
+
+    def build_messages(self, user_content: str, format_prompt: Optional[dict] = None,
+                       examples: Optional[list] = None) -> list:
+        """Monta a conversa enviada à LLM a partir de prompts.json.
+
+        `user_content` é inserido entre o prompt de análise e o prompt de formatação.
+        `format_prompt` substitui a última mensagem (formato da resposta) quando informado.
+        `examples` (casos parecidos da memória de casos) entra antes de `user_content`.
+        """
+        # tune and edit messages in prompts.json (lido uma vez, em load_prompts())
+        with self.metrics.stage("prompt_build"):
+            conversation = list(self._analysis_messages)
+            if examples:
+                few_shot = self.prompts["few_shot_prompt"]
+                conversation.append({"role": few_shot["role"],
+                                     "content": few_shot["content"] + "\n" + json.dumps(examples, ensure_ascii=False)})
+            conversation.append({"role": "user", "content": user_content})
+            if format_prompt is None:
+                return conversation + self._format_messages
+            return conversation + [self._format_messages[0],
+                                   {"role": format_prompt["role"], "content": format_prompt["content"]}]
+
+    def similar_cases(self, flows: list) -> Optional[list]:
+        """Casos anteriores parecidos com `flows`, para o prompt (None sem case_memory)."""
+        if self.case_memory is None:
+            return None
+        with self.metrics.stage("case_lookup"):
+            return self.case_memory.examples(flows)
 
     def call_llm_for_anomaly_detection(self, flow_data: dict) -> Optional[str]:
         """Gera o prompt a partir de `flow_data` e chama o cliente LLM configurado.
 
         Retorna uma string JSON (preferível) ou None em caso de erro.
         """
+        return self.call_llm(self.build_messages(f"{flow_data}", examples=self.similar_cases([flow_data])))
 
-        # tune and edit messages in prompts.json
-        with open("src/prompts.json", encoding="utf8") as file:
-            messages = json.load(file)["prompts"]
+    def call_llm(self, messages: list) -> Optional[str]:
+        """Envia `messages` ao cliente LLM configurado e retorna o conteúdo da resposta."""
+        with self.metrics.stage("llm_call"):
+            return self._call_llm(messages)
 
+    def _call_llm(self, messages: list) -> Optional[str]:
         try:
-            # 1) Chamada OpenAI
-            if self.provider == "openai":
-                fn = self.client.chat.completions.create
-                resp = fn(
-                    model=self.model if self.model else "gpt-3.5-turbo",
-                    messages=[
-                        {"role": messages[0]["role"], "content": messages[0]["content"]},
-                        {"role": messages[1]["role"], "content": messages[1]["content"]},
-                        {"role": "user", "content": f"{flow_data}"},
-                        {"role": messages[2]["role"], "content": messages[2]["content"]},
-                        {"role": messages[3]["role"], "content": messages[3]["content"]},
-                    ],
-                    response_format={"type": "json_object"},
-                    temperature=0.2,
-                )
-                # normaliza a resposta
-                if isinstance(resp, dict):
-                    return json.dumps(resp)
-                if hasattr(resp, 'choices'):
-                    try:
-                        return resp.choices[0].message.content
-                    except Exception:
-                        return str(resp)
-
-            # 2) Estilo Ollama
-            if self.provider == "ollama":
-                resp = ollama.chat(
-                    model=self.model if self.model else "llama3",
-                    messages=[
-                        {"role": messages[0]["role"], "content": messages[0]["content"]},
-                        {"role": messages[1]["role"], "content": messages[1]["content"]},
-                        {"role": "user", "content": f"{flow_data}"},
-                        {"role": messages[2]["role"], "content": messages[2]["content"]},
-                        {"role": messages[3]["role"], "content": messages[3]["content"]},
-                    ],
-                    options={
-                        'temperature': 0.2,
-                        }
-                    )
-                
-                if isinstance(resp, dict):
-                    return json.dumps(resp)
-                print(resp["message"]["content"])
-                return resp["message"]["content"]
-
-
-            print("Formato de cliente desconhecido — não foi possível chamar o LLM.")
+            return self.llm.chat(messages)
+        except ProviderError as e:
+            print(f"Erro ao chamar o cliente LLM: {e}")
+            self.metrics.inc("llm_failures_total")
             return None
-        
+
+    def call_llm_stream(self, messages: list) -> Iterator[str]:
+        """Envia `messages` com streaming e gera os pedaços do conteúdo da resposta."""
+        try:
+            yield from self.llm.stream(messages)
         except Exception as e:
             print(f"Erro ao chamar o cliente LLM: {e}")
-            return None
+            self.metrics.inc("llm_failures_total")
+
+    def fallback_verdict(self, flow_data: dict) -> dict:
+        """Veredito da política de fallback, para quando nenhum backend de LLM responde.
+
+        Leva "fallback": True, para não ser confundido com um veredito do modelo.
+        """
+        if self._sampled(flow_data):
+            print(f"[LLM] Sem resposta da LLM; usando a política de fallback para o fluxo {flow_data.get('flow_id')}.")
+        self.metrics.inc("fallback_verdicts_total")
+        self._trace(flow_data, source="fallback")
+        return dict(self.fallback_policy(flow_data), fallback=True)
+
+    def shed_verdict(self, flow_data: dict, reason: str) -> dict:
+        """Veredito de um fluxo descartado pela AdmissionQueue sem análise (motivo em "shed")."""
+        if self.admission is not None and self.admission.policy == DEFAULT_VERDICT:
+            verdict = dict(self.fallback_verdict(flow_data), shed=reason)
+        else:
+            verdict = {"action": "none", "shed": reason}
+        self._trace(flow_data, source="shed")
+        return verdict
 
     def clean_llm_formatting_mishaps(self, text: str) -> str:
         text = text.removeprefix("```json")
@@ -132,85 +265,652 @@ class Controller:
 
         return text
 
+    def verdict_from_llm_response(self, parsed_response: dict) -> dict:
+        """Normaliza o JSON da LLM para {'action': ..., 'src_ip': ...}."""
+        if parsed_response.get("anomaly_detected") and parsed_response.get("action") == "drop":
+            return self._drop_verdict(parsed_response.get("target_ip"))
+        return {"action": "none"}
+
+    def _drop_verdict(self, target_ip) -> dict:
+        """Veredito de bloqueio de `target_ip`; um alvo que não é um IPv4 único é ignorado."""
+        src_ip = drop_target(target_ip)
+        if src_ip is None:
+            self.metrics.inc("invalid_targets_total")
+            print(f"[LLM] Alvo de bloqueio inválido ignorado: {target_ip!r}")
+            return {"action": "none"}
+        return {"action": "drop", "src_ip": src_ip}
+
+    def verdict_from_partial_response(self, fields: dict) -> Optional[dict]:
+        """Veredito normalizado a partir dos campos já recebidos, ou None se ainda não dá para decidir."""
+        if fields.get("anomaly_detected") is False or fields.get("action", "drop") != "drop":
+            return {"action": "none"}
+        if fields.get("anomaly_detected") is True and "target_ip" in fields:
+            return self._drop_verdict(fields["target_ip"])
+        return None
+
     def simulate_llm_anomaly_detection(self, flow_data: dict) -> dict:
         """Chama a LLM (real ou simulada) e normaliza a resposta para {'action': ..., 'src_ip': ...}.
         """
-        print(f"[LLM] Enviando dados de fluxo para análise: {flow_data}")
+        known = self._known_verdict(flow_data)
+        if known is not None:
+            return known
+        return self._query_llm_verdict(flow_data)
+
+    def _known_verdict(self, flow_data: dict) -> Optional[dict]:
+        """Veredito já conhecido para o fluxo (cache ou caso quase idêntico), ou None."""
+        if self.verdict_cache is not None:
+            with self.metrics.stage("cache_lookup"):
+                cached = self.verdict_cache.get(flow_data)
+            if cached is not None:
+                self._trace(flow_data, source="cache")
+                return cached
+        if self.case_memory is not None:
+            with self.metrics.stage("case_match"):
+                matched = self.case_memory.match(flow_data)
+            if matched is not None:
+                self.metrics.inc("case_memory_matches_total")
+                self._trace(flow_data, source="case_memory")
+                return matched
+        return None
+
+    def _remember_verdict(self, flow_data: dict, verdict: dict, reason: Optional[str] = None) -> None:
+        """Guarda um veredito da LLM no cache e na memória de casos."""
+        if self.verdict_cache is not None:
+            self.verdict_cache.put(flow_data, verdict)
+        if self.case_memory is not None:
+            self.case_memory.record(flow_data, verdict, reason)
+
+    def _query_llm_verdict(self, flow_data: dict) -> dict:
+        if self.stream:
+            return self._stream_llm_verdict(flow_data)
+        if self._sampled(flow_data):
+            print(f"[LLM] Enviando dados de fluxo para análise: {flow_data}")
+        start = time.perf_counter()
         llm_response = self.call_llm_for_anomaly_detection(flow_data)
+        self._trace(flow_data, timings={"llm_call": time.perf_counter() - start})
+        return self._verdict_from_text(flow_data, llm_response)
 
+    def _verdict_from_text(self, flow_data: dict, llm_response: Optional[str]) -> dict:
         if llm_response:
+            self._trace(flow_data, source="llm", raw_response=llm_response)
             try:
-                cleaned_response = self.clean_llm_formatting_mishaps(llm_response)
-                parsed_response = json.loads(cleaned_response) if isinstance(cleaned_response, str) else cleaned_response
-                print(f"[LLM] Resposta: {parsed_response}")
-                if parsed_response.get("anomaly_detected") and parsed_response.get("action") == "drop":
-                    return {"action": "drop", "src_ip": parsed_response.get("target_ip")}
-                else:
-                    return {"action": "none"}
-            except (json.JSONDecodeError, TypeError) as e:
+                with self.metrics.stage("parse"):
+                    cleaned_response = self.clean_llm_formatting_mishaps(llm_response)
+                    parsed_response = json.loads(cleaned_response) if isinstance(cleaned_response, str) else cleaned_response
+                    verdict = self.verdict_from_llm_response(parsed_response)
+                if self._sampled(flow_data):
+                    print(f"[LLM] Resposta: {parsed_response}")
+                self._remember_verdict(flow_data, verdict, parsed_response.get("description"))
+                return verdict
+            except (json.JSONDecodeError, TypeError, AttributeError) as e:
                 print(f"Erro ao decodificar JSON da resposta da LLM: {e}")
-                return {"action": "none"}
-        return {"action": "none"}
+                self.metrics.inc("parse_failures_total", mode="single")
+                return {"action": "none", "fallback": True}
+        return self.fallback_verdict(flow_data)
+
+    def _stream_llm_verdict(self, flow_data: dict) -> dict:
+        """Decide o veredito pelos primeiros campos da resposta em streaming."""
+        if self._sampled(flow_data):
+            print(f"[LLM] Enviando dados de fluxo para análise (streaming): {flow_data}")
+        messages = self.build_messages(f"{flow_data}", examples=self.similar_cases([flow_data]))
+        start = time.perf_counter()
+        pieces = self.call_llm_stream(messages)
+        parser = IncrementalJsonParser()
+        try:
+            for piece in pieces:
+                parser.feed(piece)
+                verdict = self.verdict_from_partial_response(parser.fields)
+                if verdict is not None:
+                    self.metrics.observe("llm_decision", time.perf_counter() - start)
+                    self._trace(flow_data, timings={"llm_call": time.perf_counter() - start},
+                                source="llm", raw_response=parser.text)
+                    if self.verdict_cache is not None:
+                        self.verdict_cache.put(flow_data, verdict)
+                    self._stream_finisher.submit(self._finish_stream, flow_data, verdict, parser, pieces, start)
+                    return verdict
+        except ValueError as e:
+            # fora do formato esperado: lê o resto e tenta o caminho sem streaming
+            print(f"[LLM] Resposta em streaming fora do formato ({e}); analisando a resposta completa.")
+            for piece in pieces:
+                parser.feed(piece)
+
+        self.metrics.observe("llm_call", time.perf_counter() - start)
+        self._trace(flow_data, timings={"llm_call": time.perf_counter() - start})
+        return self._verdict_from_text(flow_data, parser.text)
+
+    def _finish_stream(self, flow_data: dict, verdict: dict, parser: IncrementalJsonParser,
+                       pieces: Iterator[str], start: float) -> None:
+        try:
+            for piece in pieces:
+                parser.feed(piece)
+        except ValueError:
+            pass
+        self.metrics.observe("llm_call", time.perf_counter() - start)
+        if self._sampled(flow_data):
+            print(f"[LLM] Resposta: {parser.fields}")
+        if self.case_memory is not None:
+            self.case_memory.record(flow_data, verdict, parser.fields.get("description"))
+
+    def call_llm_for_batch_anomaly_detection(self, flows: list) -> Optional[str]:
+        """Envia vários fluxos em um único prompt, pedindo um veredito por `flow_id`."""
+        batch_format = self.prompts["batch_format_prompt"]
+        flows_content = json.dumps(flows, separators=(",", ":"))
+        return self.call_llm(self.build_messages(flows_content, format_prompt=batch_format,
+                                                 examples=self.similar_cases(flows)))
+
+    def simulate_llm_batch_anomaly_detection(self, flows: list) -> list:
+        """Analisa um micro-lote de fluxos com uma única chamada à LLM.
+
+        Retorna um veredito normalizado por fluxo, na mesma ordem de `flows`.
+        Fluxos ausentes ou malformados na resposta do lote são reenviados
+        individualmente; se a chamada falhar, todos recebem fallback_verdict().
+        Fluxos presentes no cache ou na memória de casos não são enviados.
+        """
+        verdicts = [self._known_verdict(flow_data) for flow_data in flows]
+        pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        if len(pending) <= 1:
+            for i in pending:
+                verdicts[i] = self._query_llm_verdict(flows[i])
+            return verdicts
+
+        pending_flows = [flows[i] for i in pending]
+        if self._sampled():
+            print(f"[LLM] Enviando lote de {len(pending_flows)} fluxos para análise.")
+        start = time.perf_counter()
+        llm_response = self.call_llm_for_batch_anomaly_detection(pending_flows)
+        if self.results_sink is not None:
+            elapsed = time.perf_counter() - start
+            for flow_data in pending_flows:
+                self._trace(flow_data, timings={"llm_call": elapsed})
+        if llm_response is None:
+            # nenhum backend respondeu: reenviar fluxo a fluxo só repetiria a falha
+            for i in pending:
+                verdicts[i] = self.fallback_verdict(flows[i])
+            return verdicts
+
+        by_flow_id = {}
+        if llm_response:
+            try:
+                with self.metrics.stage("parse"):
+                    parsed_response = json.loads(self.clean_llm_formatting_mishaps(llm_response))
+                    # response_format json_object exige um objeto; aceita também uma lista pura
+                    if isinstance(parsed_response, dict):
+                        parsed_response = parsed_response.get("verdicts", [])
+                    for entry in parsed_response:
+                        if isinstance(entry, dict) and "flow_id" in entry and isinstance(entry.get("anomaly_detected"), bool):
+                            by_flow_id[str(entry["flow_id"])] = entry
+            except (json.JSONDecodeError, TypeError) as e:
+                print(f"Erro ao decodificar JSON da resposta em lote da LLM: {e}")
+                self.metrics.inc("parse_failures_total", mode="batch")
+
+        for i in pending:
+            flow_data = flows[i]
+            entry = by_flow_id.get(str(flow_data.get("flow_id")))
+            if entry is None:
+                if self._sampled(flow_data):
+                    print(f"[LLM] Fluxo {flow_data.get('flow_id')} ausente na resposta do lote; reenviando individualmente.")
+                self.metrics.inc("batch_fallbacks_total")
+                verdicts[i] = self._query_llm_verdict(flow_data)
+            else:
+                verdicts[i] = self.verdict_from_llm_response(entry)
+                if self.results_sink is not None:
+                    self._trace(flow_data, source="llm", raw_response=json.dumps(entry, ensure_ascii=False))
+                self._remember_verdict(flow_data, verdicts[i], entry.get("description"))
+        return verdicts
+
+    def detect_anomalies(self, flows: list) -> list:
+        """Detecção em níveis: o pré-filtro estatístico (se configurado) responde os
+        fluxos benignos e apenas os demais são analisados pela LLM.
+
+        Retorna um veredito normalizado por fluxo, na mesma ordem de `flows`.
+        """
+        start = time.perf_counter()
+        verdicts = self._detect_anomalies(flows)
+        if self.results_sink is not None:
+            elapsed = time.perf_counter() - start
+            for flow_data in flows:
+                self._trace(flow_data, timings={"detect": elapsed})
+        return verdicts
+
+    def _annotate_sources(self, flows: list) -> None:
+        """Atualiza os sketches e anexa "source_stats" aos fluxos que ainda não o têm."""
+        if self.sketches is None:
+            return
+        pending = [flow_data for flow_data in flows if "source_stats" not in flow_data]
+        if pending:
+            with self.metrics.stage("sketches"):
+                self.sketches.annotate(pending)
+
+    def admit(self, flow_data: dict) -> bool:
+        """Oferece `flow_data` à fila de admissão, já anotado com source_stats (sinal de prioridade)."""
+        self._annotate_sources([flow_data])
+        return self.admission.offer(flow_data)
+
+    def _detect_anomalies(self, flows: list) -> list:
+        self._annotate_sources(flows)
+        if self.prefilter is None:
+            return self.simulate_llm_batch_anomaly_detection(flows)
+
+        with self.metrics.stage("prefilter"):
+            decisions = self.prefilter.classify(flows)
+        verdicts = [{"action": "none"}] * len(flows)
+        escalated = [i for i, decision in enumerate(decisions) if decision != BENIGN]
+        if self.results_sink is not None:
+            for flow_data, decision in zip(flows, decisions):
+                if decision == BENIGN:
+                    self._trace(flow_data, source="prefilter")
+        if escalated:
+            llm_verdicts = self.simulate_llm_batch_anomaly_detection([flows[i] for i in escalated])
+            for i, verdict in zip(escalated, llm_verdicts):
+                verdicts[i] = verdict
+                # só vereditos do modelo entram na concordância do pré-filtro
+                if not verdict.get("fallback"):
+                    self.prefilter.record_llm_verdict(decisions[i], verdict)
+        return verdicts
 
     def simulate_p4_rule_application(self, table_name: str, match_fields: dict, action_name: str, action_params: Optional[dict] = None) -> None:
         if action_params is None:
             action_params = {}
+        if not self._sampled():
+            return
         print(f"[P4Runtime Simulado] Aplicando regra na tabela '{table_name}':")
         print(f"  Match: {match_fields}")
         print(f"  Action: {action_name} com parâmetros {action_params}")
         print("[P4Runtime Simulado] Regra aplicada com sucesso (simulado).")
 
+    def simulate_p4_batch_write(self, table_name: str, updates: list) -> None:
+        """Aplica várias atualizações em um único WriteRequest (simulado)."""
+        simulate_p4_batch_write(table_name, updates)
+
+    def flush_rules(self, force: bool = False) -> None:
+        """Escreve no switch o lote de regras pendentes do rule_manager, se for a hora."""
+        if self.rule_manager is None or not (force or self.rule_manager.due()):
+            return
+        updates = self.rule_manager.collect_updates()
+        if updates:
+            self.simulate_p4_batch_write(self.rule_manager.table_name, updates)
+
+    def generate_simulated_flow(self, flow_id: int) -> dict:
+        """Gera um fluxo sintético no formato do digest simulado."""
+        src_ip_prefix = "10.0.0."
+        dst_ip_prefix = "10.0.0."
+
+        if random.random() < 0.3:
+            src_ip = "10.0.0.1"
+            packet_count = random.randint(6, 20)
+        else:
+            src_ip = src_ip_prefix + str(random.randint(2, 254))
+            packet_count = random.randint(1, 5)
+
+        dst_ip = dst_ip_prefix + str(random.randint(2, 254))
+        src_port = random.randint(1024, 65535)
+        dst_port = random.choice([80, 443, 22, 23, 53, 8080])
+        protocol = random.choice([6, 17])
+        byte_count = packet_count * random.randint(64, 1500)
+
+        return {
+            "flow_id": flow_id,
+            "src_ip": src_ip,
+            "dst_ip": dst_ip,
+            "src_port": src_port,
+            "dst_port": dst_port,
+            "protocol": protocol,
+            "packet_count": packet_count,
+            "byte_count": byte_count,
+        }
+
+    def apply_llm_verdict(self, llm_response: dict) -> str:
+        """Traduz o veredito normalizado da LLM em regras P4 (simuladas).
+
+        Retorna a regra resultante: "none", "requested" (pedida ao rule_manager),
+        "covered" (já coberta por uma regra existente) ou "applied" (escrita direto).
+        """
+        self.metrics.inc("verdicts_total", action=llm_response.get("action", "none"))
+        with self.metrics.stage("rule_application"):
+            return self._apply_llm_verdict(llm_response)
+
+    def _apply_llm_verdict(self, llm_response: dict) -> str:
+        if llm_response.get("action") != "drop":
+            return "none"
+        if self._sampled():
+            print(f"[Controlador Simulado] LLM recomendou DROPAR tráfego do IP: {llm_response['src_ip']}")
+        if self.rule_manager is not None:
+            return "requested" if self.rule_manager.request_drop(llm_response['src_ip']) else "covered"
+        self.simulate_p4_rule_application("acl_table", {"hdr.ipv4.srcAddr": llm_response['src_ip']}, "_drop")
+        return "applied"
+
+    def finish_flow(self, flow_data: dict, llm_response: dict) -> str:
+        """Aplica o veredito de `flow_data` e, com results_sink, grava o registro do resultado."""
+        start = time.perf_counter()
+        rule = self.apply_llm_verdict(llm_response)
+        self.record_result(flow_data, llm_response, rule, apply_time=time.perf_counter() - start)
+        return rule
+
+    def record_result(self, flow_data: dict, llm_response: dict, rule: str, apply_time: Optional[float] = None) -> None:
+        """Grava no results_sink (se houver) o registro de `flow_data` com a regra `rule`.
+
+        Usado direto quando a regra é aplicada em outro processo (atuador do modo com shards).
+        """
+        if self.results_sink is None:
+            return
+        with self._traces_lock:
+            trace = self._traces.pop(id(flow_data), None) or {"timings": {}}
+        if apply_time is not None:
+            trace["timings"]["apply"] = apply_time
+        self.results_sink.record({
+            "timestamp": time.time(),
+            "flow_id": flow_data.get("flow_id"),
+            "flow": flow_data,
+            "raw_response": trace.get("raw_response"),
+            "verdict": llm_response,
+            "source": trace.get("source", "unknown"),
+            "timings": trace["timings"],
+            "rule": rule,
+        })
+
     def run_simulated_controller(self) -> None:
+        self.wait_ready()
         print("Controlador simulado iniciado. Gerando e analisando dados de fluxo...")
         print("[Controlador Simulado] Pipeline P4 configurado (simulado).")
         print("[Controlador Simulado] Digest configurado (simulado).")
 
         flow_id = 0
-        while True:
-            flow_id += 1
-            src_ip_prefix = "10.0.0."
-            dst_ip_prefix = "10.0.0."
-
-            if random.random() < 0.3:
-                src_ip = "10.0.0.1"
-                packet_count = random.randint(6, 20)
+        try:
+            while True:
+                flow_id += 1
+                with self.metrics.stage("flow_generation"):
+                    simulated_flow_data = self.generate_simulated_flow(flow_id)
+
+                if self._sampled(simulated_flow_data):
+                    print(f"\n[Controlador Simulado] Gerado dados de fluxo: {simulated_flow_data}")
+
+                llm_response = self.detect_anomalies([simulated_flow_data])[0]
+                if self._sampled(simulated_flow_data):
+                    print(f"[Controlador Simulado] Fluxo {flow_id} analisado: {llm_response}")
+                self.finish_flow(simulated_flow_data, llm_response)
+                self.flush_rules()
+
+                time.sleep(2)
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        """Escreve as regras pendentes, mostra as estatísticas dos componentes e
+        persiste o cache de vereditos e a memória de casos."""
+        if self._stream_finisher is not None:
+            self._stream_finisher.shutdown(wait=True)
+        if self.rule_manager is not None:
+            self.flush_rules(force=True)
+            print(f"[Regras] Estatísticas: {self.rule_manager.stats()}")
+        if self.prefilter is not None:
+            print(f"[Pré-filtro] Estatísticas: {self.prefilter.stats()}")
+        if self.verdict_cache is not None:
+            print(f"[Cache] Estatísticas: {self.verdict_cache.stats()}")
+            self.verdict_cache.save()
+        if self.case_memory is not None:
+            self.case_memory.close()
+            print(f"[Memória de casos] Estatísticas: {self.case_memory.stats()}")
+        if self.sketches is not None:
+            print(f"[Sketches] Estatísticas: {self.sketches.stats()}")
+        if self.admission is not None:
+            print(f"[Admissão] Estatísticas: {self.admission.stats()}")
+        if isinstance(self.llm, ModelRouter):
+            print(f"[Roteador] Estatísticas: {self.llm.stats()}")
+        if self.results_sink is not None:
+            self.results_sink.close()
+            print(f"[Resultados] Estatísticas: {self.results_sink.stats()}")
+
+    def run_async_controller(self, concurrency: int = 4, flow_interval: float = 0.0, max_flows: Optional[int] = None,
+                             batch_size: int = 1, batch_window_ms: float = 200.0,
+                             flow_source: Optional[Iterable[dict]] = None,
+                             on_verdict: Optional[Callable[[dict, dict], None]] = None) -> None:
+        """Executa o controlador como pipeline assíncrono produtor -> analisador -> atuador.
+
+        `concurrency` limita quantas chamadas à LLM ficam em andamento ao mesmo tempo.
+        `flow_interval` é o intervalo (s) entre fluxos gerados; `max_flows` encerra o
+        pipeline após esse número de fluxos (None = executa indefinidamente).
+        Com `batch_size` > 1, o analisador agrupa até `batch_size` fluxos, ou os que
+        chegarem em `batch_window_ms`, em um único prompt.
+        `flow_source` substitui a geração aleatória por fluxos de um iterável (replay);
+        o pipeline termina quando ele se esgota. O iterável é lido fora do laço asyncio,
+        então pode esperar entre fluxos (ex.: pcap_reader.pcap_flows no tempo gravado). `on_verdict(flow, veredito)` é chamado
+        pelo atuador para cada fluxo concluído.
+        Os resultados são aplicados na ordem em que as chamadas terminam.
+        Com uma AdmissionQueue em admission, o produtor nunca espera pelo analisador:
+        os fluxos que não cabem ou que vencem o prazo na fila vão direto ao atuador.
+        """
+        self.wait_ready()
+        if self._stream_finisher is not None:
+            # cada chamada em andamento pode deixar uma resposta sendo lida até o fim
+            self._stream_finisher.shutdown(wait=True)
+            self._stream_finisher = ThreadPoolExecutor(max_workers=concurrency)
+        print(f"Controlador assíncrono iniciado (concorrência = {concurrency}, lote = {batch_size}).")
+        asyncio.run(self._async_pipeline(concurrency, flow_interval, max_flows, batch_size, batch_window_ms / 1000,
+                                         flow_source, on_verdict))
+
+    async def _async_pipeline(self, concurrency: int, flow_interval: float, max_flows: Optional[int],
+                              batch_size: int, batch_window: float, flow_source: Optional[Iterable[dict]],
+                              on_verdict: Optional[Callable[[dict, dict], None]]) -> None:
+        loop = asyncio.get_running_loop()
+        # as chamadas aos clientes LLM são bloqueantes: cada uma ocupa uma thread do executor
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        flows: asyncio.Queue = asyncio.Queue(maxsize=concurrency * batch_size * 2)
+        results: asyncio.Queue = asyncio.Queue()
+        in_flight = asyncio.Semaphore(concurrency)
+        analyzing = [0]
+        admission = self.admission
+        if admission is not None:
+            admission.reopen()
+            admission.on_shed = lambda flow_data, reason: results.put_nowait(
+                (flow_data, self.shed_verdict(flow_data, reason)))
+        self.metrics.gauge("queue_depth", flows.qsize if admission is None else admission.qsize, queue="flows")
+        self.metrics.gauge("queue_depth", results.qsize, queue="results")
+        self.metrics.gauge("llm_in_flight", lambda: analyzing[0])
+
+        async def producer() -> None:
+            source = iter(flow_source) if flow_source is not None else None
+            # uma thread própria: o iterável é sempre avançado da mesma thread
+            reader = ThreadPoolExecutor(max_workers=1) if source is not None else None
+            start = loop.time()
+            produced = 0
+            while max_flows is None or produced < max_flows:
+                # chegadas em instantes fixos (start + n * flow_interval), sem acumular atraso
+                if flow_interval:
+                    delay = start + produced * flow_interval - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                with self.metrics.stage("flow_generation"):
+                    if source is None:
+                        flow_data = self.generate_simulated_flow(produced + 1)
+                    else:
+                        flow_data = await loop.run_in_executor(reader, next, source, None)
+                if flow_data is None:
+                    break
+                produced += 1
+                if admission is None:
+                    await flows.put(flow_data)
+                else:
+                    self.admit(flow_data)
+                    await asyncio.sleep(0)  # offer() não bloqueia: cede o laço ao analisador
+            if admission is None:
+                await flows.put(None)
             else:
-                src_ip = src_ip_prefix + str(random.randint(2, 254))
-                packet_count = random.randint(1, 5)
-
-            dst_ip = dst_ip_prefix + str(random.randint(2, 254))
-            src_port = random.randint(1024, 65535)
-            dst_port = random.choice([80, 443, 22, 23, 53, 8080])
-            protocol = random.choice([6, 17])
-            byte_count = packet_count * random.randint(64, 1500)
-
-            simulated_flow_data = {
-                "flow_id": flow_id,
-                "src_ip": src_ip,
-                "dst_ip": dst_ip,
-                "src_port": src_port,
-                "dst_port": dst_port,
-                "protocol": protocol,
-                "packet_count": packet_count,
-                "byte_count": byte_count,
-            }
+                admission.close()
+            if reader is not None:
+                reader.shutdown(wait=False)
 
-            print(f"\n[Controlador Simulado] Gerado dados de fluxo: {simulated_flow_data}")
-
-            llm_response = self.simulate_llm_anomaly_detection(simulated_flow_data)
-
-            if llm_response.get("action") == "drop":
-                print(f"[Controlador Simulado] LLM recomendou DROPAR tráfego do IP: {llm_response['src_ip']}")
-                self.simulate_p4_rule_application("acl_table", {"hdr.ipv4.srcAddr": llm_response['src_ip']}, "_drop")
-
-            time.sleep(2)
+        async def analyze(batch: list) -> None:
+            try:
+                llm_responses = await loop.run_in_executor(executor, self.detect_anomalies, batch)
+            except Exception as e:
+                print(f"Erro ao analisar fluxos {[f.get('flow_id') for f in batch]}: {e}")
+                llm_responses = [{"action": "none"}] * len(batch)
+            finally:
+                in_flight.release()
+                analyzing[0] -= 1
+            for flow_data, llm_response in zip(batch, llm_responses):
+                await results.put((flow_data, llm_response))
+
+        async def take(timeout: Optional[float] = None) -> Optional[dict]:
+            if admission is not None:
+                return await admission.get(timeout)
+            if timeout is None:
+                return await flows.get()
+            return await asyncio.wait_for(flows.get(), timeout)
+
+        async def next_batch() -> tuple:
+            """Retorna (lote, fim) agrupando fluxos até o tamanho ou a janela do lote."""
+            flow_data = await take()
+            if flow_data is None:
+                return [], True
+            batch = [flow_data]
+            deadline = loop.time() + batch_window
+            while len(batch) < batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    flow_data = await take(timeout)
+                except asyncio.TimeoutError:
+                    break
+                if flow_data is None:
+                    return batch, True
+                batch.append(flow_data)
+            return batch, False
+
+        async def analyzer() -> None:
+            tasks = set()
+            done = False
+            while not done:
+                batch, done = await next_batch()
+                if not batch:
+                    break
+                await in_flight.acquire()
+                analyzing[0] += 1
+                task = asyncio.create_task(analyze(batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            await results.put(None)
+
+        async def actuator() -> None:
+            while (item := await results.get()) is not None:
+                flow_data, llm_response = item
+                if self._sampled(flow_data):
+                    print(f"[Controlador Assíncrono] Fluxo {flow_data['flow_id']} analisado: {llm_response}")
+                if admission is not None and llm_response.get("action") == "drop":
+                    admission.mark_bad(llm_response["src_ip"])
+                self.finish_flow(flow_data, llm_response)
+                if on_verdict is not None:
+                    on_verdict(flow_data, llm_response)
+
+        async def rule_flusher() -> None:
+            while True:
+                await asyncio.sleep(self.rule_manager.flush_interval)
+                self.flush_rules(force=True)
+
+        flusher = asyncio.create_task(rule_flusher()) if self.rule_manager is not None else None
+        try:
+            await asyncio.gather(producer(), analyzer(), actuator())
+        finally:
+            if flusher is not None:
+                flusher.cancel()
+            self.metrics.remove_gauge("queue_depth", queue="flows")
+            self.metrics.remove_gauge("queue_depth", queue="results")
+            self.metrics.remove_gauge("llm_in_flight")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.shutdown()
 
 
 def main() -> None:
-    api_key = os.environ.get("OPENAI_API_KEY")
     # gemma3:4b is a light model from google. runs easily on a single gpu
-    ctrl = Controller(api_key=api_key, provider='ollama', model="gemma3:4b")
-    ctrl.run_simulated_controller()
+    # vereditos repetidos são respondidos pelo cache; VERDICT_CACHE_PATH o mantém entre reinícios
+    cache = VerdictCache(ttl=float(os.environ.get("VERDICT_CACHE_TTL", "300")),
+                         persist_path=os.environ.get("VERDICT_CACHE_PATH"))
+    # METRICS_DISABLED=1 desliga a instrumentação; METRICS_PORT expõe /metrics e
+    # METRICS_SNAPSHOT grava um snapshot JSON periódico
+    metrics = Metrics(enabled=os.environ.get("METRICS_DISABLED") != "1")
+    if metrics.enabled and os.environ.get("METRICS_PORT"):
+        MetricsServer(metrics, port=int(os.environ["METRICS_PORT"])).start()
+    if metrics.enabled and os.environ.get("METRICS_SNAPSHOT"):
+        SnapshotWriter(metrics, os.environ["METRICS_SNAPSHOT"]).start()
+    # LLM_STREAM=1 decide cada fluxo pelos primeiros campos da resposta em streaming
+    stream = os.environ.get("LLM_STREAM") == "1"
+    # CASE_MEMORY_PATH ativa a memória de casos (few-shot e atalho para casos quase idênticos)
+    case_memory = CaseMemory(os.environ["CASE_MEMORY_PATH"]) if os.environ.get("CASE_MEMORY_PATH") else None
+    # SOURCE_SKETCHES_DISABLED=1 desliga o contexto por origem (source_stats) dos fluxos
+    sketches = SourceSketches() if os.environ.get("SOURCE_SKETCHES_DISABLED") != "1" else None
+    # ADMISSION_POLICY (drop_oldest, sample_benign ou default_verdict) ativa a fila de admissão do
+    # pipeline assíncrono, com ADMISSION_QUEUE_SIZE fluxos e prazo de ADMISSION_MAX_WAIT s por fluxo
+    admission = None
+    if os.environ.get("ADMISSION_POLICY"):
+        admission = AdmissionQueue(maxsize=int(os.environ.get("ADMISSION_QUEUE_SIZE", "1024")),
+                                   max_wait=float(os.environ.get("ADMISSION_MAX_WAIT", "5")),
+                                   policy=os.environ["ADMISSION_POLICY"], metrics=metrics)
+    # LLM_MODEL é o modelo Ollama principal; LLM_TIMEOUT limita cada chamada (s); LLM_FALLBACK_MODEL
+    # é um segundo modelo Ollama usado quando o principal falha ou está com o circuito aberto
+    timeout = float(os.environ.get("LLM_TIMEOUT", "30"))
+    # LLM_CONCURRENCY > 1 ativa o pipeline assíncrono com várias chamadas simultâneas
+    concurrency = int(os.environ.get("LLM_CONCURRENCY", "1"))
+    connections = stream_connections(concurrency, stream)
+    backends = [create_provider("ollama", model=os.environ.get("LLM_MODEL", "gemma3:4b"), timeout=timeout,
+                                max_connections=connections)]
+    if os.environ.get("LLM_FALLBACK_MODEL"):
+        backends.append(create_provider("ollama", model=os.environ["LLM_FALLBACK_MODEL"], timeout=timeout,
+                                        max_connections=connections))
+    llm = ResilientProvider(backends, metrics=metrics)
+    # LLM_ESCALATION_MODEL ativa o roteamento: LLM_MODEL analisa tudo e esse modelo maior confirma
+    # os "drop" e os vereditos com confiança abaixo de ROUTER_CONFIDENCE
+    if os.environ.get("LLM_ESCALATION_MODEL"):
+        large = ResilientProvider([create_provider("ollama", model=os.environ["LLM_ESCALATION_MODEL"], timeout=timeout,
+                                                   max_connections=connections)],
+                                  metrics=metrics)
+        llm = ModelRouter(llm, large, confidence_threshold=float(os.environ.get("ROUTER_CONFIDENCE", "0.8")),
+                          metrics=metrics)
+    # RESULTS_PATH grava um registro por fluxo concluído nesse diretório, em RESULTS_FORMAT
+    # (jsonl ou columnar), com segmentos de até RESULTS_MAX_MB
+    results_sink = None
+    if os.environ.get("RESULTS_PATH"):
+        results_sink = ResultsSink(os.environ["RESULTS_PATH"], format=os.environ.get("RESULTS_FORMAT", "jsonl"),
+                                   max_bytes=int(float(os.environ.get("RESULTS_MAX_MB", "64")) * (1 << 20)),
+                                   metrics=metrics)
+    # RULE_AGGREGATE_MIN_HOSTS liga a agregação de regras: esse número de /32 bloqueados no mesmo
+    # /RULE_AGGREGATE_PREFIX_LEN (padrão 24) vira uma regra do prefixo inteiro (padrão: desligada)
+    rule_manager = AclRuleManager(
+        aggregate_prefix_len=int(os.environ.get("RULE_AGGREGATE_PREFIX_LEN", "24")),
+        aggregate_min_hosts=int(os.environ["RULE_AGGREGATE_MIN_HOSTS"]) if os.environ.get("RULE_AGGREGATE_MIN_HOSTS") else None)
+    # CONTROLLER_CONSOLE é a fração dos fluxos com mensagens no console (padrão 0: nenhuma)
+    console_sample = float(os.environ.get("CONTROLLER_CONSOLE", "0"))
+    # a verificação e o aquecimento do modelo rodam em segundo plano (CONTROLLER_WARMUP=0 desliga)
+    warmup = os.environ.get("CONTROLLER_WARMUP", "1") != "0"
+    try:
+        ctrl = Controller(llm=llm, verdict_cache=cache,
+                          prefilter=StatisticalPrefilter(), rule_manager=rule_manager, metrics=metrics,
+                          case_memory=case_memory, stream=stream, sketches=sketches,
+                          admission=admission, warmup=warmup, results_sink=results_sink,
+                          console_sample=console_sample)
+        ctrl.wait_ready()
+    except ProviderError as e:
+        print(f"Erro ao inicializar o provider LLM: {e}")
+        raise SystemExit(1)
+    # CONTROLLER_READY_FILE é criado quando o controlador já pode responder: é o sinal
+    # de prontidão esperado pelo MininetSimulator antes de iniciar a contagem do tráfego
+    if os.environ.get("CONTROLLER_READY_FILE"):
+        with open(os.environ["CONTROLLER_READY_FILE"], "w", encoding="utf8") as file:
+            file.write(f"{os.getpid()}\n")
+    # LLM_BATCH_SIZE > 1 agrupa vários fluxos por prompt (micro-lotes)
+    batch_size = int(os.environ.get("LLM_BATCH_SIZE", "1"))
+    # PCAP_PATH (arquivos separados por os.pathsep) troca os fluxos sintéticos pelos de capturas
+    # pcap/pcapng, reproduzidas na velocidade PCAP_SPEED (1 = tempo gravado, 0 = sem espera)
+    flow_source = None
+    if os.environ.get("PCAP_PATH"):
+        flow_source = pcap_flows(os.environ["PCAP_PATH"].split(os.pathsep),
+                                 speed=float(os.environ.get("PCAP_SPEED", "1")))
+    if concurrency > 1 or batch_size > 1 or admission is not None or flow_source is not None:
+        ctrl.run_async_controller(concurrency=concurrency, batch_size=batch_size, flow_source=flow_source)
+    else:
+        ctrl.run_simulated_controller()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,27 @@
+"""Regras determinísticas de detecção, sem LLM.
+
+Usadas como política de fallback do Controller (providers.heuristic_verdict) quando
+nenhum backend responde, e pelo servidor local mock_llm_server.py para gerar as
+respostas do stub. heuristic_response() devolve o JSON no formato pedido à LLM em
+prompts.json.
+"""
+
+SUSPICIOUS_PORTS = {21, 22, 23, 25, 3306, 6667, 9999}
+# IPs ou portas de destino distintos (source_stats) a partir dos quais a origem é tratada como varredura
+SCAN_FANOUT = 50
+
+
+def heuristic_response(flow_data: dict) -> dict:
+    """Veredito heurístico: volume alto, volume médio em porta sensível ou varredura."""
+    packet_count = flow_data.get("packet_count", 0)
+    anomalous = packet_count >= 10 or (packet_count > 5 and flow_data.get("dst_port") in SUSPICIOUS_PORTS)
+    source_stats = flow_data.get("source_stats") or {}
+    if not anomalous and max(source_stats.get("distinct_dst_ips", 0), source_stats.get("distinct_dst_ports", 0)) >= SCAN_FANOUT:
+        return {"anomaly_detected": True, "action": "drop", "confidence": 0.9, "target_ip": flow_data.get("src_ip"),
+                "description": "Origem com muitos destinos distintos: varredura (heurística)."}
+    # mesma ordem de campos pedida em prompts.json: os campos de decisão antes da descrição
+    if anomalous:
+        return {"anomaly_detected": True, "action": "drop", "confidence": 0.95, "target_ip": flow_data.get("src_ip"),
+                "description": "Volume de tráfego anômalo (heurística)."}
+    return {"anomaly_detected": False, "action": "none", "confidence": 0.85 if packet_count > 3 else 0.95,
+            "target_ip": flow_data.get("src_ip"), "description": "Nenhuma anomalia detectada (heurística)."}
@@ -4,20 +4,30 @@
 Modos:
   - subprocess: usa MininetSimulator para iniciar o script `controller.py` como subprocesso.
   - inprocess: instancia `Controller` em um processo filho (multiprocessing) e o executa.
+    Com --workers N > 1, os fluxos são distribuídos por hash do src_ip entre N processos
+    Controller, e as regras de todos eles são aplicadas por um único atuador. Cada shard
+    grava seus registros em <--results-dir>/shard-<n>.
 
 Exemplos:
   python3 src/main.py --mode subprocess --duration 60
   python3 src/main.py --mode inprocess --duration 60 --provider openai --api-key <KEY>
+  python3 src/main.py --mode inprocess --workers 4 --rate 200 --provider ollama --model gemma3:4b
+  python3 src/main.py --mode inprocess --console-sample 0.1 --results-dir /tmp/results --results-format columnar
 """
 
 import argparse
 import sys
 import time
 import os
+import zlib
+import queue
+import threading
 import multiprocessing
-import importlib.util
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from mininet_setup import MininetSimulator
+from rule_manager import AclRuleManager, simulate_p4_batch_write
+from traffic_generator import TrafficGenerator
 
 
 def run_subprocess_mode(controller_path: str, duration: int):
@@ -26,22 +36,47 @@ def run_subprocess_mode(controller_path: str, duration: int):
     sim.run()
 
 
-def run_inprocess_mode(api_key: str | None, provider: str | None, model: str | None, duration: int):
-    # Carrega Controller dinamicamente a partir do arquivo src/class/controller.py
+def _run_controller(api_key: str | None, provider: str | None, model: str | None, base_url: str | None,
+                    ready: multiprocessing.Event, console_sample: float = 0.0, results_dir: str | None = None,
+                    results_format: str = "jsonl", sketches: bool = True) -> None:
+    from controller import Controller
+    from results_sink import ResultsSink
+    from sketches import SourceSketches
 
-    controller_file = os.path.join(os.path.dirname(__file__), 'class', 'controller.py')
-    spec = importlib.util.spec_from_file_location('class_controller', controller_file)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)  # type: ignore
-    Controller = getattr(module, 'Controller')
+    results_sink = ResultsSink(results_dir, format=results_format) if results_dir else None
+    ctrl = Controller(api_key=api_key, provider=provider, model=model, base_url=base_url, warmup=True,
+                      results_sink=results_sink, console_sample=console_sample,
+                      sketches=SourceSketches() if sketches else None)
+    ctrl.wait_ready()
+    ready.set()
+    ctrl.run_simulated_controller()
 
-    def _target(a_key, prov):
-        ctrl = Controller(api_key=a_key, provider=prov, model=model)
-        ctrl.run_simulated_controller()
 
-    p = multiprocessing.Process(target=_target, args=(api_key, provider), daemon=False)
+def _wait_ready(events: list, processes: list, timeout: float) -> bool:
+    """Espera todos os `events` de prontidão; False se um processo terminar ou `timeout` vencer."""
+    deadline = time.monotonic() + timeout
+    for event in events:
+        while not event.wait(0.05):
+            if any(not p.is_alive() for p in processes) or time.monotonic() >= deadline:
+                return False
+    return True
+
+
+def run_inprocess_mode(api_key: str | None, provider: str | None, model: str | None, duration: int,
+                       base_url: str | None = None, ready_timeout: float = 120.0, console_sample: float = 0.0,
+                       results_dir: str | None = None, results_format: str = "jsonl", sketches: bool = True):
+    ready = multiprocessing.Event()
+    p = multiprocessing.Process(target=_run_controller, daemon=False,
+                                args=(api_key, provider, model, base_url, ready, console_sample, results_dir,
+                                      results_format, sketches))
+    started_at = time.monotonic()
     p.start()
     try:
+        # a duração só começa a contar quando o Controller já aqueceu o modelo
+        if not _wait_ready([ready], [p], ready_timeout):
+            print("O Controller não ficou pronto (encerrado ou tempo esgotado).")
+            return
+        print(f"Controller pronto em {time.monotonic() - started_at:.2f}s.")
         print(f"Executando Controller em processo separado por {duration} segundos...")
         time.sleep(duration)
     finally:
@@ -50,23 +85,220 @@ def run_inprocess_mode(api_key: str | None, provider: str | None, model: str | N
         p.join(timeout=5)
 
 
+def shard_for(src_ip: str, workers: int) -> int:
+    """Shard responsável por `src_ip` (estável entre processos, ao contrário de hash())."""
+    return zlib.crc32(src_ip.encode()) % workers
+
+
+def _run_shard_worker(shard: int, api_key: str | None, provider: str | None, model: str | None, base_url: str | None,
+                      concurrency: int, flows_in: multiprocessing.Queue, verdicts_out: multiprocessing.Queue,
+                      ready: multiprocessing.Event, console_sample: float = 0.0, results_dir: str | None = None,
+                      results_format: str = "jsonl", sketches: bool = True) -> None:
+    """Processo de um shard: analisa os lotes de fluxos recebidos, com até `concurrency`
+    lotes em análise ao mesmo tempo, e envia os vereditos ao atuador."""
+    from controller import Controller
+    from prefilter import StatisticalPrefilter
+    from results_sink import ResultsSink
+    from sketches import SourceSketches
+    from verdict_cache import VerdictCache
+
+    # o estado por origem (pré-filtro, cache, sketches) fica local ao shard: todos os fluxos
+    # de um src_ip caem no mesmo shard; os registros vão para um subdiretório por shard
+    results_sink = (ResultsSink(os.path.join(results_dir, f"shard-{shard}"), format=results_format)
+                    if results_dir else None)
+    ctrl = Controller(api_key=api_key, provider=provider, model=model, base_url=base_url,
+                      verdict_cache=VerdictCache(), prefilter=StatisticalPrefilter(), warmup=True,
+                      sketches=SourceSketches() if sketches else None, results_sink=results_sink,
+                      console_sample=console_sample)
+    ctrl.wait_ready()
+    ready.set()
+    pending = {}  # future -> lote de fluxos
+
+    def send(future) -> None:
+        flows = pending.pop(future)
+        try:
+            verdicts = future.result()
+        except Exception as e:
+            print(f"[Shard {shard}] Erro ao analisar fluxos: {e}")
+            verdicts = [{"action": "none"}] * len(flows)
+        for flow_data, verdict in zip(flows, verdicts):
+            # a regra é aplicada pelo atuador; aqui o drop conta como pedido a ele
+            ctrl.record_result(flow_data, verdict, "requested" if verdict.get("action") == "drop" else "none")
+        verdicts_out.put([(flow_data["flow_id"], verdict) for flow_data, verdict in zip(flows, verdicts)])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while (flows := flows_in.get()) is not None:
+            if len(pending) >= concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    send(future)
+            pending[executor.submit(ctrl.detect_anomalies, flows)] = flows
+
+        for future in list(pending):
+            send(future)
+    ctrl.shutdown()
+    verdicts_out.put(None)
+
+
+class ShardActuator(threading.Thread):
+    """Atuador único: recebe os vereditos de todos os shards e escreve as regras
+    pelo AclRuleManager (deduplicação e lotes valem para o conjunto dos shards)."""
+
+    def __init__(self, verdicts_in: multiprocessing.Queue, workers: int):
+        super().__init__(daemon=True)
+        self.verdicts_in = verdicts_in
+        self.workers = workers
+        self.rule_manager = AclRuleManager()
+        self.verdicts = 0
+        self.drops = 0
+
+    def _flush(self, force: bool = False) -> None:
+        if force or self.rule_manager.due():
+            updates = self.rule_manager.collect_updates()
+            if updates:
+                simulate_p4_batch_write(self.rule_manager.table_name, updates)
+
+    def run(self) -> None:
+        finished = 0
+        while finished < self.workers:
+            try:
+                results = self.verdicts_in.get(timeout=self.rule_manager.flush_interval)
+            except queue.Empty:
+                self._flush()
+                continue
+            if results is None:
+                finished += 1
+                continue
+            for flow_id, verdict in results:
+                self.verdicts += 1
+                if verdict.get("action") == "drop":
+                    self.drops += 1
+                    self.rule_manager.request_drop(verdict["src_ip"])
+            self._flush()
+        self._flush(force=True)
+
+
+def run_sharded_mode(api_key: str | None, provider: str | None, model: str | None, duration: int,
+                     workers: int, concurrency: int, rate: float, base_url: str | None = None,
+                     chunk_size: int = 32, seed: int = 0, ready_timeout: float = 120.0, console_sample: float = 0.0,
+                     results_dir: str | None = None, results_format: str = "jsonl", sketches: bool = True):
+    """Despacha fluxos sintéticos por hash do src_ip para `workers` processos Controller."""
+    flow_queues = [multiprocessing.Queue(maxsize=concurrency * 4) for _ in range(workers)]
+    verdict_queue = multiprocessing.Queue()
+    ready = [multiprocessing.Event() for _ in range(workers)]
+    processes = [
+        multiprocessing.Process(target=_run_shard_worker, daemon=False,
+                                args=(shard, api_key, provider, model, base_url, concurrency,
+                                      flow_queues[shard], verdict_queue, ready[shard], console_sample,
+                                      results_dir, results_format, sketches))
+        for shard in range(workers)
+    ]
+    started_at = time.monotonic()
+    for p in processes:
+        p.start()
+    # o despacho (e a contagem da duração) só começa com todos os shards prontos
+    if not _wait_ready(ready, processes, ready_timeout):
+        print("Algum shard do Controller não ficou pronto (encerrado ou tempo esgotado).")
+        for p in processes:
+            p.terminate()
+            p.join(timeout=5)
+        return
+    print(f"Shards prontos em {time.monotonic() - started_at:.2f}s.")
+    actuator = ShardActuator(verdict_queue, workers)
+    actuator.start()
+
+    # reserva parte da duração para os shards terminarem o que já está em análise
+    start = time.monotonic()
+    grace = min(5.0, duration * 0.2)
+    dispatch_until = start + duration - grace
+    buffers = [[] for _ in range(workers)]
+    generated = 0
+    dispatched = 0
+    shed = 0  # fluxos descartados porque a fila do shard continuou cheia
+    print(f"Executando {workers} shards do Controller por {duration} segundos...")
+    try:
+        for flow_data in TrafficGenerator(seed=seed, chunk_size=4096).flows():
+            now = time.monotonic()
+            if now >= dispatch_until:
+                break
+            if rate > 0:
+                delay = start + generated / rate - now
+                if delay > 0:
+                    time.sleep(delay)
+            shard = shard_for(flow_data["src_ip"], workers)
+            buffers[shard].append(flow_data)
+            generated += 1
+            # com taxa baixa, envia cada fluxo imediatamente; com taxa alta, em pedaços
+            if len(buffers[shard]) >= (chunk_size if rate == 0 or rate > 1000 else 1):
+                # espera a fila do shard (contrapressão) até o fim do despacho
+                try:
+                    flow_queues[shard].put(buffers[shard], timeout=max(dispatch_until - time.monotonic(), 0.01))
+                    dispatched += len(buffers[shard])
+                except queue.Full:
+                    shed += len(buffers[shard])
+                buffers[shard] = []
+    finally:
+        print("Parando os shards do Controller...")
+        for shard in range(workers):
+            if buffers[shard]:
+                try:
+                    flow_queues[shard].put(buffers[shard], timeout=0.1)
+                    dispatched += len(buffers[shard])
+                except queue.Full:
+                    shed += len(buffers[shard])
+            try:
+                flow_queues[shard].put(None, timeout=max(start + duration - time.monotonic(), 0.1))
+            except queue.Full:
+                pass  # o shard será terminado ao fim da duração
+        deadline = start + duration
+        for p in processes:
+            p.join(timeout=max(deadline - time.monotonic(), 0.1))
+            if p.is_alive():
+                p.terminate()
+                p.join(timeout=5)
+        actuator.join(timeout=max(deadline - time.monotonic(), 0.1))
+        print(f"Fluxos despachados: {dispatched}  descartados (fila cheia): {shed}  vereditos: {actuator.verdicts}  drops: {actuator.drops}")
+        print(f"[Regras] Estatísticas: {actuator.rule_manager.stats()}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Runner para P4-and-LLM (simulação)")
     parser.add_argument('--mode', choices=['subprocess', 'inprocess'], default='subprocess', help='Modo de execução')
     parser.add_argument('--duration', type=int, default=60, help='Duração da simulação em segundos')
     parser.add_argument('--controller-path', type=str, default=None, help='Caminho para controller.py (apenas subprocess)')
-    parser.add_argument('--provider', type=str, default=None, help='Provider LLM (ex: openai) para modo inprocess')
+    parser.add_argument('--provider', type=str, default=None, help='Provider LLM (openai, ollama ou stub) para modo inprocess')
     parser.add_argument('--api-key', type=str, default=None, help='Chave de API para o provider')
     parser.add_argument('--model', type=str, default=None, help='Identificador do modelo dentro da API do provedor requisitado')
+    parser.add_argument('--base-url', type=str, default=None, help='URL de um servidor compatível (ex: src/mock_llm_server.py)')
+    parser.add_argument('--workers', type=int, default=1, help='Número de processos Controller (shards por src_ip) no modo inprocess')
+    parser.add_argument('--concurrency', type=int, default=4, help='Análises simultâneas por shard (modo --workers)')
+    parser.add_argument('--rate', type=float, default=50.0, help='Fluxos/s despachados aos shards; 0 = o mais rápido possível')
+    parser.add_argument('--console-sample', type=float, default=0.0, help='Fração dos fluxos com mensagens no console (0 = nenhuma, 1 = todas)')
+    parser.add_argument('--results-dir', type=str, default=None, help='Diretório dos registros por fluxo (ResultsSink)')
+    parser.add_argument('--results-format', choices=['jsonl', 'columnar'], default='jsonl', help='Formato dos registros por fluxo')
+    parser.add_argument('--no-sketches', action='store_true', help='Desliga o contexto por origem (source_stats) dos fluxos')
 
     args = parser.parse_args()
 
     controller_path = args.controller_path or os.path.join(os.path.dirname(__file__), 'controller.py')
 
     if args.mode == 'subprocess':
+        # o controller.py lê as mesmas opções do ambiente
+        os.environ["CONTROLLER_CONSOLE"] = str(args.console_sample)
+        if args.results_dir:
+            os.environ.update(RESULTS_PATH=args.results_dir, RESULTS_FORMAT=args.results_format)
+        if args.no_sketches:
+            os.environ["SOURCE_SKETCHES_DISABLED"] = "1"
         run_subprocess_mode(controller_path=controller_path, duration=args.duration)
+    elif args.workers > 1:
+        run_sharded_mode(api_key=args.api_key, provider=args.provider, model=args.model, duration=args.duration,
+                         workers=args.workers, concurrency=args.concurrency, rate=args.rate, base_url=args.base_url,
+                         console_sample=args.console_sample, results_dir=args.results_dir,
+                         results_format=args.results_format, sketches=not args.no_sketches)
     else:
-        run_inprocess_mode(api_key=args.api_key, provider=args.provider, duration=args.duration)
+        run_inprocess_mode(api_key=args.api_key, provider=args.provider, model=args.model, duration=args.duration,
+                           base_url=args.base_url, console_sample=args.console_sample, results_dir=args.results_dir,
+                           results_format=args.results_format, sketches=not args.no_sketches)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+# Limites dos histogramas (s): potências de 2 de ~1 µs a ~67 s
+BUCKET_BOUNDS = tuple(2.0 ** exp for exp in range(-20, 7))
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: Optional[tuple] = None) -> str:
+    items = list(key) + list(extra or ())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Histogram:
+    """Histograma com limites fixos; observe() é O(log buckets)."""
+
+    __slots__ = ("counts", "total", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(BUCKET_BOUNDS, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimativa do quantil `q` (limite superior do bucket que o contém)."""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else float("inf")
+        return float("inf")
+
+
+class _StageTimer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Registro de métricas do Controller: histogramas de duração por estágio,
+    contadores e gauges (lidos por callables no momento da coleta).
+
+    Com enabled=False, todas as operações retornam imediatamente e stage() devolve
+    um context manager vazio: a instrumentação pode ficar no código sem custo.
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "controller"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._stages: dict = {}
+        self._counters: dict = {}
+        self._gauges: dict = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        """Context manager que mede a duração do estágio `name`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, Histogram())
+        return _StageTimer(histogram)
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Registra uma duração já medida para o estágio `name`."""
+        if not self.enabled:
+            return
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name: str, fn: Callable[[], float], **labels) -> None:
+        """Registra um gauge cujo valor é lido de `fn()` a cada coleta."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _labels_key(labels))] = fn
+
+    def remove_gauge(self, name: str, **labels) -> None:
+        with self._lock:
+            self._gauges.pop((name, _labels_key(labels)), None)
+
+    def _gauge_values(self) -> list:
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = []
+        for key, fn in gauges:
+            try:
+                values.append((key, float(fn())))
+            except Exception:
+                continue
+        return values
+
+    def snapshot(self) -> dict:
+        """Estado atual em formato JSON-serializável."""
+        with self._lock:
+            counters = dict(self._counters)
+            stages = dict(self._stages)
+        return {
+            "timestamp": time.time(),
+            "stages": {
+                name: {
+                    "count": h.count,
+                    "sum_s": h.total,
+                    "mean_s": h.total / h.count if h.count else None,
+                    "p50_s": h.quantile(0.5),
+                    "p95_s": h.quantile(0.95),
+                    "p99_s": h.quantile(0.99),
+                }
+                for name, h in stages.items()
+            },
+            "counters": {name + _format_labels(labels): value for (name, labels), value in counters.items()},
+            "gauges": {name + _format_labels(labels): value for (name, labels), value in self._gauge_values()},
+        }
+
+    def prometheus_text(self) -> str:
+        """Exposição no formato de texto do Prometheus."""
+        with self._lock:
+            counters = dict(self._counters)
+            stages = dict(self._stages)
+
+        lines = []
+        stage_metric = f"{self.prefix}_stage_duration_seconds"
+        lines.append(f"# TYPE {stage_metric} histogram")
+        for name, h in sorted(stages.items()):
+            stage = (("stage", name),)
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS, h.counts):
+                cumulative += count
+                lines.append(f"{stage_metric}_bucket{_format_labels(stage, (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{stage_metric}_bucket{_format_labels(stage, (('le', '+Inf'),))} {h.count}")
+            lines.append(f"{stage_metric}_sum{_format_labels(stage)} {h.total}")
+            lines.append(f"{stage_metric}_count{_format_labels(stage)} {h.count}")
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {self.prefix}_{name} counter")
+            for (counter, labels), value in counters.items():
+                if counter == name:
+                    lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {value}")
+
+        gauges = self._gauge_values()
+        for name in sorted({name for (name, _), _ in gauges}):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            for (gauge, labels), value in gauges:
+                if gauge == name:
+                    lines.append(f"{self.prefix}_{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Endpoint HTTP local: /metrics (texto Prometheus) e /metrics.json (snapshot)."""
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9100):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = metrics.prometheus_text().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(metrics.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class SnapshotWriter:
+    """Grava periodicamente metrics.snapshot() em `path` (JSON, escrita atômica)."""
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+
+    def write(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as file:
+            json.dump(self.metrics.snapshot(), file)
+        os.replace(tmp_path, self.path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self) -> "SnapshotWriter":
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.write()
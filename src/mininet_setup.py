@@ -1,5 +1,7 @@
 import os
+import sys
 import time
+import tempfile
 import subprocess
 from typing import Optional
 
@@ -12,15 +14,25 @@ class MininetSimulator:
     """Simulador mínimo que inicia o controlador simulado em segundo plano.
 
     Métodos:
-        start() -> Inicia o processo do controlador em background e retorna o Popen.
-        stop()  -> Termina o processo iniciado por start().
-        run()   -> Ativa start(), espera `duration` segundos e então para o processo.
+        start()      -> Inicia o processo do controlador em background e retorna o Popen.
+        wait_ready() -> Espera o controlador sinalizar que já pode responder.
+        stop()       -> Termina o processo iniciado por start().
+        run()        -> Ativa start(), espera a prontidão, espera `duration` segundos e
+                        então para o processo.
+
+    A prontidão é sinalizada pelo controlador criando o arquivo indicado na variável de
+    ambiente CONTROLLER_READY_FILE, depois de verificar e aquecer o modelo. Assim a
+    contagem de `duration` só começa quando os fluxos já podem ser analisados.
     """
 
-    def __init__(self, controller_path: Optional[str] = None, duration: int = 60):
+    def __init__(self, controller_path: Optional[str] = None, duration: int = 60, ready_timeout: float = 120.0):
         self.controller_path = controller_path or DEFAULT_CONTROLLER_PATH
         self.duration = duration
+        self.ready_timeout = ready_timeout
+        self.startup_seconds: Optional[float] = None
         self._process: Optional[subprocess.Popen] = None
+        self._ready_file: Optional[str] = None
+        self._started_at = 0.0
 
     def start(self) -> subprocess.Popen:
         """Inicia o controlador simulado em segundo plano.
@@ -28,11 +40,31 @@ class MininetSimulator:
         Retorna o objeto subprocess.Popen do processo iniciado.
         """
         print("*** Iniciando o controlador simulado em segundo plano (sem Mininet real) ***\n")
-        # Inicia o controlador Python simulado em segundo plano
-        self._process = subprocess.Popen(["python3", self.controller_path])
+        fd, self._ready_file = tempfile.mkstemp(prefix="controller-ready-")
+        os.close(fd)
+        os.remove(self._ready_file)
+        env = dict(os.environ, CONTROLLER_READY_FILE=self._ready_file)
+        # Inicia o controlador Python simulado em segundo plano, com o mesmo interpretador
+        self._started_at = time.monotonic()
+        self._process = subprocess.Popen([sys.executable, self.controller_path], env=env)
         print("*** Controlador simulado em execução. ***\n")
         return self._process
 
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Espera o controlador criar o arquivo de prontidão.
+
+        Retorna False se o processo terminar ou `timeout` (padrão: `ready_timeout`) vencer antes.
+        """
+        if self._process is None:
+            return False
+        deadline = time.monotonic() + (self.ready_timeout if timeout is None else timeout)
+        while not os.path.exists(self._ready_file):
+            if self._process.poll() is not None or time.monotonic() >= deadline:
+                return False
+            time.sleep(0.02)
+        self.startup_seconds = time.monotonic() - self._started_at
+        return True
+
     def stop(self) -> None:
         """Termina o processo do controlador simulado iniciado por start()."""
         if self._process is None:
@@ -50,11 +82,17 @@ class MininetSimulator:
         finally:
             print("*** Controlador simulado terminado. ***\n")
             self._process = None
+            if self._ready_file is not None and os.path.exists(self._ready_file):
+                os.remove(self._ready_file)
 
     def run(self) -> None:
         """Executa a simulação completa: start() -> sleep(duration) -> stop()."""
         proc = self.start()
         try:
+            if not self.wait_ready():
+                print("*** O controlador não ficou pronto (encerrado ou tempo esgotado). ***\n")
+                return
+            print(f"*** Controlador pronto em {self.startup_seconds:.2f}s. ***\n")
             print(f"*** A simulação será executada por {self.duration} segundos. ***\n")
             time.sleep(self.duration)
         finally:
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Servidor LLM local (stub) compatível com as APIs OpenAI e Ollama.
+
+Responde aos prompts do Controller com vereditos determinísticos, após uma latência
+configurável (média + jitter), para medir o controlador sem GPU e sem rede. Com
+`token_ms`, a resposta é gerada em pedaços de TOKEN_CHARS caracteres, cada um levando
+`token_ms` ms; pedidos com "stream": true recebem os pedaços à medida que são gerados.
+Com `failure_rate`, essa fração dos pedidos (apenas para `failure_models`, se
+informado) recebe HTTP 503, simulando instabilidade do backend. `model_latency_ms` e
+`model_error_rates` dão a modelos específicos outra latência média e uma fração de
+vereditos errados, para simular níveis de modelo (pequeno e rápido x grande e preciso).
+Com `load_ms`, o primeiro pedido a cada modelo demora mais esse tempo (carga do modelo).
+
+Endpoints:
+  - POST /v1/chat/completions, GET /v1/models  (OpenAI)
+  - POST /api/chat, GET /api/tags               (Ollama)
+
+Exemplo:
+  python3 src/mock_llm_server.py --port 11500 --latency-ms 300 --jitter-ms 100
+"""
+
+import ast
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from heuristics import heuristic_response
+
+
+TOKEN_CHARS = 4
+
+
+def stub_verdict(flow_data: dict) -> dict:
+    """Veredito do stub: as regras de heuristics.py, as mesmas do fallback do Controller."""
+    return heuristic_response(flow_data)
+
+
+def mistaken_verdict(verdict: dict, rng: random.Random) -> dict:
+    """Veredito invertido, com a confiança mais baixa que um modelo pequeno costuma dar a um erro."""
+    drop = verdict["action"] != "drop"
+    return dict(verdict, anomaly_detected=drop, action="drop" if drop else "none",
+                confidence=round(rng.uniform(0.4, 0.9), 2))
+
+
+def stub_completion(messages: list, error_rate: float = 0.0, rng: Optional[random.Random] = None) -> str:
+    """Gera o conteúdo da resposta a partir da mensagem com os dados de fluxo.
+
+    Com `error_rate`, essa fração dos vereditos sai invertida (ver mistaken_verdict()).
+    """
+    rng = rng or random.Random()
+
+    def verdict(flow_data: dict) -> dict:
+        result = stub_verdict(flow_data)
+        return mistaken_verdict(result, rng) if error_rate > 0 and rng.random() < error_rate else result
+
+    for message in messages:
+        content = message.get("content", "")
+        if content.startswith("["):
+            flows = json.loads(content)
+            return json.dumps({"verdicts": [dict(verdict(f), flow_id=f.get("flow_id")) for f in flows]})
+        if content.startswith("{"):
+            try:
+                flow_data = ast.literal_eval(content)
+            except (ValueError, SyntaxError):
+                continue
+            if isinstance(flow_data, dict):
+                return json.dumps(verdict(flow_data))
+    return json.dumps({"anomaly_detected": False, "action": "none", "target_ip": "", "description": "Sem dados de fluxo."})
+
+
+class MockLLMServer:
+    """Servidor HTTP em thread própria; use start()/stop() ou como context manager."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 seed: Optional[int] = None, token_ms: float = 0.0, failure_rate: float = 0.0,
+                 failure_models: Optional[set] = None, model_latency_ms: Optional[dict] = None,
+                 model_error_rates: Optional[dict] = None, load_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.failure_rate = failure_rate
+        self.failure_models = failure_models
+        self.model_latency_ms = model_latency_ms or {}
+        self.model_error_rates = model_error_rates or {}
+        self.load_ms = load_ms
+        self._loaded: set = set()
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                # clientes que fecham conexões keep-alive ociosas não são erro do stub
+                try:
+                    super().handle()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+            def _send_json(self, payload: dict, status: int = 200) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, content_type: str, pieces, render) -> None:
+                """Envia cada pedaço assim que gerado (Transfer-Encoding: chunked)."""
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for piece in pieces:
+                    self._send_chunk(render(piece))
+                self._send_chunk(render(None))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if self.path.endswith("/models"):
+                    self._send_json({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "local"}]})
+                elif self.path == "/api/tags":
+                    self._send_json({"models": [{"name": "stub", "model": "stub"}]})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                model = request.get("model", "stub")
+                if server._should_fail(model):
+                    self._send_json({"error": {"message": "stub indisponível (falha simulada)"}}, 503)
+                    return
+                server._simulate_latency(model)
+                with server._lock:
+                    rng = random.Random(server._random.random())
+                content = stub_completion(request.get("messages", []), server.model_error_rates.get(model, 0.0), rng)
+                pieces = server._generate(content)
+                if request.get("stream"):
+                    created = int(time.time())
+                    if self.path.endswith("/chat/completions"):
+                        def render(piece):
+                            if piece is None:
+                                return (b"data: " + json.dumps({
+                                    "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                                    "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                                }).encode() + b"\n\ndata: [DONE]\n\n")
+                            return b"data: " + json.dumps({
+                                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                                "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                            }).encode() + b"\n\n"
+                        self._stream("text/event-stream", pieces, render)
+                    elif self.path == "/api/chat":
+                        created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                        def render(piece):
+                            return json.dumps({
+                                "model": model, "created_at": created_at,
+                                "message": {"role": "assistant", "content": piece or ""},
+                                "done": piece is None,
+                            }).encode() + b"\n"
+                        self._stream("application/x-ndjson", pieces, render)
+                    else:
+                        self._send_json({"error": "not found"}, 404)
+                    return
+
+                # sem streaming, a resposta só sai depois de gerada por inteiro
+                for _ in pieces:
+                    pass
+
+                if self.path.endswith("/chat/completions"):
+                    self._send_json({
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    })
+                elif self.path == "/api/chat":
+                    self._send_json({
+                        "model": model,
+                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        "message": {"role": "assistant", "content": content},
+                        "done": True,
+                    })
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def ollama_host(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _simulate_latency(self, model: str) -> None:
+        with self._lock:
+            self.requests += 1
+            delay = self.model_latency_ms.get(model, self.latency_ms) + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            if model not in self._loaded:
+                # o primeiro pedido a um modelo paga a carga dele na memória
+                self._loaded.add(model)
+                delay += self.load_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _should_fail(self, model: str) -> bool:
+        if self.failure_rate <= 0 or (self.failure_models is not None and model not in self.failure_models):
+            return False
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+            self.failures += fail
+        return fail
+
+    def _generate(self, content: str):
+        """Gera `content` em pedaços, com `token_ms` ms por pedaço."""
+        for start in range(0, len(content), TOKEN_CHARS):
+            if self.token_ms > 0:
+                time.sleep(self.token_ms / 1000)
+            yield content[start:start + TOKEN_CHARS]
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor LLM local (stub) para testes e benchmarks")
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='Endereço de escuta')
+    parser.add_argument('--port', type=int, default=11500, help='Porta de escuta')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Latência média por requisição (ms)')
+    parser.add_argument('--jitter-ms', type=float, default=50.0, help='Variação uniforme da latência (± ms)')
+    parser.add_argument('--token-ms', type=float, default=0.0, help=f'Tempo de geração de cada {TOKEN_CHARS} caracteres (ms)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fração dos pedidos respondida com HTTP 503')
+    parser.add_argument('--load-ms', type=float, default=0.0, help='Tempo extra do primeiro pedido a cada modelo (ms)')
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, args.latency_ms, args.jitter_ms, token_ms=args.token_ms,
+                           failure_rate=args.failure_rate, load_ms=args.load_ms)
+    print(f"Servidor LLM stub em http://{args.host}:{server.port} (OpenAI: /v1, Ollama: /api)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""Leitura de capturas pcap/pcapng como as digests FlowDigest_t de flow_collector.p4.
+
+O arquivo é mapeado em memória (mmap) e lido em lotes: só a posição de cada pacote é
+encontrada em Python; os campos são extraídos de todos os pacotes do lote de uma vez
+com NumPy, direto do mapeamento, sem copiar o conteúdo dos pacotes.
+
+A análise reproduz o `Parser` do P4:
+  - Ethernet com type 0x0800 -> IPv4 (cabeçalho fixo de 20 bytes: o parser do P4
+    não considera o IHL, então opções IP são lidas como início do TCP/UDP);
+  - protocol 6 -> TCP, 17 -> UDP; as portas vêm do cabeçalho extraído;
+  - diferença proposital: a digest do P4 copia srcPort/dstPort de hdr.tcp, que é
+    inválido em UDP, e reporta portas 0; aqui os fluxos UDP mantêm as portas do
+    cabeçalho UDP (a chave de fluxo e as heurísticas do Controller as usam).
+    Com udp_ports=False (--p4-ports), as portas UDP saem 0, como no plano de dados;
+  - outros protocolos IPv4 (ICMP...) geram digest com portas 0, como a tabela
+    flow_stats com hdr.tcp inválido; pacotes sem IPv4 não geram digest;
+  - um cabeçalho só é válido se couber inteiro nos bytes capturados;
+  - packet_length é o tamanho original do pacote (standard_metadata.packet_length).
+Além de Ethernet, aceita Linux cooked capture (SLL) e IPv4 cru (LINKTYPE_RAW/IPV4).
+
+Cada lote é uma tupla de colunas (src_ip, dst_ip, src_port, dst_port, protocol,
+packet_length, timestamps), o formato de FlowAggregator.ingest_batch. replay() entrega
+os lotes no tempo gravado, em velocidade escalada ou o mais rápido possível, e
+pcap_flows() produz os fluxos agregados para o Controller (flow_source).
+
+Exemplos:
+  python3 src/pcap_reader.py write /tmp/synthetic.pcap --flows 200000
+  python3 src/pcap_reader.py read /tmp/synthetic.pcap --aggregate
+  python3 src/pcap_reader.py read captura-*.pcapng --speed 10 --aggregate
+"""
+
+import os
+import mmap
+import time
+import struct
+import argparse
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from flow_aggregator import FlowAggregator
+
+
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+PCAPNG_IDB = 1
+PCAPNG_SPB = 3
+PCAPNG_EPB = 6
+
+# linktype -> (início do IPv4, posição do EtherType ou None quando o quadro já é IPv4)
+LINK_LAYERS = {
+    1: (14, 12),     # LINKTYPE_ETHERNET
+    113: (16, 14),   # LINKTYPE_LINUX_SLL
+    101: (0, None),  # LINKTYPE_RAW
+    228: (0, None),  # LINKTYPE_IPV4
+}
+
+ETHERTYPE_IPV4 = 0x0800
+IPV4_HEADER = 20
+TCP_HEADER = 20
+UDP_HEADER = 8
+
+
+class PcapReader:
+    """Leitor mapeado em memória de um arquivo pcap ou pcapng.
+
+    batches() gera lotes de até `batch_size` pacotes já convertidos em digests. Com
+    udp_ports=False, pacotes UDP têm portas 0, como a digest do P4. Em `stats()`: pacotes lidos, digests (pacotes IPv4), pacotes ignorados (sem IPv4 ou
+    de linktype não suportado) e bytes do arquivo percorridos.
+    """
+
+    def __init__(self, path: str, udp_ports: bool = True):
+        self.path = path
+        self.udp_ports = udp_ports
+        self._file = open(path, "rb")
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else b""
+        self._buf = np.frombuffer(self._mm, dtype=np.uint8)
+        self._views: dict = {}
+        self.packets = 0
+        self.digests = 0
+        self.skipped = 0
+        self.position = 0
+
+        if self._size < 4:
+            raise ValueError(f"{path}: arquivo vazio ou truncado.")
+        magic_le, = struct.unpack_from("<I", self._mm, 0)
+        magic_be, = struct.unpack_from(">I", self._mm, 0)
+        if magic_le == PCAPNG_SHB:
+            self.format = "pcapng"
+            self._interfaces: list = []  # (linktype, resolução do timestamp em s)
+            self._order = None
+        elif PCAP_MAGIC_US in (magic_le, magic_be) or PCAP_MAGIC_NS in (magic_le, magic_be):
+            self.format = "pcap"
+            self._order = "<" if magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS) else ">"
+            self._resolution = 1e-9 if PCAP_MAGIC_NS in (magic_le, magic_be) else 1e-6
+            if self._size < 24:
+                raise ValueError(f"{path}: cabeçalho pcap truncado.")
+            self.linktype = struct.unpack_from(self._order + "I", self._mm, 20)[0] & 0x0FFFFFFF
+            if self.linktype not in LINK_LAYERS:
+                raise ValueError(f"{path}: linktype {self.linktype} não suportado ({sorted(LINK_LAYERS)}).")
+            self.position = 24
+        else:
+            raise ValueError(f"{path}: formato desconhecido (magic 0x{magic_le:08x}).")
+
+    def _gather(self, positions: np.ndarray, dtype: str) -> np.ndarray:
+        """Lê um campo `dtype` (ex.: ">u2") em cada posição de `positions` do arquivo."""
+        view = self._views.get(dtype)
+        if view is None:
+            # visão com passo de 1 byte: o elemento i é o campo que começa no byte i
+            width = np.dtype(dtype).itemsize
+            view = self._views[dtype] = np.ndarray(shape=(self._size - width + 1,), dtype=dtype,
+                                                   buffer=self._mm, strides=(1,))
+        return view[np.minimum(positions, len(view) - 1)]
+
+    def close(self) -> None:
+        self._buf = None
+        self._views.clear()
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "PcapReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _walk_pcap(self, limit: int) -> list:
+        """Posições dos próximos `limit` registros do pcap (cabeçalho de 16 bytes)."""
+        # laço mínimo por pacote: o fim do arquivo é detectado pelo struct.error
+        unpack = struct.Struct(self._order + "8xI").unpack_from
+        mm, pos = self._mm, self.position
+        offsets = []
+        append = offsets.append
+        try:
+            for _ in range(limit):
+                append(pos)
+                pos += 16 + unpack(mm, pos)[0]
+        except struct.error:
+            pos = offsets.pop()  # cabeçalho incompleto (ou fim do arquivo)
+        if pos > self._size:
+            pos = offsets.pop()  # último registro truncado
+        self.position = pos
+        return offsets
+
+    def _section_header(self, pos: int) -> None:
+        magic, = struct.unpack_from("<I", self._mm, pos + 8)
+        order = "<" if magic == PCAPNG_BYTE_ORDER else ">"
+        if self._order is not None and order != self._order:
+            raise ValueError(f"{self.path}: seções pcapng com ordens de bytes diferentes não são suportadas.")
+        self._order = order
+        self._interfaces = []
+
+    def _interface(self, pos: int, length: int) -> None:
+        order = self._order
+        linktype, = struct.unpack_from(order + "H", self._mm, pos + 8)
+        resolution = 1e-6
+        # opções: (código, tamanho, valor alinhado a 4 bytes) até opt_endofopt
+        option, end = pos + 16, pos + length - 4
+        while option + 4 <= end:
+            code, size = struct.unpack_from(order + "HH", self._mm, option)
+            if code == 0:
+                break
+            if code == 9 and size >= 1:  # if_tsresol
+                value = self._mm[option + 4]
+                resolution = 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+            option += 4 + (size + 3) // 4 * 4
+        self._interfaces.append((linktype, resolution))
+
+    def _walk_pcapng(self, limit: int) -> list:
+        """Posições dos próximos `limit` Enhanced Packet Blocks; os demais blocos são
+        interpretados (seção, interfaces) ou ignorados."""
+        mm, end, pos = self._mm, self._size, self.position
+        if self._order is None:
+            self._section_header(pos)
+        header = struct.Struct(self._order + "II").unpack_from
+        offsets = []
+        append = offsets.append
+        count = 0
+        block = pos
+        try:
+            while count < limit:
+                block = pos
+                block_type, length = header(mm, pos)
+                pos += length
+                if block_type == PCAPNG_EPB and length >= 32:
+                    append(block)
+                    count += 1
+                elif length < 12:
+                    pos = block
+                    break  # bloco corrompido
+                elif block_type == PCAPNG_SHB:
+                    if offsets:
+                        pos = block
+                        break  # os pacotes do lote usam as interfaces da seção anterior
+                    self._section_header(block)
+                    header = struct.Struct(self._order + "II").unpack_from
+                elif block_type == PCAPNG_IDB:
+                    self._interface(block, length)
+                elif block_type == PCAPNG_SPB:
+                    self.skipped += 1  # sem timestamp: não dá para reproduzir no tempo
+        except struct.error:
+            pos = block  # cabeçalho incompleto (ou fim do arquivo)
+        if pos > end:
+            # captura truncada: o último bloco passa do fim do arquivo
+            if offsets and offsets[-1] + header(mm, offsets[-1])[1] > end:
+                offsets.pop()
+            pos = end
+        self.position = pos
+        return offsets
+
+    def _decode(self, offsets: list) -> tuple:
+        """Converte os registros em `offsets` no lote de colunas das digests."""
+        buf = self._buf
+        positions = np.array(offsets, dtype=np.int64)
+        order = self._order
+        if self.format == "pcap":
+            seconds = self._gather(positions, order + "u4").astype(np.float64)
+            fraction = self._gather(positions + 4, order + "u4")
+            timestamps = seconds + fraction * self._resolution
+            caplen = self._gather(positions + 8, order + "u4").astype(np.int64)
+            packet_length = self._gather(positions + 12, order + "u4").astype(np.uint64)
+            data = positions + 16
+            l3_offset, type_offset = LINK_LAYERS[self.linktype]
+            l3_offsets = np.full(len(positions), l3_offset, dtype=np.int64)
+            type_offsets = np.full(len(positions), -1 if type_offset is None else type_offset, dtype=np.int64)
+            supported = np.ones(len(positions), dtype=bool)
+        else:
+            interface = self._gather(positions + 8, order + "u4").astype(np.int64)
+            ticks = ((self._gather(positions + 12, order + "u4").astype(np.uint64) << np.uint64(32))
+                     | self._gather(positions + 16, order + "u4"))
+            caplen = self._gather(positions + 20, order + "u4").astype(np.int64)
+            packet_length = self._gather(positions + 24, order + "u4").astype(np.uint64)
+            data = positions + 28
+            layers = [LINK_LAYERS.get(linktype) for linktype, _ in self._interfaces] + [None]
+            interface = np.minimum(interface, len(layers) - 1)
+            supported = np.array([layer is not None for layer in layers])[interface]
+            l3_offsets = np.array([layer[0] if layer else 0 for layer in layers], dtype=np.int64)[interface]
+            type_offsets = np.array([layer[1] if layer and layer[1] is not None else -1 for layer in layers],
+                                    dtype=np.int64)[interface]
+            resolutions = np.array([resolution for _, resolution in self._interfaces] + [1e-6])[interface]
+            timestamps = ticks.astype(np.float64) * resolutions
+
+        # state start: EtherType 0x0800 (ou, sem camada de enlace, versão 4) -> parse_ipv4
+        l3 = data + l3_offsets
+        has_type = type_offsets >= 0
+        ethertype = self._gather(data + np.maximum(type_offsets, 0), ">u2")
+        version = buf[np.minimum(l3, len(buf) - 1)] >> 4
+        ipv4 = (supported & (caplen >= l3_offsets + IPV4_HEADER)
+                & np.where(has_type, ethertype == ETHERTYPE_IPV4, version == 4))
+
+        # parse_ipv4: protocol 6 -> parse_tcp, 17 -> parse_udp (cabeçalho IPv4 fixo)
+        l3 = l3[ipv4]
+        caplen = caplen[ipv4] - l3_offsets[ipv4]
+        protocol = buf[l3 + 9]
+        tcp = (protocol == 6) & (caplen >= IPV4_HEADER + TCP_HEADER)
+        udp = (protocol == 17) & (caplen >= IPV4_HEADER + UDP_HEADER)
+        l4 = l3 + IPV4_HEADER
+        ports_valid = (tcp | udp) if self.udp_ports else tcp
+        src_port = np.where(ports_valid, self._gather(l4, ">u2"), 0).astype(np.uint16)
+        dst_port = np.where(ports_valid, self._gather(l4 + 2, ">u2"), 0).astype(np.uint16)
+
+        self.packets += len(positions)
+        self.digests += int(ipv4.sum())
+        self.skipped += len(positions) - int(ipv4.sum())
+        return (self._gather(l3 + 12, ">u4").astype(np.uint32), self._gather(l3 + 16, ">u4").astype(np.uint32),
+                src_port, dst_port, protocol, packet_length[ipv4], timestamps[ipv4])
+
+    def batches(self, batch_size: int = 65536) -> Iterator[tuple]:
+        """Lotes de digests, em ordem de arquivo, até o fim da captura."""
+        walk = self._walk_pcap if self.format == "pcap" else self._walk_pcapng
+        while True:
+            offsets = walk(batch_size)
+            if not offsets:
+                return
+            batch = self._decode(offsets)
+            if len(batch[-1]):
+                yield batch
+
+    def stats(self) -> dict:
+        return {
+            "format": self.format,
+            "packets": self.packets,
+            "digests": self.digests,
+            "skipped": self.skipped,
+            "bytes_read": self.position,
+            "file_bytes": self._size,
+        }
+
+
+def read_batches(paths: Iterable[str], batch_size: int = 65536, udp_ports: bool = True) -> Iterator[tuple]:
+    """Lotes de digests de várias capturas em sequência (ex.: arquivos rotacionados)."""
+    for path in paths:
+        with PcapReader(path, udp_ports=udp_ports) as reader:
+            yield from reader.batches(batch_size)
+
+
+def replay(batches: Iterable[tuple], speed: float = 1.0) -> Iterator[tuple]:
+    """Entrega os lotes no ritmo dos timestamps gravados.
+
+    speed=1 reproduz o tempo da captura, speed=10 dez vezes mais rápido e speed=0 sem
+    espera. Um lote é dividido (em fatias, sem cópia) para que nenhuma digest seja
+    entregue antes do seu instante.
+    """
+    if not speed:
+        yield from batches
+        return
+    origin = None
+    started = 0.0
+    for batch in batches:
+        timestamps = batch[-1]
+        if origin is None:
+            origin = float(timestamps[0])
+            started = time.monotonic()
+        begin = 0
+        while begin < len(timestamps):
+            now = origin + (time.monotonic() - started) * speed
+            end = int(np.searchsorted(timestamps, now, side="right"))
+            if end <= begin:
+                time.sleep(min((float(timestamps[begin]) - now) / speed, 1.0))
+                continue
+            yield tuple(column[begin:end] for column in batch)
+            begin = end
+
+
+def pcap_flows(paths: Iterable[str], speed: float = 0.0, batch_size: int = 65536,
+               aggregator: Optional[FlowAggregator] = None, udp_ports: bool = True) -> Iterator[dict]:
+    """Fluxos agregados das capturas em `paths`, no formato do Controller (flow_source)."""
+    aggregator = aggregator if aggregator is not None else FlowAggregator()
+    yield from aggregator.stream(replay(read_batches(paths, batch_size, udp_ports), speed))
+
+
+SNAPLEN = 54  # Ethernet + IPv4 + TCP sem opções
+
+FRAME_DTYPE = np.dtype([
+    ("eth_dst", "V6"),
+    ("eth_src", "V6"),
+    ("eth_type", ">u2"),
+    ("version_ihl", "u1"),
+    ("diffserv", "u1"),
+    ("total_length", ">u2"),
+    ("identification", ">u2"),
+    ("flags_frag", ">u2"),
+    ("ttl", "u1"),
+    ("protocol", "u1"),
+    ("checksum", ">u2"),
+    ("src_ip", ">u4"),
+    ("dst_ip", ">u4"),
+    ("src_port", ">u2"),
+    ("dst_port", ">u2"),
+    ("l4_word", ">u4"),  # TCP: seqNo; UDP: length_ e checksum
+    ("ack", ">u4"),
+    ("data_offset", "u1"),
+    ("tcp_flags", "u1"),
+    ("tcp_tail", "V6"),
+])
+
+
+def synthetic_frames(flows: int, seed: int = 0, duration: float = 60.0, packet_gap: float = 0.01) -> tuple:
+    """Quadros Ethernet/IPv4 (cortados em SNAPLEN) dos fluxos do TrafficGenerator.
+
+    Retorna (quadros FRAME_DTYPE, tamanhos originais, timestamps, registros de fluxo),
+    em ordem de tempo: cada fluxo começa em um instante de [0, duration) e envia
+    seus pacotes a cada `packet_gap` s, com byte_count repartido entre eles.
+    """
+    from traffic_generator import TrafficGenerator
+
+    rng = np.random.default_rng(seed)
+    records = TrafficGenerator(seed=seed).generate(flows)
+    counts = records["packet_count"].astype(np.int64)
+    owner = np.repeat(np.arange(flows), counts)
+    index_in_flow = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    timestamps = np.sort(rng.uniform(0, duration, flows))[owner] + index_in_flow * packet_gap
+    lengths = (records["byte_count"] // records["packet_count"])[owner]
+    lengths += np.where(index_in_flow == 0, (records["byte_count"] % records["packet_count"])[owner], 0)
+
+    order = np.argsort(timestamps, kind="stable")
+    owner, lengths, timestamps = owner[order], lengths[order], timestamps[order]
+    frames = np.zeros(len(owner), dtype=FRAME_DTYPE)
+    flow_records = records[owner]
+    frames["eth_type"] = ETHERTYPE_IPV4
+    frames["version_ihl"] = 0x45
+    frames["total_length"] = np.minimum(lengths - 14, 0xFFFF)
+    frames["ttl"] = 64
+    for field in ("protocol", "src_ip", "dst_ip", "src_port", "dst_port"):
+        frames[field] = flow_records[field]
+    udp = flow_records["protocol"] == 17
+    frames["l4_word"] = np.where(udp, (np.minimum(lengths - 34, 0xFFFF).astype(np.uint32) << 16), 0)
+    frames["data_offset"] = np.where(udp, 0, 0x50)
+    frames["tcp_flags"] = np.where(udp, 0, 0x10)
+    return frames, lengths.astype(np.uint32), timestamps, records
+
+
+def write_capture(path: str, frames: np.ndarray, lengths: np.ndarray, timestamps: np.ndarray,
+                  format: str = "pcap") -> None:
+    """Grava `frames` (FRAME_DTYPE) como pcap (µs) ou pcapng (uma interface Ethernet)."""
+    seconds = np.floor(timestamps)
+    with open(path, "wb") as file:
+        if format == "pcap":
+            file.write(struct.pack("<IHHiIII", PCAP_MAGIC_US, 2, 4, 0, 0, 65535, 1))
+            records = np.zeros(len(frames), dtype=[("ts_sec", "<u4"), ("ts_usec", "<u4"), ("caplen", "<u4"),
+                                                   ("length", "<u4"), ("frame", FRAME_DTYPE)])
+            records["ts_sec"] = seconds
+            records["ts_usec"] = np.minimum(np.round((timestamps - seconds) * 1e6), 999_999)
+        else:
+            file.write(struct.pack("<IIIHHqI", PCAPNG_SHB, 28, PCAPNG_BYTE_ORDER, 1, 0, -1, 28))
+            file.write(struct.pack("<IIHHII", PCAPNG_IDB, 20, 1, 0, 65535, 20))
+            block_length = 28 + (SNAPLEN + 3) // 4 * 4 + 4
+            records = np.zeros(len(frames), dtype=[("type", "<u4"), ("block_length", "<u4"), ("interface", "<u4"),
+                                                   ("ts_high", "<u4"), ("ts_low", "<u4"), ("caplen", "<u4"),
+                                                   ("length", "<u4"), ("frame", FRAME_DTYPE),
+                                                   ("pad", f"V{block_length - 32 - SNAPLEN}"),
+                                                   ("trailer", "<u4")])
+            ticks = np.round(timestamps * 1e6).astype(np.uint64)
+            records["type"] = PCAPNG_EPB
+            records["block_length"] = records["trailer"] = block_length
+            records["ts_high"] = ticks >> np.uint64(32)
+            records["ts_low"] = ticks & np.uint64(0xFFFFFFFF)
+        records["caplen"] = SNAPLEN
+        records["length"] = lengths
+        records["frame"] = frames
+        records.tofile(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Digests FlowDigest_t a partir de capturas pcap/pcapng")
+    commands = parser.add_subparsers(dest="command", required=True)
+    read = commands.add_parser("read", help="Lê capturas e mede a vazão da análise")
+    read.add_argument('paths', nargs='+', help='Arquivos pcap/pcapng, em ordem de tempo')
+    read.add_argument('--batch-size', type=int, default=65536, help='Pacotes por lote')
+    read.add_argument('--speed', type=float, default=0.0, help='Velocidade do replay (1 = tempo gravado, 0 = sem espera)')
+    read.add_argument('--aggregate', action='store_true', help='Agrega as digests em fluxos (FlowAggregator)')
+    read.add_argument('--p4-ports', action='store_true', help='Portas UDP = 0, como na digest do P4 (hdr.tcp)')
+    write = commands.add_parser("write", help="Grava uma captura sintética a partir do TrafficGenerator")
+    write.add_argument('path', type=str, help='Arquivo de saída')
+    write.add_argument('--flows', type=int, default=100_000, help='Fluxos sintéticos')
+    write.add_argument('--duration', type=float, default=60.0, help='Duração da captura (s)')
+    write.add_argument('--format', choices=['pcap', 'pcapng'], default='pcap', help='Formato do arquivo')
+    write.add_argument('--seed', type=int, default=0, help='Semente do gerador de tráfego')
+    args = parser.parse_args()
+
+    if args.command == "write":
+        frames, lengths, timestamps, records = synthetic_frames(args.flows, args.seed, args.duration)
+        write_capture(args.path, frames, lengths, timestamps, args.format)
+        print(f"{len(frames)} pacotes de {len(records)} fluxos gravados em {args.path} "
+              f"({os.path.getsize(args.path) / 2**20:.1f} MiB, {int(records['byte_count'].sum())} bytes originais)")
+        return
+
+    aggregator = FlowAggregator() if args.aggregate else None
+    readers = []
+
+    def batches() -> Iterator[tuple]:
+        for path in args.paths:
+            reader = PcapReader(path, udp_ports=not args.p4_ports)
+            readers.append(reader)
+            yield from reader.batches(args.batch_size)
+
+    start = time.perf_counter()
+    byte_total = flows = 0
+    paced = replay(batches(), args.speed)
+    if aggregator is not None:
+        for flow_data in aggregator.stream(paced):
+            flows += 1
+            byte_total += flow_data["byte_count"]
+    else:
+        for batch in paced:
+            byte_total += int(batch[5].sum())
+    elapsed = time.perf_counter() - start
+    packets = sum(reader.packets for reader in readers)
+    file_bytes = sum(reader.position for reader in readers)
+    for reader in readers:
+        print(f"[{reader.path}] {reader.stats()}")
+    print(f"{packets:,} pacotes em {elapsed:.2f}s: {packets / elapsed:,.0f} pacotes/s, "
+          f"{file_bytes / elapsed / 2**20:,.0f} MiB/s; bytes (packet_length): {byte_total}")
+    if aggregator is not None:
+        print(f"fluxos exportados: {flows}  digests agregadas: {aggregator.digests}  despejados: {aggregator.evictions}")
+    for reader in readers:
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+# Decisões do primeiro nível de detecção
+BENIGN = "benign"          # respondido na hora com {"action": "none"}
+UNCERTAIN = "uncertain"    # enviado à LLM
+SUSPICIOUS = "suspicious"  # enviado à LLM; o pré-filtro espera um "drop"
+
+TEST_FLOWS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_flows.json")
+
+DEFAULT_COMMON_PORTS = (53, 80, 443, 8080)
+
+# Colunas da matriz de características (em escala log1p para os z-scores)
+FEATURES = ("packet_count", "bytes_per_packet", "source_rate", "port_fanout")
+
+
+class StatisticalPrefilter:
+    """Primeiro nível de detecção: pontua lotes de fluxos com NumPy antes da LLM.
+
+    Para cada fluxo são calculados packet_count, bytes por pacote, taxa de fluxos da
+    origem (fluxos/s na janela atual) e fan-out de portas de destino da origem. Cada
+    característica é comparada (z-score, em escala log1p) com uma linha de base móvel
+    (média/variância exponenciais) alimentada apenas por fluxos considerados benignos.
+
+    Um fluxo é BENIGN quando respeita todos os limites estáticos (`benign_max_packets`,
+    `benign_max_rate`, `benign_max_fanout`, porta em `common_ports`) e nenhum z-score
+    passa de `escalate_z`. Passando de `suspicious_z`, ou excedendo um limite em mais
+    do dobro, o fluxo é SUSPICIOUS; os demais são UNCERTAIN.
+
+    stats() informa a taxa de escalonamento e a concordância com os vereditos da LLM,
+    registrados por record_llm_verdict().
+    """
+
+    def __init__(self, benign_max_packets: int = 5, benign_max_rate: float = 5.0, benign_max_fanout: int = 10,
+                 common_ports: tuple = DEFAULT_COMMON_PORTS, escalate_z: float = 3.0, suspicious_z: float = 5.0,
+                 window: float = 60.0, baseline_alpha: float = 0.01, warmup: int = 200):
+        self.benign_max_packets = benign_max_packets
+        self.benign_max_rate = benign_max_rate
+        self.benign_max_fanout = benign_max_fanout
+        self.common_ports = np.array(common_ports)
+        self.escalate_z = escalate_z
+        self.suspicious_z = suspicious_z
+        self.window = window
+        self.baseline_alpha = baseline_alpha
+        self.warmup = warmup
+
+        self._mean = np.zeros(len(FEATURES))
+        self._var = np.ones(len(FEATURES))
+        self._baseline_samples = 0
+
+        # estado por origem na janela atual: src_ip -> [fluxos, set(dst_ports)]
+        self._sources: dict = {}
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.counts = {BENIGN: 0, UNCERTAIN: 0, SUSPICIOUS: 0}
+        # concordância com a LLM: (decisão, ação da LLM) -> contagem
+        self.agreement = {(UNCERTAIN, "drop"): 0, (UNCERTAIN, "none"): 0,
+                          (SUSPICIOUS, "drop"): 0, (SUSPICIOUS, "none"): 0}
+
+    def _source_features(self, flows: list, now: float) -> tuple:
+        """Atualiza o estado por origem e retorna (taxa, fan-out) de cada fluxo."""
+        if now - self._window_start >= self.window:
+            self._sources.clear()
+            self._window_start = now
+        elapsed = max(now - self._window_start, 1.0)
+
+        rates = np.empty(len(flows))
+        fanouts = np.empty(len(flows))
+        for i, flow_data in enumerate(flows):
+            state = self._sources.get(flow_data.get("src_ip"))
+            if state is None:
+                state = self._sources[flow_data.get("src_ip")] = [0, set()]
+            state[0] += 1
+            state[1].add(flow_data.get("dst_port"))
+            rates[i] = state[0] / elapsed
+            fanouts[i] = len(state[1])
+        return rates, fanouts
+
+    def classify(self, flows: list, now: Optional[float] = None) -> list:
+        """Classifica um lote de fluxos; retorna BENIGN, UNCERTAIN ou SUSPICIOUS por fluxo.
+
+        `now` permite informar o instante (s) do lote ao reproduzir tráfego gravado.
+        """
+        if not flows:
+            return []
+
+        packets = np.fromiter((f.get("packet_count", 0) for f in flows), dtype=np.float64, count=len(flows))
+        byte_counts = np.fromiter((f.get("byte_count", 0) for f in flows), dtype=np.float64, count=len(flows))
+        dst_ports = np.fromiter((f.get("dst_port", 0) for f in flows), dtype=np.int64, count=len(flows))
+        bytes_per_packet = np.divide(byte_counts, packets, out=np.zeros_like(byte_counts), where=packets > 0)
+
+        with self._lock:
+            rates, fanouts = self._source_features(flows, time.monotonic() if now is None else now)
+            features = np.log1p(np.column_stack((packets, bytes_per_packet, rates, fanouts)))
+
+            if self._baseline_samples >= self.warmup:
+                z = (features - self._mean) / np.sqrt(self._var)
+                max_z = np.max(z, axis=1)
+            else:
+                max_z = np.zeros(len(flows))
+
+            limits = np.column_stack((
+                packets / self.benign_max_packets,
+                rates / self.benign_max_rate,
+                fanouts / self.benign_max_fanout,
+            ))
+            worst_limit = np.max(limits, axis=1)
+            common_port = np.isin(dst_ports, self.common_ports)
+
+            benign = (worst_limit <= 1.0) & common_port & (max_z < self.escalate_z)
+            suspicious = ~benign & ((worst_limit > 2.0) | (max_z >= self.suspicious_z))
+
+            if benign.any():
+                self._update_baseline(features[benign])
+
+            decisions = np.where(benign, BENIGN, np.where(suspicious, SUSPICIOUS, UNCERTAIN)).tolist()
+            for decision in decisions:
+                self.counts[decision] += 1
+        return decisions
+
+    def _update_baseline(self, features: np.ndarray) -> None:
+        # no aquecimento, média acumulada; depois, decaimento exponencial equivalente a n amostras
+        n = len(features)
+        if self._baseline_samples < self.warmup:
+            alpha = n / (self._baseline_samples + n)
+        else:
+            alpha = 1.0 - (1.0 - self.baseline_alpha) ** n
+        delta = features.mean(axis=0) - self._mean
+        self._mean += alpha * delta
+        self._var = np.maximum((1 - alpha) * (self._var + alpha * delta ** 2) + alpha * features.var(axis=0), 1e-3)
+        self._baseline_samples += n
+
+    def record_llm_verdict(self, decision: str, verdict: dict) -> None:
+        """Registra o veredito da LLM para um fluxo escalonado com a decisão `decision`."""
+        key = (decision, "drop" if verdict.get("action") == "drop" else "none")
+        with self._lock:
+            if key in self.agreement:
+                self.agreement[key] += 1
+
+    def stats(self) -> dict:
+        total = sum(self.counts.values())
+        escalated = self.counts[UNCERTAIN] + self.counts[SUSPICIOUS]
+        judged = sum(self.agreement.values())
+        agreed = self.agreement[(SUSPICIOUS, "drop")] + self.agreement[(UNCERTAIN, "none")]
+        return {
+            "flows": total,
+            "benign": self.counts[BENIGN],
+            "uncertain": self.counts[UNCERTAIN],
+            "suspicious": self.counts[SUSPICIOUS],
+            "escalation_rate": escalated / total if total else 0.0,
+            "llm_agreement": agreed / judged if judged else None,
+            "llm_drop_rate_suspicious": self._drop_rate(SUSPICIOUS),
+            "llm_drop_rate_uncertain": self._drop_rate(UNCERTAIN),
+        }
+
+    def _drop_rate(self, decision: str) -> Optional[float]:
+        judged = self.agreement[(decision, "drop")] + self.agreement[(decision, "none")]
+        return self.agreement[(decision, "drop")] / judged if judged else None
+
+
+def evaluate_against_labels(prefilter: StatisticalPrefilter, test_flows_path: str = TEST_FLOWS_PATH) -> dict:
+    """Classifica os fluxos rotulados de test_flows.json e compara com expected_llm_response.
+
+    Útil para ajustar os limites: `missed_drops` conta fluxos que o pré-filtro
+    responderia como benignos, mas cujo veredito esperado é "drop".
+    """
+    with open(test_flows_path, encoding="utf8") as file:
+        cases = json.load(file)
+
+    decisions = prefilter.classify([case["flow_data"] for case in cases])
+    report = {"missed_drops": 0, "benign_correct": 0, "escalated_drops": 0, "escalated_benign": 0}
+    for case, decision in zip(cases, decisions):
+        expected_drop = case["expected_llm_response"].get("action") == "drop"
+        if decision == BENIGN:
+            report["missed_drops" if expected_drop else "benign_correct"] += 1
+        else:
+            report["escalated_drops" if expected_drop else "escalated_benign"] += 1
+    report["escalation_rate"] = (report["escalated_drops"] + report["escalated_benign"]) / len(cases)
+    return report
+
+
+if __name__ == "__main__":
+    print(evaluate_against_labels(StatisticalPrefilter()))
@@ -0,0 +1,351 @@
+import json
+import time
+import random
+import threading
+from typing import Callable, Iterator, Optional
+
+from metrics import Metrics
+from heuristics import heuristic_response
+
+# Os SDKs (openai, ollama, httpx) são importados só ao criar o provider que os usa:
+# importá-los custa quase 1 s e atrasava a partida de todo controlador.
+
+
+# Status HTTP que não melhoram com uma nova tentativa no mesmo backend
+NON_RETRYABLE_STATUS = {400, 401, 403, 404, 422}
+
+
+class ProviderError(Exception):
+    """Falha de configuração de um provider ou de todas as tentativas de uma chamada."""
+
+
+class LLMProvider:
+    """Backend de LLM: chat() retorna o conteúdo da resposta e stream() seus pedaços.
+
+    Subclasses registradas com @register_provider podem ser criadas pelo nome com
+    create_provider(), que repassa model, api_key, base_url, timeout e max_connections;
+    `default_model` é usado quando nenhum modelo é informado.
+    """
+
+    name = "base"
+    default_model: Optional[str] = None
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or self.default_model
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def chat(self, messages: list) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: list) -> Iterator[str]:
+        yield self.chat(messages)
+
+    def check(self) -> bool:
+        """Indica se o backend está acessível."""
+        return True
+
+    def warmup(self) -> None:
+        """Prepara o backend antes do primeiro fluxo (conexões, modelo carregado)."""
+
+
+PROVIDERS: dict = {}
+
+
+def register_provider(cls):
+    """Decorador que registra um LLMProvider pelo seu `name`."""
+    PROVIDERS[cls.name] = cls
+    return cls
+
+
+def create_provider(name: str, **kwargs) -> LLMProvider:
+    if name not in PROVIDERS:
+        raise ProviderError(f"Provider desconhecido: {name!r}. Válidos: {sorted(PROVIDERS)}")
+    return PROVIDERS[name](**kwargs)
+
+
+def stream_connections(concurrency: int, stream: bool = False) -> int:
+    """Conexões HTTP por backend para `concurrency` chamadas simultâneas (max_connections).
+
+    Com streaming, a resposta de uma chamada ainda é lida até o fim depois de o veredito
+    liberar a vaga para a próxima: até duas conexões por chamada em andamento.
+    """
+    return max(32, concurrency * (2 if stream else 1))
+
+
+@register_provider
+class OpenAIProvider(LLMProvider):
+    """API da OpenAI ou qualquer servidor compatível (`base_url`)."""
+
+    name = "openai"
+    default_model = "gpt-3.5-turbo"
+
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: float = 30.0, max_connections: int = 32, **_):
+        super().__init__(model)
+        if api_key is None:
+            raise ProviderError("Chave de API não inserida.")
+        try:
+            import httpx
+            from openai import OpenAI
+        except Exception:
+            raise ProviderError("Erro ao importar biblioteca.")
+        # as novas tentativas ficam com o ResilientProvider; o SDK não repete sozinho
+        http_client = httpx.Client(timeout=timeout, limits=httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections))
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                             http_client=http_client)
+
+    def chat(self, messages: list) -> str:
+        resp = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=0.2,
+        )
+        return resp.choices[0].message.content
+
+    def stream(self, messages: list) -> Iterator[str]:
+        # o Stream do SDK fecha a resposta ao ver "[DONE]", antes do fim do corpo, e o
+        # httpx descarta a conexão: lendo os eventos até o fim, ela volta ao pool
+        with self.client.chat.completions.with_streaming_response.create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=0.2,
+            stream=True,
+        ) as response:
+            for line in response.iter_lines():
+                if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                    continue
+                chunk = json.loads(line[5:])
+                if chunk.get("error"):
+                    raise ProviderError(f"Erro no streaming: {chunk['error']}")
+                choices = chunk.get("choices") or []
+                content = choices and (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+
+    def warmup(self) -> None:
+        # abre a conexão (TCP/TLS) do pool antes do primeiro fluxo
+        self.client.models.list()
+
+
+@register_provider
+class OllamaProvider(LLMProvider):
+    """Servidor Ollama em `base_url` (padrão: OLLAMA_HOST ou localhost:11434)."""
+
+    name = "ollama"
+    default_model = "llama3"
+
+    def __init__(self, model: Optional[str] = None, base_url: Optional[str] = None, timeout: float = 30.0,
+                 max_connections: int = 32, **_):
+        super().__init__(model)
+        try:
+            import httpx
+            import ollama
+        except Exception:
+            raise ProviderError("Erro ao importar biblioteca ollama.")
+        self.client = ollama.Client(host=base_url, timeout=timeout, limits=httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections))
+
+    def chat(self, messages: list) -> str:
+        resp = self.client.chat(
+            model=self.model,
+            messages=messages,
+            options={
+                'temperature': 0.2,
+                }
+            )
+        return resp["message"]["content"]
+
+    def stream(self, messages: list) -> Iterator[str]:
+        stream = self.client.chat(
+            model=self.model,
+            messages=messages,
+            options={
+                'temperature': 0.2,
+                },
+            stream=True,
+            )
+        for part in stream:
+            if part["message"]["content"]:
+                yield part["message"]["content"]
+
+    def warmup(self) -> None:
+        # um chat sem mensagens só carrega o modelo na memória do servidor
+        self.client.chat(model=self.model, messages=[])
+
+    def check(self) -> bool:
+        try:
+            self.client.list()
+            return True
+        except Exception as e:
+            print(f"Erro ao se conectar com a Ollama: {e}")
+            return False
+
+
+@register_provider
+class StubProvider(LLMProvider):
+    """Vereditos determinísticos do stub local, sem rede (ver mock_llm_server.py)."""
+
+    name = "stub"
+    default_model = "stub"
+
+    def __init__(self, model: Optional[str] = None, latency_ms: float = 0.0, **_):
+        # o servidor de testes só é importado por quem usa o stub
+        from mock_llm_server import TOKEN_CHARS, stub_completion
+
+        super().__init__(model)
+        self.latency_ms = latency_ms
+        self._complete = stub_completion
+        self._token_chars = TOKEN_CHARS
+
+    def chat(self, messages: list) -> str:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        return self._complete(messages)
+
+    def stream(self, messages: list) -> Iterator[str]:
+        content = self.chat(messages)
+        for start in range(0, len(content), self._token_chars):
+            yield content[start:start + self._token_chars]
+
+
+def heuristic_verdict(flow_data: dict) -> dict:
+    """Política de fallback determinística (heuristics.py), no formato normalizado."""
+    verdict = heuristic_response(flow_data)
+    if verdict["action"] == "drop":
+        return {"action": "drop", "src_ip": verdict["target_ip"]}
+    return {"action": "none"}
+
+
+class CircuitBreaker:
+    """Abre após `threshold` falhas seguidas; depois de `reset_timeout` s deixa passar
+    uma chamada de teste (meio-aberto), que fecha o circuito se tiver sucesso."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def _retryable(error: Exception) -> bool:
+    return getattr(error, "status_code", None) not in NON_RETRYABLE_STATUS
+
+
+class ResilientProvider:
+    """Encadeia backends com novas tentativas, circuit breaker e failover.
+
+    Cada chamada tenta os backends em ordem, pulando os de circuito aberto. Em cada um
+    são feitas até `retries` novas tentativas, com espera exponencial com jitter
+    (uniforme entre 0 e min(`backoff_max`, `backoff` * 2^tentativa)). Se todos falharem,
+    é levantado ProviderError. Em stream(), só há nova tentativa antes do primeiro pedaço.
+    """
+
+    def __init__(self, backends: list, retries: int = 2, backoff: float = 0.2, backoff_max: float = 2.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0, metrics: Optional[Metrics] = None):
+        if not backends:
+            raise ProviderError("Nenhum backend de LLM configurado.")
+        self.backends = backends
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.breakers = [CircuitBreaker(breaker_threshold, breaker_reset) for _ in backends]
+        for backend, breaker in zip(backends, self.breakers):
+            self.metrics.gauge("provider_circuit_open", lambda b=breaker: float(b.state != CircuitBreaker.CLOSED),
+                               backend=backend.label)
+
+    @property
+    def primary(self) -> LLMProvider:
+        return self.backends[0]
+
+    def check(self) -> bool:
+        """Indica se algum backend está acessível."""
+        return any([backend.check() for backend in self.backends])
+
+    def warmup(self) -> None:
+        """Aquece todos os backends; uma falha só é registrada (o failover ainda vale)."""
+        for backend in self.backends:
+            start = time.perf_counter()
+            try:
+                backend.warmup()
+            except Exception as e:
+                print(f"[Provider] Falha ao aquecer {backend.label}: {e}")
+                continue
+            self.metrics.observe("warmup", time.perf_counter() - start)
+
+    def _attempts(self, call: Callable[[LLMProvider], object]):
+        last_error: Optional[Exception] = None
+        for index, (backend, breaker) in enumerate(zip(self.backends, self.breakers)):
+            if not breaker.allow():
+                continue
+            if index > 0:
+                self.metrics.inc("provider_failovers_total", backend=backend.label)
+            for attempt in range(self.retries + 1):
+                if attempt > 0:
+                    self.metrics.inc("provider_retries_total", backend=backend.label)
+                    time.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1))))
+                try:
+                    result = call(backend)
+                except Exception as e:
+                    last_error = e
+                    breaker.record_failure()
+                    self.metrics.inc("provider_errors_total", backend=backend.label)
+                    print(f"[Provider] Falha em {backend.label} (tentativa {attempt + 1}): {e}")
+                    if not _retryable(e) or not breaker.allow():
+                        break
+                    continue
+                breaker.record_success()
+                return result
+        raise ProviderError(f"Todos os backends de LLM falharam: {last_error}")
+
+    def chat(self, messages: list) -> str:
+        return self._attempts(lambda backend: backend.chat(messages))
+
+    def stream(self, messages: list) -> Iterator[str]:
+        def first_piece(backend: LLMProvider):
+            pieces = backend.stream(messages)
+            return next(pieces, ""), pieces
+
+        first, pieces = self._attempts(first_piece)
+        if first:
+            yield first
+        yield from pieces
+
+    def stats(self) -> dict:
+        return {backend.label: {"state": breaker.state, "consecutive_failures": breaker.failures,
+                                "times_opened": breaker.opened}
+                for backend, breaker in zip(self.backends, self.breakers)}
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""Registro estruturado dos vereditos do Controller, gravado em segundo plano.
+
+Cada fluxo concluído vira um registro com o fluxo, a resposta bruta da LLM, o veredito
+normalizado, a origem do veredito (LLM, cache, pré-filtro, fallback...), as durações
+por estágio e a regra resultante. ResultsSink.record() só coloca o registro em um
+buffer limitado; uma thread grava os registros em lotes, em segmentos rotativos:
+
+  - "jsonl": results-000001.jsonl, um objeto JSON por linha;
+  - "columnar": results-000001.bin com linhas de tamanho fixo (RESULT_DTYPE) e
+    results-000001.raw com as respostas brutas, apontadas por raw_offset/raw_length.
+
+ResultsReader mapeia em memória os segmentos colunares (ou lê os JSONL) para análise
+offline.
+
+Exemplos:
+  python3 src/results_sink.py summary /tmp/results
+  python3 src/results_sink.py bench --records 500000 --format columnar
+"""
+
+import os
+import glob
+import ipaddress
+import json
+import time
+import queue
+import argparse
+import tempfile
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+
+from metrics import Metrics
+from flow_aggregator import ip_to_str
+
+
+FORMATS = ("jsonl", "columnar")
+
+# Valores das colunas enumeradas
+ACTIONS = ("none", "drop")
+SOURCES = ("llm", "cache", "case_memory", "prefilter", "fallback", "shed", "unknown")
+RULES = ("none", "requested", "covered", "applied")  # pedida ao AclRuleManager, já coberta, aplicada direto
+TIMINGS = ("detect", "llm_call", "apply")
+
+RESULT_DTYPE = np.dtype([
+    ("timestamp", np.float64),
+    ("flow_id", np.uint64),
+    ("src_ip", np.uint32),
+    ("dst_ip", np.uint32),
+    ("src_port", np.uint16),
+    ("dst_port", np.uint16),
+    ("protocol", np.uint8),
+    ("action", np.uint8),  # índice em ACTIONS
+    ("source", np.uint8),  # índice em SOURCES
+    ("rule", np.uint8),    # índice em RULES
+    ("packet_count", np.uint32),
+    ("byte_count", np.uint64),
+    ("target_ip", np.uint32),  # 0 = sem alvo ou alvo que não é IPv4
+    ("detect_s", np.float32),  # NaN = estágio não executado
+    ("llm_call_s", np.float32),
+    ("apply_s", np.float32),
+    ("raw_offset", np.uint64),  # resposta bruta no arquivo .raw do segmento
+    ("raw_length", np.uint32),
+])
+
+
+def _index(values: tuple, value: Optional[str]) -> int:
+    return values.index(value) if value in values else len(values) - 1 if values is SOURCES else 0
+
+
+def _address(value) -> int:
+    """Endereço IPv4 como inteiro; 0 se `value` não for um IPv4 (ausente, CIDR, IPv6...)."""
+    try:
+        return int(ipaddress.IPv4Address(value))
+    except ValueError:
+        return 0
+
+
+def _segment_name(number: int, extension: str) -> str:
+    return f"results-{number:06d}.{extension}"
+
+
+def _segments(directory: str, extension: str) -> list:
+    return sorted(glob.glob(os.path.join(directory, f"results-[0-9]*.{extension}")))
+
+
+class ResultsSink:
+    """Grava os registros de veredito em `directory`, sem bloquear quem os produz.
+
+    record() nunca espera: com o buffer (`buffer_size` registros) cheio, o registro é
+    descartado e contado em "dropped" (results_dropped_total). A thread de gravação
+    junta o que houver no buffer, no máximo a cada `flush_interval` s, e troca de
+    segmento quando o atual passa de `max_bytes`. Um diretório já usado continua a
+    numeração a partir do último segmento.
+    """
+
+    def __init__(self, directory: str, format: str = "jsonl", max_bytes: int = 64 << 20,
+                 buffer_size: int = 65536, flush_interval: float = 0.5, metrics: Optional[Metrics] = None):
+        if format not in FORMATS:
+            raise ValueError(f"Formato desconhecido: {format!r}. Válidos: {FORMATS}")
+        self.directory = directory
+        self.format = format
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+
+        self.written = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.segments = 0
+
+        os.makedirs(directory, exist_ok=True)
+        extension = "jsonl" if format == "jsonl" else "bin"
+        existing = _segments(directory, extension)
+        self._number = int(os.path.basename(existing[-1])[8:14]) if existing else 0
+        self._file = None
+        self._raw = None
+        self._size = 0
+        self._raw_size = 0
+        if format == "columnar":
+            with open(os.path.join(directory, "results.schema.json"), "w", encoding="utf8") as file:
+                json.dump({"dtype": [(name, RESULT_DTYPE.fields[name][0].str) for name in RESULT_DTYPE.names],
+                           "actions": ACTIONS, "sources": SOURCES, "rules": RULES}, file, indent=2)
+
+        self._buffer: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run_writer, name="results-sink", daemon=True)
+        self._writer.start()
+
+    def record(self, entry: dict) -> bool:
+        """Enfileira `entry` para gravação; False se o buffer estiver cheio (descartado)."""
+        try:
+            self._buffer.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            self.metrics.inc("results_dropped_total")
+            return False
+        return True
+
+    def _drain(self) -> list:
+        try:
+            entries = [self._buffer.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                entries.append(self._buffer.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def _run_writer(self) -> None:
+        while not (self._stop.is_set() and self._buffer.empty()):
+            entries = self._drain()
+            if not entries:
+                continue
+            try:
+                self._write(entries)
+            except Exception as e:
+                # o lote não foi gravado: conta como descartado em vez de sumir
+                self.dropped += len(entries)
+                self.metrics.inc("results_dropped_total", len(entries))
+                print(f"[Resultados] Erro ao gravar {len(entries)} registros: {e}")
+            finally:
+                for _ in entries:
+                    self._buffer.task_done()
+
+    def _rotate(self) -> None:
+        self.close_files()
+        self._number += 1
+        self.segments += 1
+        if self.format == "jsonl":
+            self._file = open(os.path.join(self.directory, _segment_name(self._number, "jsonl")), "ab")
+        else:
+            self._file = open(os.path.join(self.directory, _segment_name(self._number, "bin")), "ab")
+            self._raw = open(os.path.join(self.directory, _segment_name(self._number, "raw")), "ab")
+        self._size = 0
+        self._raw_size = 0
+
+    def _write(self, entries: list) -> None:
+        if self._file is None or self._size >= self.max_bytes:
+            self._rotate()
+        raw = b""
+        if self.format == "jsonl":
+            data = b"".join(json.dumps(entry, ensure_ascii=False, default=str).encode() + b"\n" for entry in entries)
+        else:
+            rows, raw = self._columns(entries)
+            data = rows.tobytes()
+            # as respostas brutas vão antes das linhas que apontam para elas
+            self._raw.write(raw)
+            self._raw.flush()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self.bytes_written += len(data) + len(raw)
+        self.written += len(entries)
+        self.metrics.inc("results_written_total", len(entries))
+
+    def _columns(self, entries: list) -> tuple:
+        """Linhas RESULT_DTYPE e o bloco de respostas brutas de `entries`."""
+        rows = np.zeros(len(entries), dtype=RESULT_DTYPE)
+        flows = [entry.get("flow") or {} for entry in entries]
+        verdicts = [entry.get("verdict") or {} for entry in entries]
+        timings = [entry.get("timings") or {} for entry in entries]
+        raws = [(entry.get("raw_response") or "").encode() for entry in entries]
+        rows["timestamp"] = [entry.get("timestamp", 0.0) for entry in entries]
+        rows["flow_id"] = [entry.get("flow_id") or 0 for entry in entries]
+        rows["src_ip"] = [_address(f.get("src_ip")) for f in flows]
+        rows["dst_ip"] = [_address(f.get("dst_ip")) for f in flows]
+        for field in ("src_port", "dst_port", "protocol", "packet_count", "byte_count"):
+            rows[field] = [f.get(field, 0) for f in flows]
+        rows["action"] = [_index(ACTIONS, v.get("action")) for v in verdicts]
+        rows["target_ip"] = [_address(v.get("src_ip")) for v in verdicts]
+        rows["source"] = [_index(SOURCES, entry.get("source")) for entry in entries]
+        rows["rule"] = [_index(RULES, entry.get("rule")) for entry in entries]
+        for name in TIMINGS:
+            rows[f"{name}_s"] = [t.get(name, np.nan) for t in timings]
+        rows["raw_length"] = [len(raw) for raw in raws]
+        rows["raw_offset"] = self._raw_size + np.concatenate(([0], np.cumsum(rows["raw_length"][:-1])))
+        self._raw_size += int(rows["raw_length"].sum())
+        return rows, b"".join(raws)
+
+    def flush(self) -> None:
+        """Espera a gravação de todos os registros já enfileirados."""
+        self._buffer.join()
+
+    def close_files(self) -> None:
+        for file in (self._file, self._raw):
+            if file is not None:
+                file.close()
+        self._file = self._raw = None
+
+    def close(self) -> None:
+        """Grava o que está no buffer e fecha o segmento atual."""
+        self._stop.set()
+        self._writer.join(timeout=30)
+        self.close_files()
+
+    def stats(self) -> dict:
+        return {
+            "format": self.format,
+            "written": self.written,
+            "dropped": self.dropped,
+            "buffered": self._buffer.qsize(),
+            "segments": self.segments,
+            "bytes_written": self.bytes_written,
+            "bytes_per_record": self.bytes_written / self.written if self.written else 0.0,
+        }
+
+
+class ResultsReader:
+    """Leitura offline dos registros gravados por ResultsSink em `directory`.
+
+    No formato colunar, segments() devolve um np.memmap (RESULT_DTYPE) por segmento e
+    columns() os concatena; raw_response() busca a resposta bruta de uma linha. No
+    formato JSONL, records() percorre os registros.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.format = "columnar" if _segments(directory, "bin") else "jsonl"
+
+    def segments(self) -> list:
+        maps = []
+        for path in _segments(self.directory, "bin"):
+            if os.path.getsize(path) >= RESULT_DTYPE.itemsize:
+                # um segmento ainda em gravação pode terminar no meio de uma linha
+                count = os.path.getsize(path) // RESULT_DTYPE.itemsize
+                maps.append(np.memmap(path, dtype=RESULT_DTYPE, mode="r", shape=(count,)))
+        return maps
+
+    def columns(self) -> np.ndarray:
+        maps = self.segments()
+        if not maps:
+            return np.zeros(0, dtype=RESULT_DTYPE)
+        return maps[0] if len(maps) == 1 else np.concatenate(maps)
+
+    def raw_response(self, segment: int, row: int) -> str:
+        """Resposta bruta da linha `row` do segmento `segment` (índices de segments())."""
+        path = _segments(self.directory, "bin")[segment]
+        rows = self.segments()[segment]
+        with open(path[:-len("bin")] + "raw", "rb") as file:
+            file.seek(int(rows["raw_offset"][row]))
+            return file.read(int(rows["raw_length"][row])).decode()
+
+    def records(self) -> Iterator[dict]:
+        if self.format == "jsonl":
+            for path in _segments(self.directory, "jsonl"):
+                with open(path, "rb") as file:
+                    for line in file:
+                        if line.endswith(b"\n"):
+                            yield json.loads(line)
+            return
+        for rows in self.segments():
+            for row in rows:
+                yield {
+                    "timestamp": float(row["timestamp"]),
+                    "flow_id": int(row["flow_id"]),
+                    "flow": {"src_ip": ip_to_str(int(row["src_ip"])), "dst_ip": ip_to_str(int(row["dst_ip"])),
+                             **{field: int(row[field]) for field in ("src_port", "dst_port", "protocol",
+                                                                     "packet_count", "byte_count")}},
+                    "verdict": ({"action": "drop", "src_ip": ip_to_str(int(row["target_ip"]))}
+                                if ACTIONS[row["action"]] == "drop" else {"action": "none"}),
+                    "source": SOURCES[row["source"]],
+                    "rule": RULES[row["rule"]],
+                    "timings": {name: float(row[f"{name}_s"]) for name in TIMINGS
+                                if not np.isnan(row[f"{name}_s"])},
+                }
+
+    def summary(self) -> dict:
+        """Contagens por ação, origem e regra e percentis de duração por estágio."""
+        if self.format == "columnar":
+            rows = self.columns()
+            actions, sources, rules = rows["action"], rows["source"], rows["rule"]
+            durations = {name: rows[f"{name}_s"].astype(np.float64) for name in TIMINGS}
+        else:
+            records = list(self.records())
+            rows = records
+            actions = np.array([_index(ACTIONS, (r.get("verdict") or {}).get("action")) for r in records], dtype=np.uint8)
+            sources = np.array([_index(SOURCES, r.get("source")) for r in records], dtype=np.uint8)
+            rules = np.array([_index(RULES, r.get("rule")) for r in records], dtype=np.uint8)
+            durations = {name: np.array([(r.get("timings") or {}).get(name, np.nan) for r in records], dtype=np.float64)
+                         for name in TIMINGS}
+
+        def counts(values: np.ndarray, names: tuple) -> dict:
+            found = np.bincount(values, minlength=len(names))
+            return {name: int(found[i]) for i, name in enumerate(names) if found[i]}
+
+        latency = {}
+        for name, values in durations.items():
+            values = values[~np.isnan(values)]
+            if len(values):
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                latency[name] = {"count": len(values), "p50_s": p50, "p95_s": p95, "p99_s": p99}
+        return {
+            "format": self.format,
+            "records": len(rows),
+            "actions": counts(actions, ACTIONS),
+            "sources": counts(sources, SOURCES),
+            "rules": counts(rules, RULES),
+            "latency": latency,
+        }
+
+
+def _synthetic_entries(count: int, seed: int) -> list:
+    from traffic_generator import TrafficGenerator, expected_response, records_to_flows
+
+    rng = np.random.default_rng(seed)
+    entries = []
+    for chunk in TrafficGenerator(seed=seed).chunks(count):
+        for record, flow_data in zip(chunk, records_to_flows(chunk)):
+            response = expected_response(record)
+            verdict = {"action": response["action"]}
+            if response["action"] == "drop":
+                verdict["src_ip"] = response["target_ip"]
+            entries.append({
+                "timestamp": time.time(), "flow_id": flow_data["flow_id"], "flow": flow_data,
+                "raw_response": json.dumps(response), "verdict": verdict, "source": "llm",
+                "timings": {"detect": float(rng.exponential(0.2)), "llm_call": float(rng.exponential(0.2)),
+                            "apply": 1e-5},
+                "rule": "requested" if response["action"] == "drop" else "none",
+            })
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registros de veredito do Controller: resumo e benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summary", help="Resume um diretório de resultados")
+    summary.add_argument('directory', type=str, help='Diretório gravado pelo ResultsSink')
+    bench = commands.add_parser("bench", help="Vazão de gravação e de leitura com registros sintéticos")
+    bench.add_argument('--records', type=int, default=200_000, help='Registros gravados')
+    bench.add_argument('--format', choices=FORMATS, default="columnar", help='Formato dos segmentos')
+    bench.add_argument('--directory', type=str, default=None, help='Diretório (padrão: temporário)')
+    bench.add_argument('--seed', type=int, default=0, help='Semente do gerador de tráfego')
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        print(json.dumps(ResultsReader(args.directory).summary(), indent=2))
+        return
+
+    directory = args.directory or tempfile.mkdtemp(prefix="results-")
+    entries = _synthetic_entries(args.records, args.seed)
+    sink = ResultsSink(directory, format=args.format, buffer_size=len(entries) + 1)
+    start = time.perf_counter()
+    for entry in entries:
+        sink.record(entry)
+    enqueued = time.perf_counter() - start
+    sink.close()
+    written = time.perf_counter() - start
+    stats = sink.stats()
+    start = time.perf_counter()
+    result = ResultsReader(directory).summary()
+    read = time.perf_counter() - start
+    print(f"{stats['written']} registros ({args.format}) em {directory}: "
+          f"record() {enqueued / len(entries) * 1e6:.2f} µs/registro, gravação {stats['written'] / written:,.0f} registros/s, "
+          f"{stats['bytes_per_record']:.0f} bytes/registro, resumo lido em {read:.2f}s "
+          f"({result['records'] / read:,.0f} registros/s)")
+
+
+if __name__ == '__main__':
+    main()
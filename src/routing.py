@@ -0,0 +1,270 @@
+import json
+import time
+import threading
+from typing import Iterator, Optional
+
+from metrics import Histogram, Metrics
+from providers import ProviderError, ResilientProvider
+from stream_parser import IncrementalJsonParser
+
+
+# Estimativa de tokens para o custo: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+# Motivos de escalonamento para o modelo grande
+DROP = "drop"                      # veredito de alto impacto: confirmado antes de virar regra
+LOW_CONFIDENCE = "low_confidence"  # "confidence" abaixo do limiar (ou ausente)
+INVALID = "invalid"                # resposta que não pôde ser interpretada
+
+
+def _parse_json(text: str) -> Optional[dict]:
+    """Objeto JSON da resposta, ignorando cercas ```json e texto ao redor; None se inválido."""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        parsed = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _restrict_batch(messages: list, flow_ids: set) -> list:
+    """Cópia de `messages` em que a lista de fluxos do lote mantém só `flow_ids`."""
+    restricted = []
+    for message in messages:
+        content = message.get("content", "")
+        if content.startswith("["):
+            flows = [flow_data for flow_data in json.loads(content) if flow_data.get("flow_id") in flow_ids]
+            message = dict(message, content=json.dumps(flows, separators=(",", ":")))
+        restricted.append(message)
+    return restricted
+
+
+class _TierStats:
+    def __init__(self, cost_per_1k_tokens: float):
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.calls = 0
+        self.flows = 0
+        self.errors = 0
+        self.tokens = 0
+        self.latency = Histogram()
+
+    def record(self, messages: list, response: str, flows: int, seconds: float) -> None:
+        self.calls += 1
+        self.flows += flows
+        chars = sum(len(message.get("content", "")) for message in messages) + len(response)
+        self.tokens += chars // CHARS_PER_TOKEN
+        self.latency.observe(seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "flows": self.flows,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "cost": self.tokens / 1000 * self.cost_per_1k_tokens,
+            "latency_p50_s": self.latency.quantile(0.5),
+            "latency_p95_s": self.latency.quantile(0.95),
+        }
+
+
+class ModelRouter:
+    """Roteamento adaptativo em dois níveis: modelo pequeno primeiro, grande para confirmar.
+
+    Toda análise vai ao modelo `small`, que informa "confidence" (0 a 1) junto com o
+    veredito. São reenviados ao modelo `large` os vereditos "drop" (se `escalate_drops`),
+    os com confiança abaixo de `confidence_threshold` e as respostas inválidas; o veredito
+    do modelo grande prevalece. Em lotes, só os fluxos escalonados vão ao modelo grande.
+    Se o modelo grande falhar, o veredito do pequeno é mantido.
+
+    Tem a mesma interface do ResilientProvider (chat, stream, check, stats, primary,
+    backends) e é passado ao Controller em `llm`. stats() informa por nível chamadas,
+    fluxos, latência, tokens estimados e custo (`small_cost`/`large_cost` por 1k tokens),
+    além das taxas de escalonamento e de discordância entre os níveis.
+    """
+
+    def __init__(self, small: ResilientProvider, large: ResilientProvider, confidence_threshold: float = 0.8,
+                 escalate_drops: bool = True, small_cost: float = 0.0, large_cost: float = 0.0,
+                 metrics: Optional[Metrics] = None):
+        self.small = small
+        self.large = large
+        self.confidence_threshold = confidence_threshold
+        self.escalate_drops = escalate_drops
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.tiers = {"small": _TierStats(small_cost), "large": _TierStats(large_cost)}
+        self.escalations = {DROP: 0, LOW_CONFIDENCE: 0, INVALID: 0}
+        self.disagreements = 0
+        self.compared = 0
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.small.primary
+
+    @property
+    def backends(self) -> list:
+        return self.small.backends + self.large.backends
+
+    def check(self) -> bool:
+        """O modelo pequeno precisa estar acessível; sem o grande, nada é escalonado."""
+        large_ok = self.large.check()
+        if not large_ok:
+            print("[Roteador] Modelo grande inacessível; os vereditos do modelo pequeno serão mantidos.")
+        return self.small.check()
+
+    def warmup(self) -> None:
+        self.small.warmup()
+        self.large.warmup()
+
+    def escalation_reason(self, verdict: Optional[dict]) -> Optional[str]:
+        """Motivo para confirmar `verdict` (resposta do modelo pequeno) no modelo grande, ou None."""
+        if not isinstance(verdict, dict) or "action" not in verdict:
+            return INVALID
+        if self.escalate_drops and verdict.get("action") == "drop":
+            return DROP
+        try:
+            confidence = float(verdict.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if confidence < self.confidence_threshold:
+            return LOW_CONFIDENCE
+        return None
+
+    def _call(self, tier: str, messages: list, flows: int) -> str:
+        provider = self.small if tier == "small" else self.large
+        start = time.perf_counter()
+        try:
+            response = provider.chat(messages)
+        except ProviderError:
+            with self._lock:
+                self.tiers[tier].errors += 1
+            raise
+        elapsed = time.perf_counter() - start
+        self.metrics.observe(f"route_{tier}", elapsed)
+        with self._lock:
+            self.tiers[tier].record(messages, response, flows, elapsed)
+        return response
+
+    def _count(self, reasons: list, pairs: list) -> None:
+        """Registra os motivos de escalonamento e as (ação pequeno, ação grande) comparadas."""
+        with self._lock:
+            for reason in reasons:
+                self.escalations[reason] += 1
+                self.metrics.inc("router_escalations_total", reason=reason)
+            for small_action, large_action in pairs:
+                self.compared += 1
+                if small_action != large_action:
+                    self.disagreements += 1
+                    self.metrics.inc("router_disagreements_total")
+
+    def _confirm(self, messages: list, flows: int) -> Optional[dict]:
+        try:
+            return _parse_json(self._call("large", messages, flows))
+        except ProviderError as e:
+            print(f"[Roteador] Falha no modelo grande; mantendo o veredito do pequeno: {e}")
+            return None
+
+    def chat(self, messages: list) -> str:
+        batch = next((m for m in messages if m.get("content", "").startswith("[")), None)
+        flows = len(json.loads(batch["content"])) if batch is not None else 1
+        text = self._call("small", messages, flows)
+        parsed = _parse_json(text)
+
+        if parsed is None or "verdicts" not in parsed or not isinstance(parsed["verdicts"], list):
+            reason = self.escalation_reason(parsed)
+            if reason is None:
+                return text
+            confirmed = self._confirm(messages, flows)
+            if confirmed is None:
+                self._count([reason], [])
+                return text
+            pairs = [(parsed.get("action"), confirmed.get("action"))] if parsed is not None else []
+            self._count([reason], pairs)
+            return json.dumps(confirmed)
+
+        entries = parsed["verdicts"]
+        reasons = {}
+        for entry in entries:
+            reason = self.escalation_reason(entry)
+            if reason is not None and isinstance(entry, dict) and "flow_id" in entry:
+                reasons[entry["flow_id"]] = reason
+        if not reasons:
+            return text
+        confirmed = self._confirm(_restrict_batch(messages, set(reasons)), len(reasons))
+        confirmed_entries = confirmed.get("verdicts") if confirmed is not None else None
+        if not isinstance(confirmed_entries, list):
+            self._count(list(reasons.values()), [])
+            return text
+        by_id = {entry.get("flow_id"): entry for entry in confirmed_entries if isinstance(entry, dict)}
+        merged, pairs = [], []
+        for entry in entries:
+            flow_id = entry.get("flow_id") if isinstance(entry, dict) else None
+            if flow_id in reasons and flow_id in by_id:
+                pairs.append((entry.get("action"), by_id[flow_id].get("action")))
+                entry = by_id[flow_id]
+            merged.append(entry)
+        self._count(list(reasons.values()), pairs)
+        return json.dumps({"verdicts": merged})
+
+    def stream(self, messages: list) -> Iterator[str]:
+        """Lê a resposta do modelo pequeno até action e confidence; se não for preciso
+        escalonar, repassa os pedaços (os já lidos e os seguintes), senão usa o grande."""
+        if any(m.get("content", "").startswith("[") for m in messages):
+            yield self.chat(messages)
+            return
+
+        start = time.perf_counter()
+        parser = IncrementalJsonParser()
+        pieces = self.small.stream(messages)
+        received = []
+        for piece in pieces:
+            received.append(piece)
+            try:
+                parser.feed(piece)
+            except ValueError:
+                break
+            if parser.done or {"action", "confidence"} <= parser.fields.keys():
+                break
+        reason = self.escalation_reason(parser.fields if parser.error is None else None)
+
+        if reason is None:
+            yield from received
+            for piece in pieces:
+                received.append(piece)
+                yield piece
+            elapsed = time.perf_counter() - start
+            self.metrics.observe("route_small", elapsed)
+            with self._lock:
+                self.tiers["small"].record(messages, "".join(received), 1, elapsed)
+            return
+
+        with self._lock:
+            self.tiers["small"].record(messages, "".join(received), 1, time.perf_counter() - start)
+        try:
+            confirmed = self._call("large", messages, 1)
+        except ProviderError as e:
+            print(f"[Roteador] Falha no modelo grande; mantendo o veredito do pequeno: {e}")
+            self._count([reason], [])
+            yield from received
+            yield from pieces
+            return
+        pieces.close()
+        parsed = _parse_json(confirmed)
+        small_action = parser.fields.get("action") if parser.error is None else None
+        self._count([reason], [(small_action, parsed.get("action"))] if parsed is not None and small_action else [])
+        yield confirmed
+
+    def stats(self) -> dict:
+        with self._lock:
+            small_flows = self.tiers["small"].flows
+            escalated = sum(self.escalations.values())
+            return {
+                "tiers": {tier: stats.snapshot() for tier, stats in self.tiers.items()},
+                "escalations": dict(self.escalations),
+                "escalation_rate": escalated / small_flows if small_flows else 0.0,
+                "disagreements": self.disagreements,
+                "disagreement_rate": self.disagreements / self.compared if self.compared else 0.0,
+                "small": self.small.stats(),
+                "large": self.large.stats(),
+            }
@@ -0,0 +1,193 @@
+import time
+import threading
+import ipaddress
+from typing import Optional
+
+
+def simulate_p4_batch_write(table_name: str, updates: list) -> None:
+    """Aplica várias atualizações em um único WriteRequest (simulado)."""
+    print(f"[P4Runtime Simulado] WriteRequest com {len(updates)} atualizações na tabela '{table_name}':")
+    for update in updates:
+        print(f"  {update['type']} Match: {update['match']} Action: {update['action']}")
+    print("[P4Runtime Simulado] Lote aplicado com sucesso (simulado).")
+
+
+def drop_target(src_ip) -> Optional[str]:
+    """`src_ip` normalizado se for um endereço IPv4 único; None caso contrário (None, "",
+    IPv6, prefixo CIDR, texto livre da LLM...)."""
+    try:
+        return str(ipaddress.IPv4Address(str(src_ip).strip()))
+    except ValueError:
+        return None
+
+
+class AclRuleManager:
+    """Gerencia as regras de descarte da tabela `acl_lpm_table` com uma cópia-sombra.
+
+    request_drop() não escreve no switch: pedidos para IPs já cobertos por uma regra
+    instalada ou pendente apenas renovam o TTL. As escritas pendentes são agrupadas e
+    entregues por collect_updates() como um único lote (estilo WriteRequest do
+    P4Runtime), a cada `flush_interval` segundos.
+
+    A agregação é opcional (desligada com `aggregate_min_hosts=None`): quando ligada,
+    `aggregate_min_hosts` ou mais /32 bloqueados no mesmo prefixo /`aggregate_prefix_len`
+    são substituídos por uma única regra do prefixo, o que também bloqueia os hosts
+    legítimos desse prefixo. Regras sem novos pedidos por `ttl` segundos expiram e são
+    removidas. A tabela nunca passa de `max_entries`: se encher, as regras instaladas
+    mais próximas de expirar saem primeiro; inserções que ainda assim não cabem são
+    recusadas e contadas em "rejected".
+    """
+
+    def __init__(self, table_name: str = "acl_lpm_table", ttl: float = 300.0, flush_interval: float = 0.5,
+                 aggregate_prefix_len: int = 24, aggregate_min_hosts: Optional[int] = None, max_entries: int = 1024):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.aggregate_prefix_len = aggregate_prefix_len
+        self.aggregate_min_hosts = aggregate_min_hosts
+        self.max_entries = max_entries
+
+        # prefixo -> instante de expiração
+        self._installed: dict = {}
+        self._pending: dict = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        self.requests = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.inserts = 0
+        self.deletes = 0
+        self.aggregations = 0
+        self.expirations = 0
+        self.rejected = 0
+        self.write_batches = 0
+
+    def _covering_rule(self, network: ipaddress.IPv4Network) -> Optional[ipaddress.IPv4Network]:
+        """Retorna a regra (instalada ou pendente) que cobre `network`, se houver."""
+        candidates = [network]
+        if self.aggregate_min_hosts is not None:
+            candidates.append(network.supernet(new_prefix=self.aggregate_prefix_len))
+        for candidate in candidates:
+            if candidate in self._pending or candidate in self._installed:
+                return candidate
+        return None
+
+    def request_drop(self, src_ip: str, now: Optional[float] = None) -> bool:
+        """Pede o bloqueio de `src_ip`. Retorna False se já havia uma regra cobrindo-o ou
+        se `src_ip` não é um endereço IPv4 (o pedido é ignorado e contado em "invalid")."""
+        now = time.monotonic() if now is None else now
+        target = drop_target(src_ip)
+        if target is None:
+            with self._lock:
+                self.invalid += 1
+            return False
+        network = ipaddress.IPv4Network(f"{target}/32")
+        with self._lock:
+            self.requests += 1
+            covering = self._covering_rule(network)
+            if covering is not None:
+                self.duplicates += 1
+                rules = self._pending if covering in self._pending else self._installed
+                rules[covering] = now + self.ttl
+                return False
+            self._pending[network] = now + self.ttl
+            return True
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Indica se já passou `flush_interval` desde o último lote."""
+        now = time.monotonic() if now is None else now
+        return now - self._last_flush >= self.flush_interval
+
+    def collect_updates(self, now: Optional[float] = None) -> list:
+        """Consolida pendências, agregações e expirações em um lote de atualizações.
+
+        Cada atualização é {"type": "INSERT" | "DELETE", "match": {...}, "action": "_drop"}.
+        Inserções vêm antes das remoções, para que uma agregação nunca deixe o
+        tráfego passar entre a remoção dos /32 e a instalação do prefixo.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_flush = now
+            inserts = dict(self._pending)
+            self._pending.clear()
+            deletes = set()
+
+            expired = [net for net, expires_at in self._installed.items() if expires_at < now]
+            for net in expired:
+                del self._installed[net]
+                deletes.add(net)
+            self.expirations += len(expired)
+            for net in [net for net, expires_at in inserts.items() if expires_at < now]:
+                del inserts[net]
+
+            if self.aggregate_min_hosts is not None:
+                self._aggregate(inserts, deletes)
+
+            overflow = len(self._installed) + len(inserts) - self.max_entries
+            if overflow > 0:
+                # abre espaço removendo as regras instaladas mais próximas de expirar; só recusa
+                # inserções (já aceitas por request_drop) se elas sozinhas não couberem na tabela
+                for net in sorted(self._installed, key=self._installed.get)[:overflow]:
+                    del self._installed[net]
+                    deletes.add(net)
+                    overflow -= 1
+                for net in sorted(inserts, key=inserts.get)[:max(overflow, 0)]:
+                    del inserts[net]
+                    self.rejected += 1
+
+            self._installed.update(inserts)
+            self.inserts += len(inserts)
+            self.deletes += len(deletes)
+            updates = [self._update("INSERT", net) for net in inserts]
+            updates += [self._update("DELETE", net) for net in deletes]
+            if updates:
+                self.write_batches += 1
+            return updates
+
+    def _aggregate(self, inserts: dict, deletes: set) -> None:
+        """Substitui grupos de /32 (instalados ou a inserir) pelo prefixo que os cobre."""
+        groups: dict = {}
+        for rules in (self._installed, inserts):
+            for net in rules:
+                if net.prefixlen == 32:
+                    groups.setdefault(net.supernet(new_prefix=self.aggregate_prefix_len), []).append(net)
+
+        for supernet, hosts in groups.items():
+            if len(hosts) < self.aggregate_min_hosts:
+                continue
+            expires_at = 0.0
+            for net in hosts:
+                if net in inserts:
+                    expires_at = max(expires_at, inserts.pop(net))
+                else:
+                    expires_at = max(expires_at, self._installed.pop(net))
+                    deletes.add(net)
+            inserts[supernet] = expires_at
+            self.aggregations += 1
+
+    def _update(self, update_type: str, network: ipaddress.IPv4Network) -> dict:
+        return {
+            "type": update_type,
+            "match": {"hdr.ipv4.srcAddr": (str(network.network_address), network.prefixlen)},
+            "action": "_drop",
+        }
+
+    def installed_rules(self) -> list:
+        with self._lock:
+            return sorted(str(net) for net in self._installed)
+
+    def stats(self) -> dict:
+        return {
+            "occupancy": len(self._installed),
+            "pending": len(self._pending),
+            "requests": self.requests,
+            "invalid": self.invalid,
+            "duplicates_suppressed": self.duplicates,
+            "inserts": self.inserts,
+            "deletes": self.deletes,
+            "aggregations": self.aggregations,
+            "expirations": self.expirations,
+            "rejected": self.rejected,
+            "write_batches": self.write_batches,
+        }
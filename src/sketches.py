@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""Estatísticas de fluxo por origem com memória fixa (sketches), em janela deslizante.
+
+SourceSketches acompanha, para cada IP de origem, o número de fluxos e de bytes
+(count-min), o fan-out de IPs e portas de destino (HyperLogLog) e os maiores emissores
+(space-saving top-K). A janela é dividida em painéis: cada painel tem seus próprios
+sketches, os painéis que saem da janela são zerados e as consultas combinam os demais.
+A memória não depende do número de origens.
+
+Exemplo:
+  python3 src/sketches.py --flows 5000000 --batch 1024
+"""
+
+import time
+import heapq
+import argparse
+import threading
+from typing import Optional
+
+import numpy as np
+
+from flow_aggregator import ip_to_str, str_to_ip
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    """Hash de 64 bits (finalizador do SplitMix64), vetorizado (arrays uint64 dão a volta sem aviso)."""
+    z = x.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _row_hashes(keys: np.ndarray, depth: int, bits: int, seed: int) -> np.ndarray:
+    """Índices (depth, n) em [0, 2^bits) para cada chave, um hash independente por linha."""
+    rows = np.empty((depth, len(keys)), dtype=np.int64)
+    for row in range(depth):
+        rows[row] = (splitmix64(keys ^ np.uint64(seed * 0x1000193 + row * 0x9E3779B1)) >> np.uint64(64 - bits)).astype(np.int64)
+    return rows
+
+
+class CountMinSketch:
+    """Count-min com atualização conservadora: estimativas nunca abaixo do valor real."""
+
+    def __init__(self, width: int = 1 << 16, depth: int = 4, seed: int = 0, dtype=np.int64):
+        if width & (width - 1):
+            raise ValueError("width deve ser potência de 2.")
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self._bits = width.bit_length() - 1
+        self.table = np.zeros((depth, width), dtype=dtype)
+
+    def indices(self, keys: np.ndarray) -> np.ndarray:
+        return _row_hashes(keys, self.depth, self._bits, self.seed)
+
+    def add(self, keys: np.ndarray, counts: np.ndarray, rows: Optional[np.ndarray] = None) -> None:
+        """Soma `counts` às chaves `keys` (sem repetição; agregue o lote antes).
+
+        `rows` reaproveita indices(keys) já calculados por um sketch de mesmas dimensões e semente.
+        """
+        rows = self.indices(keys) if rows is None else rows
+        current = self.table[np.arange(self.depth)[:, None], rows]
+        target = current.min(axis=0) + counts
+        self.table[np.arange(self.depth)[:, None], rows] = np.maximum(current, target)
+
+    def estimate(self, keys: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        rows = self.indices(keys) if rows is None else rows
+        return self.table[np.arange(self.depth)[:, None], rows].min(axis=0)
+
+    def clear(self) -> None:
+        self.table.fill(0)
+
+
+_HLL_ALPHA = {16: 0.673, 32: 0.697, 64: 0.709}
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Estimativa de cardinalidade de registradores HLL (último eixo = registradores)."""
+    m = registers.shape[-1]
+    alpha = _HLL_ALPHA.get(m, 0.7213 / (1 + 1.079 / m))
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    return np.where(small, m * np.log(m / np.maximum(zeros, 1)), raw)
+
+
+class HyperLogLogArray:
+    """Conjunto fixo de `slots` HyperLogLogs com `registers` registradores cada.
+
+    Cada chave (origem) é mapeada para um slot por linha (`depth` linhas); origens que
+    colidem num slot somam seus elementos, e a estimativa usa a linha com menor valor.
+    """
+
+    def __init__(self, slots: int = 1 << 14, registers: int = 32, depth: int = 2, seed: int = 0):
+        if slots & (slots - 1) or registers & (registers - 1):
+            raise ValueError("slots e registers devem ser potências de 2.")
+        self.slots = slots
+        self.registers = registers
+        self.depth = depth
+        self.seed = seed
+        self._slot_bits = slots.bit_length() - 1
+        self._register_bits = registers.bit_length() - 1
+        self.table = np.zeros((depth, slots, registers), dtype=np.uint8)
+
+    def slot_indices(self, keys: np.ndarray) -> np.ndarray:
+        return _row_hashes(keys, self.depth, self._slot_bits, self.seed + 7919)
+
+    def add(self, keys: np.ndarray, elements: np.ndarray) -> None:
+        """Adiciona `elements[i]` ao conjunto da chave `keys[i]`."""
+        h = splitmix64(elements ^ np.uint64(self.seed))
+        register = (h & np.uint64(self.registers - 1)).astype(np.int64)
+        rest = h >> np.uint64(self._register_bits)
+        width = 64 - self._register_bits
+        # posição do primeiro bit 1 (contando do mais significativo) nos bits restantes
+        rank = np.where(rest > 0, width - np.floor(np.log2(np.maximum(rest, 1).astype(np.float64))), width + 1)
+        rank = rank.astype(np.uint8)
+        slots = self.slot_indices(keys)
+        for row in range(self.depth):
+            np.maximum.at(self.table[row], (slots[row], register), rank)
+
+    def clear(self) -> None:
+        self.table.fill(0)
+
+
+class SpaceSaving:
+    """Top-K aproximado (space-saving): no máximo `capacity` contadores.
+
+    Uma chave nova, com a tabela cheia, herda o contador mínimo (+ seu peso); o menor
+    contador é achado por um heap com entradas desatualizadas descartadas na retirada.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts: dict = {}
+        self.errors: dict = {}  # superestimação máxima de cada contador
+        self._heap: list = []
+
+    def add(self, key, count: int = 1) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            while True:
+                minimum, victim = heapq.heappop(self._heap)
+                if counts.get(victim) == minimum:
+                    break
+            del counts[victim]
+            del self.errors[victim]
+            counts[key] = minimum + count
+            self.errors[key] = minimum
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(value, k) for k, value in counts.items()]
+            heapq.heapify(self._heap)
+
+    def clear(self) -> None:
+        self.counts.clear()
+        self.errors.clear()
+        self._heap.clear()
+
+
+class SourceSketches:
+    """Contexto comportamental por origem em uma janela deslizante de `window` s.
+
+    annotate(flows) atualiza os sketches com o lote e anexa a cada fluxo
+    `source_stats`: fluxos e bytes da origem na janela, IPs e portas de destino
+    distintos e, se a origem estiver entre os `top_k` maiores emissores, sua posição.
+
+    As estimativas de fan-out descontam a contaminação média de um slot HLL por outras
+    origens e nunca passam do número de fluxos da origem. A contaminação e o ranking
+    dos maiores emissores são recalculados a cada `noise_refresh` s. O ranking usa o
+    limite inferior garantido dos contadores space-saving (16 * `top_k` por painel).
+    """
+
+    def __init__(self, window: float = 60.0, panes: int = 6, cms_width: int = 1 << 16, cms_depth: int = 4,
+                 hll_slots: int = 1 << 14, hll_registers: int = 32, hll_depth: int = 2, top_k: int = 64,
+                 noise_refresh: float = 1.0, seed: int = 0):
+        self.window = window
+        self.panes = panes
+        self.pane_length = window / panes
+        self.top_k = top_k
+        self.noise_refresh = noise_refresh
+
+        self._flows = [CountMinSketch(cms_width, cms_depth, seed, dtype=np.int32) for _ in range(panes)]
+        self._bytes = [CountMinSketch(cms_width, cms_depth, seed) for _ in range(panes)]
+        self._dst_ips = [HyperLogLogArray(hll_slots, hll_registers, hll_depth, seed) for _ in range(panes)]
+        self._dst_ports = [HyperLogLogArray(hll_slots, hll_registers, hll_depth, seed + 1) for _ in range(panes)]
+        self._talkers = [SpaceSaving(top_k * 16) for _ in range(panes)]
+        self._pane_number: Optional[int] = None
+        self._noise = {"dst_ips": np.zeros(hll_depth), "dst_ports": np.zeros(hll_depth)}
+        self._ranks: dict = {}
+        self._refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+
+        self.flows_seen = 0
+
+    def _rotate(self, now: float) -> int:
+        """Zera os painéis que saíram da janela; retorna o índice do painel atual."""
+        number = int(now // self.pane_length)
+        if self._pane_number is None:
+            self._pane_number = number
+        for expired in range(self._pane_number + 1, min(number, self._pane_number + self.panes) + 1):
+            index = expired % self.panes
+            for sketch in (self._flows[index], self._bytes[index], self._dst_ips[index],
+                           self._dst_ports[index], self._talkers[index]):
+                sketch.clear()
+        self._pane_number = max(self._pane_number, number)
+        return self._pane_number % self.panes
+
+    def _merged_registers(self, sketches: list, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Registradores HLL combinados (máximo) de todos os painéis."""
+        depth = np.arange(sketches[0].depth)[:, None]
+        merged = None
+        for sketch in sketches:
+            registers = sketch.table if rows is None else sketch.table[depth, rows]
+            merged = registers if merged is None else np.maximum(merged, registers)
+        return merged
+
+    def _fanout(self, name: str, sketches: list, keys: np.ndarray) -> np.ndarray:
+        rows = sketches[0].slot_indices(keys)
+        estimates = hll_estimate(self._merged_registers(sketches, rows))  # (depth, n)
+        corrected = estimates - self._noise[name][:, None]
+        return np.maximum(np.rint(corrected.min(axis=0)), 1).astype(np.int64)
+
+    def _refresh(self, now: float) -> None:
+        if 0 <= now - self._refreshed_at < self.noise_refresh:
+            return
+        self._refreshed_at = now
+        for name, sketches in (("dst_ips", self._dst_ips), ("dst_ports", self._dst_ports)):
+            self._noise[name] = hll_estimate(self._merged_registers(sketches)).mean(axis=1)
+        self._ranks = {source: rank for rank, (source, _) in enumerate(self._top_talkers(self.top_k), 1)}
+
+    def annotate(self, flows: list, now: Optional[float] = None) -> list:
+        """Atualiza os sketches com `flows` e anexa `source_stats` a cada fluxo."""
+        if not flows:
+            return flows
+        now = time.monotonic() if now is None else now
+        n = len(flows)
+        src = np.fromiter((str_to_ip(f.get("src_ip", "0.0.0.0")) for f in flows), dtype=np.uint64, count=n)
+        dst = np.fromiter((str_to_ip(f.get("dst_ip", "0.0.0.0")) for f in flows), dtype=np.uint64, count=n)
+        ports = np.fromiter((f.get("dst_port", 0) for f in flows), dtype=np.uint64, count=n)
+        byte_counts = np.fromiter((f.get("byte_count", 0) for f in flows), dtype=np.int64, count=n)
+
+        sources, inverse, flow_counts = np.unique(src, return_inverse=True, return_counts=True)
+        source_bytes = np.bincount(inverse, weights=byte_counts, minlength=len(sources)).astype(np.int64)
+
+        with self._lock:
+            pane = self._rotate(now)
+            # todos os count-min têm as mesmas dimensões e semente: os índices são calculados uma vez
+            rows = self._flows[pane].indices(sources)
+            self._flows[pane].add(sources, flow_counts, rows)
+            self._bytes[pane].add(sources, source_bytes, rows)
+            self._dst_ips[pane].add(src, (src << np.uint64(32)) | dst)
+            self._dst_ports[pane].add(src, (src << np.uint64(16)) | ports)
+            talkers = self._talkers[pane]
+            for source, count in zip(sources.tolist(), flow_counts.tolist()):
+                talkers.add(source, count)
+            self._refresh(now)
+
+            total_flows = sum(cms.estimate(sources, rows) for cms in self._flows)
+            total_bytes = sum(cms.estimate(sources, rows) for cms in self._bytes)
+            dst_ips = np.minimum(self._fanout("dst_ips", self._dst_ips, sources), total_flows)
+            dst_ports = np.minimum(self._fanout("dst_ports", self._dst_ports, sources), total_flows)
+            ranks = self._ranks
+            self.flows_seen += n
+
+        summaries = []
+        for i, source in enumerate(sources.tolist()):
+            summary = {
+                "flows": int(total_flows[i]),
+                "bytes": int(total_bytes[i]),
+                "distinct_dst_ips": int(dst_ips[i]),
+                "distinct_dst_ports": int(dst_ports[i]),
+            }
+            if source in ranks:
+                summary["top_talker_rank"] = ranks[source]
+            summaries.append(summary)
+        for flow_data, index in zip(flows, inverse.tolist()):
+            flow_data["source_stats"] = summaries[index]
+        return flows
+
+    def _top_talkers(self, n: int) -> list:
+        merged: dict = {}
+        for talkers in self._talkers:
+            for source, count in talkers.counts.items():
+                merged[source] = merged.get(source, 0) + count - talkers.errors[source]
+        return heapq.nlargest(n, merged.items(), key=lambda item: item[1])
+
+    def top_talkers(self, n: int = 10) -> list:
+        """Os `n` maiores emissores da janela: [(src_ip, mínimo garantido de fluxos), ...]."""
+        with self._lock:
+            return [(ip_to_str(source), count) for source, count in self._top_talkers(n)]
+
+    def memory_bytes(self) -> int:
+        tables = sum(s.table.nbytes for group in (self._flows, self._bytes, self._dst_ips, self._dst_ports)
+                     for s in group)
+        return tables + sum(len(t.counts) for t in self._talkers) * 3 * 8
+
+    def stats(self) -> dict:
+        return {
+            "flows": self.flows_seen,
+            "memory_bytes": self.memory_bytes(),
+            "top_talkers": self.top_talkers(5),
+        }
+
+
+def main():
+    from traffic_generator import SCENARIOS, TrafficGenerator, records_to_flows
+
+    parser = argparse.ArgumentParser(description="Vazão e precisão dos sketches por origem")
+    parser.add_argument('--flows', type=int, default=2_000_000, help='Número de fluxos sintéticos')
+    parser.add_argument('--batch', type=int, default=1024, help='Fluxos por chamada a annotate()')
+    parser.add_argument('--seed', type=int, default=0, help='Semente do gerador de tráfego')
+    args = parser.parse_args()
+
+    sketches = SourceSketches()
+    generator = TrafficGenerator(seed=args.seed, chunk_size=args.batch)
+    exact: dict = {}  # origem -> (set de destinos, set de portas), só para os atacantes
+    start = time.perf_counter()
+    annotate_time = 0.0
+    last = {}
+    processed = 0
+    for chunk in generator.chunks(args.flows):
+        flows = list(records_to_flows(chunk))
+        t0 = time.perf_counter()
+        # relógio simulado dentro do primeiro painel: a janela cobre o corpus inteiro
+        sketches.annotate(flows, now=sketches.pane_length * 0.99 * processed / args.flows)
+        processed += len(flows)
+        annotate_time += time.perf_counter() - t0
+        for flow_data, scenario in zip(flows, chunk["scenario"].tolist()):
+            if SCENARIOS[scenario] != "benign":
+                state = exact.setdefault(flow_data["src_ip"], (set(), set()))
+                state[0].add(flow_data["dst_ip"])
+                state[1].add(flow_data["dst_port"])
+                last[flow_data["src_ip"]] = flow_data["source_stats"]
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.flows} fluxos; annotate(): {args.flows / annotate_time:,.0f} fluxos/s "
+          f"({args.flows / annotate_time * 60 / 1e6:.1f} M/min); total {elapsed:.1f}s; "
+          f"memória {sketches.memory_bytes() / 2 ** 20:.1f} MiB")
+    print("origem             IPs dst (real/estim.)  portas dst (real/estim.)")
+    for source, (dsts, ports) in sorted(exact.items(), key=lambda item: -len(item[1][0]))[:10]:
+        stats = last[source]
+        print(f"{source:<18} {len(dsts):>8} / {stats['distinct_dst_ips']:<8}   {len(ports):>8} / {stats['distinct_dst_ports']}")
+    print("maiores emissores:", sketches.top_talkers(5))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Benchmark de partida do controlador: tempo até ficar pronto e até o primeiro veredito.
+
+Inicia `controller.py` como subprocesso (como o MininetSimulator) contra um servidor
+LLM local (stub) com API Ollama, em que o primeiro pedido a cada modelo demora
+`--load-ms` a mais (carga do modelo). Cada rodada usa um servidor novo, com o modelo
+frio. Compara o modo "cold" (CONTROLLER_WARMUP=0: o primeiro fluxo paga a carga do
+modelo) com o "warm" (aquecimento em segundo plano antes do sinal de prontidão).
+
+Medidas por rodada, a partir do início do processo:
+  - ready_s: arquivo de prontidão (CONTROLLER_READY_FILE) criado;
+  - first_verdict_s: primeiro fluxo analisado;
+  - first_llm_verdict_s: primeira resposta da LLM;
+  - first_llm_call_s: duração da primeira chamada à LLM.
+
+Exemplo:
+  python3 src/startup_benchmark.py --runs 3 --load-ms 3000 --latency-ms 200
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+
+from mock_llm_server import MockLLMServer
+
+
+CONTROLLER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "controller.py")
+
+# linhas do log do Controller que marcam cada etapa (com CONTROLLER_CONSOLE=1)
+MARKERS = {
+    "first_verdict_s": " analisado: ",
+    "llm_request_s": "[LLM] Enviando",
+    "first_llm_verdict_s": "[LLM] Resposta",
+}
+
+
+def measure_import() -> float:
+    """Tempo de `import controller` em um interpretador novo (s)."""
+    code = "import time; t = time.perf_counter(); import controller; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(CONTROLLER_PATH),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def run_once(warmup: bool, latency_ms: float, load_ms: float, timeout: float) -> dict:
+    fd, ready_file = tempfile.mkstemp(prefix="controller-ready-")
+    os.close(fd)
+    os.remove(ready_file)
+    times: dict = {}
+
+    with MockLLMServer(latency_ms=latency_ms, load_ms=load_ms) as server:
+        env = dict(os.environ, OLLAMA_HOST=server.ollama_host, LLM_MODEL="stub", CONTROLLER_READY_FILE=ready_file,
+                   CONTROLLER_WARMUP="1" if warmup else "0", CONTROLLER_CONSOLE="1",
+                   PYTHONUNBUFFERED="1")
+        env.pop("VERDICT_CACHE_PATH", None)
+        env.pop("CASE_MEMORY_PATH", None)
+        start = time.monotonic()
+        process = subprocess.Popen([sys.executable, CONTROLLER_PATH], env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True)
+        done = threading.Event()
+
+        def read_output() -> None:
+            for line in process.stdout:
+                now = time.monotonic() - start
+                for name, marker in MARKERS.items():
+                    if marker in line and name not in times:
+                        times[name] = now
+                if "first_verdict_s" in times and "first_llm_verdict_s" in times:
+                    done.set()
+            done.set()
+
+        reader = threading.Thread(target=read_output, daemon=True)
+        reader.start()
+        deadline = start + timeout
+        while "ready_s" not in times and time.monotonic() < deadline and process.poll() is None:
+            if os.path.exists(ready_file):
+                times["ready_s"] = time.monotonic() - start
+            time.sleep(0.01)
+        done.wait(max(deadline - time.monotonic(), 0))
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        reader.join(timeout=5)
+
+    if os.path.exists(ready_file):
+        os.remove(ready_file)
+    if "llm_request_s" in times and "first_llm_verdict_s" in times:
+        times["first_llm_call_s"] = times["first_llm_verdict_s"] - times["llm_request_s"]
+    times.pop("llm_request_s", None)
+    return times
+
+
+def summarize(runs: list) -> dict:
+    names = ("ready_s", "first_verdict_s", "first_llm_verdict_s", "first_llm_call_s")
+    summary: dict = {"runs": len(runs)}
+    for name in names:
+        values = [run[name] for run in runs if name in run]
+        summary[name] = statistics.median(values) if values else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de partida (tempo até o primeiro veredito) do Controller")
+    parser.add_argument('--runs', type=int, default=3, help='Rodadas por modo')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Latência média do stub (ms)')
+    parser.add_argument('--load-ms', type=float, default=3000.0, help='Tempo de carga do modelo no primeiro pedido (ms)')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Tempo máximo de cada rodada (s)')
+    parser.add_argument('--output', type=str, default=None, help='Arquivo JSON de saída (padrão: stdout)')
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "import_s": measure_import()}
+    for mode, warmup in (("cold", False), ("warm", True)):
+        runs = [run_once(warmup, args.latency_ms, args.load_ms, args.timeout) for _ in range(args.runs)]
+        report[mode] = summarize(runs)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            file.write(text + "\n")
+        print(f"Relatório gravado em {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
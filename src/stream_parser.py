@@ -0,0 +1,129 @@
+import json
+from typing import Optional
+
+
+class IncrementalJsonParser:
+    """Parser incremental do objeto JSON de uma resposta da LLM recebida em pedaços.
+
+    feed() recebe cada pedaço do texto e retorna os campos de primeiro nível que se
+    completaram nele, permitindo decidir pelos campos curtos (anomaly_detected, action,
+    target_ip) antes de a descrição terminar. Texto antes da primeira "{" (como cercas
+    ```json) e depois da "}" final é ignorado. Valores aninhados são entregues inteiros.
+
+    Um JSON malformado gera ValueError (guardado em `error`); os pedaços seguintes só
+    são acumulados em `text`, que mantém tudo o que foi recebido.
+    """
+
+    def __init__(self):
+        self.fields: dict = {}
+        self.done = False
+        self.error: Optional[ValueError] = None
+        self._text: list = []
+        self._buffer = ""
+        self._pos = 0
+        self._state = "start"
+        self._start = 0       # início do token atual em _buffer
+        self._key: Optional[str] = None
+        self._depth = 0       # profundidade dentro de um valor aninhado
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._text)
+
+    def feed(self, chunk: str) -> dict:
+        """Processa `chunk` e retorna os campos completados por ele."""
+        self._text.append(chunk)
+        if self.done or self.error is not None:
+            return {}
+        self._buffer += chunk
+        try:
+            return self._parse()
+        except ValueError as e:
+            self.error = e
+            raise
+
+    def _parse(self) -> dict:
+        new_fields = {}
+        buffer = self._buffer
+        pos = self._pos
+
+        while pos < len(buffer) and not self.done:
+            c = buffer[pos]
+            state = self._state
+
+            if state == "start":
+                if c == "{":
+                    self._state = "key"
+            elif state == "key":
+                if c == '"':
+                    self._start = pos
+                    self._state = "key_string"
+                elif c == "}":
+                    self.done = True
+                elif c not in " \t\r\n,":
+                    raise ValueError(f"Caractere inesperado antes de uma chave: {c!r}")
+            elif state in ("key_string", "string_value"):
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    token = json.loads(buffer[self._start:pos + 1])
+                    if state == "key_string":
+                        self._key = token
+                        self._state = "colon"
+                    else:
+                        new_fields[self._key] = token
+                        self._state = "key"
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value"
+                elif c not in " \t\r\n":
+                    raise ValueError(f"Esperado ':' após a chave {self._key!r}")
+            elif state == "value":
+                if c in " \t\r\n":
+                    pass
+                elif c == '"':
+                    self._start = pos
+                    self._state = "string_value"
+                elif c in "{[":
+                    self._start = pos
+                    self._depth = 1
+                    self._state = "nested"
+                else:
+                    self._start = pos
+                    self._state = "literal"
+            elif state == "literal":
+                if c in ",} \t\r\n":
+                    new_fields[self._key] = json.loads(buffer[self._start:pos])
+                    self._state = "key"
+                    if c == "}":
+                        self.done = True
+            elif state == "nested":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                elif c == '"':
+                    self._in_string = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        new_fields[self._key] = json.loads(buffer[self._start:pos + 1])
+                        self._state = "key"
+            pos += 1
+
+        # descarta o que já foi consumido, exceto o token em andamento
+        keep = self._start if self._state in ("key_string", "string_value", "literal", "nested") else pos
+        self._buffer = buffer[keep:]
+        self._start -= keep
+        self._pos = pos - keep
+        self.fields.update(new_fields)
+        return new_fields
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""Gerador vetorizado de tráfego sintético (registros de fluxo) com cenários de ataque.
+
+Cada registro traz a 5-tupla, packet_count e byte_count no formato do Controller e um
+rótulo de cenário; expected_response() converte o rótulo no formato de
+`expected_llm_response` de test_flows.json.
+
+A geração é feita em blocos com NumPy a partir de uma semente: a mesma semente, mistura
+e tamanho de bloco produzem exatamente os mesmos registros.
+
+Exemplos:
+  python3 src/traffic_generator.py --count 10000000 --output flows.npy
+  python3 src/traffic_generator.py --count 1000000 --mix benign=0.8,syn_flood=0.1,horizontal_scan=0.1
+"""
+
+import time
+import argparse
+from typing import Iterator, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from flow_aggregator import ip_to_str
+
+
+SCENARIOS = ("benign", "syn_flood", "horizontal_scan", "vertical_scan", "dns_amplification", "exfiltration")
+
+DEFAULT_MIX = {
+    "benign": 0.90,
+    "syn_flood": 0.04,
+    "horizontal_scan": 0.02,
+    "vertical_scan": 0.02,
+    "dns_amplification": 0.01,
+    "exfiltration": 0.01,
+}
+
+DESCRIPTIONS = {
+    "benign": "Nenhuma anomalia detectada.",
+    "syn_flood": "Grande volume de conexões TCP curtas para o mesmo destino, possível SYN flood.",
+    "horizontal_scan": "Mesma porta sondada em muitos destinos, possível varredura horizontal.",
+    "vertical_scan": "Muitas portas sondadas no mesmo destino, possível varredura vertical.",
+    "dns_amplification": "Respostas DNS grandes e não solicitadas, possível amplificação DNS.",
+    "exfiltration": "Transferência contínua de dados para fora da rede, possível exfiltração.",
+}
+
+FLOW_DTYPE = np.dtype([
+    ("flow_id", np.uint64),
+    ("src_ip", np.uint32),
+    ("dst_ip", np.uint32),
+    ("src_port", np.uint16),
+    ("dst_port", np.uint16),
+    ("protocol", np.uint8),
+    ("packet_count", np.uint32),
+    ("byte_count", np.uint64),
+    ("scenario", np.uint8),  # índice em SCENARIOS
+])
+
+INTERNAL_NET = 0x0A000000   # 10.0.0.0/16: hosts da rede monitorada
+EXTERNAL_NET = 0xCB007100   # 203.0.113.0/24: hosts externos
+COMMON_PORTS = np.array([80, 443, 22, 53, 8080, 25], dtype=np.uint16)
+COMMON_PORT_WEIGHTS = np.array([0.35, 0.4, 0.05, 0.1, 0.08, 0.02])
+
+
+class TrafficGenerator:
+    """Gera registros de fluxo com uma mistura configurável de cenários.
+
+    `mix` mapeia nome de cenário -> fração (normalizada). Os atacantes de cada cenário
+    vêm de pools pequenos e fixos por semente, para que o comportamento por origem
+    (fan-out, volume) seja visível ao controlador.
+    """
+
+    def __init__(self, seed: int = 0, mix: Optional[dict] = None, chunk_size: int = 1_000_000):
+        mix = dict(DEFAULT_MIX if mix is None else mix)
+        unknown = set(mix) - set(SCENARIOS)
+        if unknown:
+            raise ValueError(f"Cenários desconhecidos: {sorted(unknown)}")
+        weights = np.array([mix.get(name, 0.0) for name in SCENARIOS], dtype=np.float64)
+        if weights.sum() <= 0:
+            raise ValueError("A mistura de cenários deve ter alguma fração positiva.")
+        self.probabilities = weights / weights.sum()
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._next_flow_id = 1
+
+        pools = np.random.default_rng([seed, 1])
+        self._attackers = INTERNAL_NET + pools.integers(256, 65535, 8, dtype=np.uint32)
+        self._scanners = INTERNAL_NET + pools.integers(256, 65535, 4, dtype=np.uint32)
+        self._victims = INTERNAL_NET + pools.integers(256, 65535, 4, dtype=np.uint32)
+        self._resolvers = EXTERNAL_NET + pools.integers(1, 255, 16, dtype=np.uint32)
+        self._exfiltrators = INTERNAL_NET + pools.integers(256, 65535, 2, dtype=np.uint32)
+
+    def generate(self, count: int) -> np.ndarray:
+        """Gera os próximos `count` registros (array FLOW_DTYPE)."""
+        rng = self._rng
+        records = np.zeros(count, dtype=FLOW_DTYPE)
+        records["flow_id"] = np.arange(self._next_flow_id, self._next_flow_id + count, dtype=np.uint64)
+        self._next_flow_id += count
+
+        scenario = rng.choice(len(SCENARIOS), size=count, p=self.probabilities).astype(np.uint8)
+        records["scenario"] = scenario
+        records["src_port"] = rng.integers(1024, 65536, count, dtype=np.uint16)
+        records["protocol"] = 6
+
+        for index, name in enumerate(SCENARIOS):
+            mask = scenario == index
+            n = int(mask.sum())
+            if n:
+                records[mask] = getattr(self, f"_{name}")(records[mask], n, rng)
+        return records
+
+    def _benign(self, r: np.ndarray, n: int, rng) -> np.ndarray:
+        r["src_ip"] = INTERNAL_NET + rng.integers(2, 65535, n, dtype=np.uint32)
+        r["dst_ip"] = INTERNAL_NET + rng.integers(2, 65535, n, dtype=np.uint32)
+        r["dst_port"] = rng.choice(COMMON_PORTS, n, p=COMMON_PORT_WEIGHTS)
+        r["protocol"] = np.where(r["dst_port"] == 53, 17, 6)
+        r["packet_count"] = np.minimum(rng.geometric(0.45, n), 5)
+        r["byte_count"] = r["packet_count"] * rng.integers(64, 1501, n)
+        return r
+
+    def _syn_flood(self, r: np.ndarray, n: int, rng) -> np.ndarray:
+        r["src_ip"] = rng.choice(self._attackers, n)
+        r["dst_ip"] = rng.choice(self._victims, n)
+        r["dst_port"] = rng.choice(np.array([80, 443], dtype=np.uint16), n)
+        r["packet_count"] = rng.integers(6, 40, n)
+        r["byte_count"] = r["packet_count"].astype(np.uint64) * 60
+        return r
+
+    def _horizontal_scan(self, r: np.ndarray, n: int, rng) -> np.ndarray:
+        r["src_ip"] = rng.choice(self._scanners, n)
+        r["dst_ip"] = INTERNAL_NET + rng.integers(2, 65535, n, dtype=np.uint32)
+        r["dst_port"] = rng.choice(np.array([22, 23, 3389, 445], dtype=np.uint16), n)
+        r["packet_count"] = rng.integers(1, 3, n)
+        r["byte_count"] = r["packet_count"].astype(np.uint64) * 60
+        return r
+
+    def _vertical_scan(self, r: np.ndarray, n: int, rng) -> np.ndarray:
+        r["src_ip"] = rng.choice(self._scanners, n)
+        r["dst_ip"] = rng.choice(self._victims, n)
+        r["dst_port"] = rng.integers(1, 1025, n, dtype=np.uint16)
+        r["packet_count"] = 1
+        r["byte_count"] = 60
+        return r
+
+    def _dns_amplification(self, r: np.ndarray, n: int, rng) -> np.ndarray:
+        r["src_ip"] = rng.choice(self._resolvers, n)
+        r["dst_ip"] = rng.choice(self._victims, n)
+        r["src_port"] = 53
+        r["dst_port"] = rng.integers(1024, 65536, n, dtype=np.uint16)
+        r["protocol"] = 17
+        r["packet_count"] = rng.integers(10, 60, n)
+        r["byte_count"] = r["packet_count"].astype(np.uint64) * rng.integers(1200, 1501, n)
+        return r
+
+    def _exfiltration(self, r: np.ndarray, n: int, rng) -> np.ndarray:
+        r["src_ip"] = rng.choice(self._exfiltrators, n)
+        r["dst_ip"] = EXTERNAL_NET + rng.integers(1, 255, n, dtype=np.uint32)
+        r["dst_port"] = rng.choice(np.array([443, 53], dtype=np.uint16), n)
+        r["protocol"] = np.where(r["dst_port"] == 53, 17, 6)
+        r["packet_count"] = rng.integers(6, 30, n)
+        r["byte_count"] = r["packet_count"].astype(np.uint64) * rng.integers(1000, 1501, n)
+        return r
+
+    def chunks(self, count: int) -> Iterator[np.ndarray]:
+        """Gera `count` registros em blocos de até `chunk_size`."""
+        remaining = count
+        while remaining > 0:
+            n = min(self.chunk_size, remaining)
+            yield self.generate(n)
+            remaining -= n
+
+    def write(self, path: str, count: int) -> None:
+        """Grava `count` registros em um arquivo .npy (colunar, leitura com np.load(mmap_mode='r'))."""
+        out = open_memmap(path, mode="w+", dtype=FLOW_DTYPE, shape=(count,))
+        offset = 0
+        for chunk in self.chunks(count):
+            out[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        out.flush()
+        del out
+
+    def flows(self, count: Optional[int] = None) -> Iterator[dict]:
+        """Fluxos no formato de dict do Controller, para uso como `flow_source`.
+
+        Com count=None, gera indefinidamente.
+        """
+        remaining = count
+        while remaining is None or remaining > 0:
+            n = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            yield from records_to_flows(self.generate(n))
+            if remaining is not None:
+                remaining -= n
+
+
+def records_to_flows(records: np.ndarray) -> Iterator[dict]:
+    """Converte registros FLOW_DTYPE em dicts de fluxo (sem o rótulo)."""
+    for flow_id, src_ip, dst_ip, src_port, dst_port, protocol, packet_count, byte_count, _ in records.tolist():
+        yield {
+            "flow_id": flow_id,
+            "src_ip": ip_to_str(src_ip),
+            "dst_ip": ip_to_str(dst_ip),
+            "src_port": src_port,
+            "dst_port": dst_port,
+            "protocol": protocol,
+            "packet_count": packet_count,
+            "byte_count": byte_count,
+        }
+
+
+def expected_response(record) -> dict:
+    """Resposta esperada da LLM para um registro, no formato de expected_llm_response."""
+    name = SCENARIOS[int(record["scenario"])]
+    if name == "benign":
+        return {"anomaly_detected": False, "description": DESCRIPTIONS[name], "action": "none"}
+    return {"anomaly_detected": True, "description": DESCRIPTIONS[name], "action": "drop",
+            "target_ip": ip_to_str(int(record["src_ip"]))}
+
+
+def parse_mix(text: str) -> dict:
+    """Converte "benign=0.9,syn_flood=0.1" em dict."""
+    mix = {}
+    for item in text.split(","):
+        name, fraction = item.split("=")
+        mix[name.strip()] = float(fraction)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de tráfego sintético com cenários de ataque")
+    parser.add_argument('--count', type=int, default=10_000_000, help='Número de registros de fluxo')
+    parser.add_argument('--seed', type=int, default=0, help='Semente (execuções com a mesma semente são idênticas)')
+    parser.add_argument('--mix', type=str, default=None, help='Mistura de cenários, ex.: benign=0.9,syn_flood=0.1')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='Registros por bloco')
+    parser.add_argument('--output', type=str, default=None, help='Arquivo .npy de saída (omitido = só mede a geração)')
+    args = parser.parse_args()
+
+    generator = TrafficGenerator(seed=args.seed, mix=parse_mix(args.mix) if args.mix else None,
+                                 chunk_size=args.chunk_size)
+    start = time.perf_counter()
+    if args.output:
+        generator.write(args.output, args.count)
+    else:
+        counts = np.zeros(len(SCENARIOS), dtype=np.int64)
+        for chunk in generator.chunks(args.count):
+            counts += np.bincount(chunk["scenario"], minlength=len(SCENARIOS))
+        print(dict(zip(SCENARIOS, counts.tolist())))
+    elapsed = time.perf_counter() - start
+    print(f"{args.count} registros em {elapsed:.2f}s ({args.count / elapsed:,.0f} registros/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+# Campos que identificam o comportamento do fluxo. flow_id, src_port (porta efêmera) e
+# dst_ip ficam de fora para que fluxos repetidos da mesma origem ao mesmo serviço
+# compartilhem o veredito.
+DEFAULT_KEY_FIELDS = ("src_ip", "dst_port", "protocol")
+# Contadores agrupados em faixas logarítmicas (1, 2-3, 4-7, 8-15, ...)
+DEFAULT_BUCKETED_FIELDS = ("packet_count", "byte_count")
+# Contadores de "source_stats" (SourceSketches), também em faixas: quando a origem
+# passa a uma faixa nova (varredura ou inundação crescendo), o veredito é refeito
+DEFAULT_SOURCE_FIELDS = ("flows", "distinct_dst_ips", "distinct_dst_ports")
+
+
+class VerdictCache:
+    """Cache de vereditos da LLM indexado por uma normalização do fluxo.
+
+    A chave é montada a partir de `key_fields` (valores exatos) e `bucketed_fields`
+    (contadores agrupados em potências de 2), mais os campos `source_fields` de
+    "source_stats", agrupados da mesma forma, quando o fluxo os tiver. Para outra
+    normalização, passe `key_fn`.
+
+    As entradas expiram após `ttl` segundos e, ao passar de `max_entries`, as menos
+    usadas recentemente são descartadas (LRU). Se `persist_path` for informado, o cache
+    é carregado desse arquivo na criação e salvo em save() (e a cada `autosave_every`
+    inserções), para que um controlador reiniciado já comece aquecido.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0,
+                 key_fields: tuple = DEFAULT_KEY_FIELDS, bucketed_fields: tuple = DEFAULT_BUCKETED_FIELDS,
+                 source_fields: tuple = DEFAULT_SOURCE_FIELDS, key_fn: Optional[Callable[[dict], str]] = None,
+                 persist_path: Optional[str] = None, autosave_every: int = 100):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.key_fields = key_fields
+        self.bucketed_fields = bucketed_fields
+        self.source_fields = source_fields
+        self.key_fn = key_fn
+        self.persist_path = persist_path
+        self.autosave_every = autosave_every
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()  # chave -> (expira_em, veredito)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # um save() por vez (o .tmp é compartilhado)
+        self._unsaved = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load()
+
+    def key(self, flow_data: dict) -> str:
+        """Retorna a chave normalizada de `flow_data`."""
+        if self.key_fn is not None:
+            return self.key_fn(flow_data)
+        parts = [str(flow_data.get(field)) for field in self.key_fields]
+        for field in self.bucketed_fields:
+            value = flow_data.get(field)
+            parts.append(str(int(value).bit_length()) if value is not None else "None")
+        source_stats = flow_data.get("source_stats")
+        if source_stats:
+            for field in self.source_fields:
+                parts.append(str(int(source_stats.get(field, 0)).bit_length()))
+        return "|".join(parts)
+
+    def get(self, flow_data: dict) -> Optional[dict]:
+        """Retorna uma cópia do veredito em cache para o fluxo, ou None."""
+        key = self.key(flow_data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, verdict = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(verdict)
+
+    def put(self, flow_data: dict, verdict: dict) -> None:
+        """Guarda o veredito normalizado ({'action': ..., 'src_ip': ...}) do fluxo."""
+        key = self.key(flow_data)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, dict(verdict))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+            autosave = self.persist_path is not None and self._unsaved >= self.autosave_every
+
+        # com outra thread já gravando, esta inserção entra no próximo save()
+        if autosave and self._save_lock.acquire(blocking=False):
+            try:
+                self._save()
+            except OSError as e:
+                print(f"[Cache] Não foi possível salvar o cache de vereditos: {e}")
+            finally:
+                self._save_lock.release()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def save(self) -> None:
+        """Grava as entradas válidas em `persist_path` (escrita atômica)."""
+        if self.persist_path is None:
+            return
+        with self._save_lock:
+            self._save()
+
+    def _save(self) -> None:
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires_at, verdict] for key, (expires_at, verdict) in self._entries.items() if expires_at >= now]
+            self._unsaved = 0
+
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as file:
+            json.dump({"entries": entries}, file)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self) -> None:
+        """Carrega as entradas ainda válidas de `persist_path`."""
+        try:
+            with open(self.persist_path, encoding="utf8") as file:
+                entries = json.load(file)["entries"]
+        except (OSError, json.JSONDecodeError, KeyError) as e:
+            print(f"[Cache] Não foi possível carregar o cache de vereditos: {e}")
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, expires_at, verdict in entries:
+                if expires_at >= now:
+                    self._entries[key] = (expires_at, verdict)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        print(f"[Cache] {len(self._entries)} vereditos carregados de {self.persist_path}.")